@@ -1,39 +1,107 @@
 import os
 import json
+import hashlib
+import threading
 from pathlib import Path
 
-import requests
+import numpy as np
 
- 
+from embedder import embed_text
+from llm_cache import generation_key, state_bucket
+from llm_client import get_client, message_text
+from prompt_context import PROMPT_MIN_EVENT_TOKENS, PROMPT_TOKEN_BUDGET, ContextAssembler
+from reply_parser import REPLY_SCHEMA, extract_json, validate_reply
+from token_count import estimate_tokens
+from vector_index import VectorIndex
 
 
 class AI:
     def __init__(self):
         self.ollama_api_key = os.environ.get('OLLAMA_API_KEY', None)
         self.ollama_model = os.environ.get('OLLAMA_MODEL', 'gpt-oss:120b')
+        # similarity index over the event timeline, synced lazily in search_similar;
+        # request and job threads share it, so syncs and searches hold _index_lock
+        self._index = VectorIndex()
+        self._index_lock = threading.Lock()
+        self._index_synced = 0
+        self._index_last_id = None
+        # tokenized story snippets, cached per event id
+        self._context = ContextAssembler()
 
     def generate_mission_narrative(self, prompt, character, mission):
         """Genera narrativa específica para una misión usando el LLM."""
         # Usar el generador normal, pero sin requerir JSON, solo narrativa
         try:
-            text = self.ollama_generate(prompt)
-            try:
-                data = json.loads(text)
-                return data.get('narrative', text)
-            except Exception:
-                return text
+            key = generation_key(self.ollama_model, prompt, state=state_bucket(character))
+            text = self.ollama_generate(prompt, cache_key=key, endpoint='mission')
+            data, _ = extract_json(text)
+            return data.get('narrative', text) if data else text
         except Exception:
             return "No se pudo generar narrativa de misión."
 
-    def _load_embed_model(self):
-        """Lazy load embedding model."""
-        if self.embed_model is None:
-            print(f"Loading embedding model: {self.embed_model_name}...")
-            pass
-        return self.embed_model
+    def get_embedding(self, text):
+        """Embedding float32 del texto (modelo local opcional o hashing sin descargas)."""
+        return embed_text(text)
+
+    def search_similar(self, embedding, events, top_k=5, vectors=None, universe_id=None, with_scores=False):
+        """Return the top_k events most similar (cosine) to embedding.
+
+        Events are fed incrementally into a VectorIndex keyed by their position
+        in the (append-only) timeline; vectors come from the memory-mapped
+        sidecar through ``embedding_row`` or, for events written before the
+        sidecar existed, from an inline ``embedding`` list. ``universe_id``
+        restricts the search to that universe's events. ``with_scores``
+        returns (event, similarity) pairs instead.
+        """
+        with self._index_lock:
+            self._sync_index(events, vectors)
+            hits = self._index.search(embedding, top_k=top_k, group=universe_id)
+        if with_scores:
+            return [(events[pos], score) for pos, score in hits if pos < len(events)]
+        return [events[pos] for pos, _ in hits if pos < len(events)]
+
+    def _sync_index(self, events, vectors):
+        synced = self._index_synced
+        if synced and (len(events) < synced or events[synced - 1].get('id') != self._index_last_id):
+            # not the timeline we indexed: start over
+            synced = 0
+        if synced == 0:
+            self._index = VectorIndex()
+        keys, rows, inline, groups = [], [], [], []
+        for pos in range(synced, len(events)):
+            e = events[pos]
+            if not isinstance(e, dict):
+                continue
+            row = e.get('embedding_row')
+            if vectors is not None and row is not None and row < len(vectors):
+                rows.append(row)
+                keys.append(pos)
+                groups.append(e.get('universe_id'))
+            elif isinstance(e.get('embedding'), list):
+                inline.append((pos, e['embedding'], e.get('universe_id')))
+        if rows:
+            # fancy indexing copies only the new rows out of the memmap
+            self._index.add_many(keys, vectors[np.asarray(rows)], groups)
+        for pos, emb, group in inline:
+            if self._index.dim is None or len(emb) == self._index.dim:
+                self._index.add(pos, emb, group)
+        if events:
+            self._index_synced = len(events)
+            self._index_last_id = events[-1].get('id') if isinstance(events[-1], dict) else None
+
+    def build_system_prompt(self, universe, character, recent_events, similarity=None, with_story=False):
+        """Context for an action: universe, character, rules and the story so far.
+
+        Story events are chosen by the ContextAssembler so the whole prompt
+        stays within PROMPT_TOKEN_BUDGET; ``similarity`` maps event ids to
+        their similarity with the action. ``with_story`` returns (prompt,
+        story) instead, ``story`` being the ids of the answered events in it
+        (see generate_narrative).
+        """
+        lines = [f"Universe: {universe.get('name', universe.get('id', 'Unknown'))}"]
+        if universe.get('description'):
+            lines.append(f"  {universe.get('description')}")
 
-                # Métodos de embeddings y modelos locales eliminados para máxima ligereza
-        
         # Add character context
         if character:
             lines.append(f"\nCharacter: {character.get('name', 'Unknown')}")
@@ -41,7 +109,7 @@ class AI:
             lines.append(f"  Life: {(character.get('lifePercent', 1.0) * 100):.0f}%")
             lines.append(f"  Points: {character.get('points', 0)}")
             lines.append(f"  Money: {character.get('money', 0)}")
-            
+
             # Show recent actions from history
             if character.get('history'):
                 lines.append("\n  Recent Actions:")
@@ -50,40 +118,30 @@ class AI:
                         continue
                     effects = h.get('effects', {}) if h else {}
                     lines.append(f"    - Points: {effects.get('points', 0)}, Money: {effects.get('money', 0)}, Life: {effects.get('lifePercent', 0)}")
-        
+
         # Universe rules
         rules = universe.get('rules', {})
         if rules:
             lines.append('\nUniverse Rules:')
-            lines.append(json.dumps(rules, ensure_ascii=False, indent=2))
-        
-        # Recent events for context (include up to last 30 events from the universe)
+            lines.append(json.dumps(rules, ensure_ascii=False, separators=(',', ':')))
+
+        # Recent events for context, packed under what is left of the token budget
         lines.append('\nRecent Story Events:')
-        if recent_events:
-            for e in recent_events[-30:]:
-                if not e or not isinstance(e, dict):
-                    continue
-                # prefer stored narrative, else prompt
-                narrative = None
-                result = e.get('result')
-                if isinstance(result, dict):
-                    narrative = result.get('narrative')
-                if not narrative:
-                    narrative = e.get('prompt') or '<no prompt>'
-                # include effects if present
-                effects = None
-                if isinstance(result, dict):
-                    effects = result.get('effects')
-                student = e.get('student', 'Player')
-                snippet = (str(narrative)[:200]).replace('\n', ' ')
-                if effects:
-                    lines.append(f"- {student}: {snippet} (effects: {json.dumps(effects, ensure_ascii=False)})")
-                else:
-                    lines.append(f"- {student}: {snippet}")
-        
-        return '\n'.join(lines)
-
-    def generate_narrative(self, system_prompt, user_prompt, max_length: int = 512):
+        fixed = estimate_tokens('\n'.join(lines))
+        budget = max(PROMPT_MIN_EVENT_TOKENS, PROMPT_TOKEN_BUDGET - fixed)
+        story, used, candidates, chosen = self._context.select(
+            recent_events or [], budget, similarity, character.get('id') if character else None)
+        lines.extend(story)
+
+        prompt = '\n'.join(lines)
+        print(f"[AI] system prompt: {fixed + used} tokens ({len(story)}/{candidates} events, "
+              f"budget {PROMPT_TOKEN_BUDGET})")
+        if with_story:
+            # pending events (this action among them) only show their prompt
+            return prompt, [e.get('id') for e in chosen if isinstance(e.get('result'), dict)]
+        return prompt
+
+    def _narrative_attempts(self, system_prompt, user_prompt):
         base_instruction = (
             "You are an immersive Game Master. Respond with a rich, engaging narrative that considers the character's history.\n\n"
             "RESPOND ONLY WITH VALID JSON - nothing else.\n\n"
@@ -108,49 +166,106 @@ class AI:
 
         prompt = base_instruction + "\n\n" + system_prompt + '\n\nStudent action: ' + user_prompt
 
-        # Try up to two attempts: first normal, then extra strict JSON-only and request choices
-        attempts = [
+        # First the strict JSON-only prompt that also asks for choices; the plain one is the fallback
+        return [
             "CRITICAL: Return ONLY JSON. NO text before/after. The JSON must include keys 'effects' and 'narrative'. Additionally include a 'choices' array with 2-4 closed options (each a string or object {\"description\":string, \"effects\":{...}}). {\"effects\": {\"points\": INT (range -500 to 1000), \"money\": INT (range -1000 to 5000), \"lifePercent\": INT (delta, range -20 to 20)}, \"narrative\": \"2-3 sentence immersive story\", \"choices\": [...]}. Remember: lifePercent is DELTA not absolute!\n\n" + prompt,
             prompt
         ]
 
-        for attempt_prompt in attempts:
+    def reply_json(self, text):
+        """The JSON object in a model reply as a JSON string, or None if none can be recovered.
+
+        Trailing text, fences and truncated objects are handled by
+        reply_parser.extract_json; an object cut short keeps its partial
+        narrative and whatever effects were complete.
+        """
+        data, _ = extract_json(text or '')
+        if not data or ('narrative' not in data and 'effects' not in data):
+            return None
+        return json.dumps(data, ensure_ascii=False)
+
+    def _narrative_key(self, system_prompt, user_prompt, rules, character, story):
+        if rules is None and character is None:
+            # no structured state: only the exact same prompt may share a generation
+            return generation_key(self.ollama_model, system_prompt + '\n' + user_prompt, normalize=False)
+        # a reply names the character and follows the story in the prompt: it is never replayed for
+        # another character or another story; without the story ids, only for the same prompt
+        if story is None:
+            story = hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()
+        state = {'character': (character or {}).get('id'), 'bucket': state_bucket(character), 'story': story}
+        return generation_key(self.ollama_model, user_prompt, rules, state)
+
+    def generate_narrative(self, system_prompt, user_prompt, max_length: int = 512, rules=None, character=None,
+                           story=None):
+        """JSON reply for a player action.
+
+        Cached by action, universe rules, character id, character state bucket
+        and ``story``, the answered events in the prompt (see build_system_prompt).
+        """
+        text = None
+        key = self._narrative_key(system_prompt, user_prompt, rules, character, story)
+        for n, attempt_prompt in enumerate(self._narrative_attempts(system_prompt, user_prompt)):
             try:
-                text = self.groq_generate(attempt_prompt)
+                text, structured = self.generate_json(attempt_prompt, max_length, cache_key=f'{key}:{n}')
             except Exception:
-                text = None
+                text, structured = None, False
 
             if not text:
                 continue
 
-            # Try to extract JSON substring
-            try:
-                start = text.find('{')
-                end = text.rfind('}')
-                if start != -1 and end != -1 and end > start:
-                    json_text = text[start:end+1]
-                    # Validate JSON
-                    import json as _json
-                    _json.loads(json_text)
-                    return json_text
-            except Exception:
-                # invalid JSON, try next attempt
-                continue
+            if structured:
+                data, _ = extract_json(text)
+                problems = validate_reply(data)
+                if not problems:
+                    return json.dumps(data, ensure_ascii=False)
+                print(f"[AI] structured reply does not match the schema: {'; '.join(problems)}")
+            json_text = self.reply_json(text)
+            if json_text is not None:
+                return json_text
+            # no JSON object at all (not even a truncated one): only then is the second prompt worth a call
 
         # If all attempts failed, return raw text from last attempt (so storage can store narrative)
         return text or ''
 
+    def stream_narrative(self, system_prompt, user_prompt, max_tokens: int = 512, rules=None, character=None,
+                         story=None):
+        """Stream the first (strict JSON) attempt as Ollama chat chunks; no second attempt."""
+        prompt = self._narrative_attempts(system_prompt, user_prompt)[0]
+        key = self._narrative_key(system_prompt, user_prompt, rules, character, story)
+        return get_client().chat_stream(
+            self.ollama_model,
+            [{"role": "user", "content": prompt}],
+            options={"temperature": 0.3, "num_predict": max_tokens},
+            cache_key=f'{key}:0',
+            endpoint='narrative',
+        )
+
+    def ollama_generate(self, prompt_text: str, max_tokens: int = 512, cache_key=None, endpoint=None):
+        """Single-turn completion through the pooled LLM client (and generation cache)."""
+        data = get_client().chat(
+            self.ollama_model,
+            [{"role": "user", "content": prompt_text}],
+            options={"temperature": 0.3, "num_predict": max_tokens},
+            cache_key=cache_key,
+            endpoint=endpoint,
+        )
+        return message_text(data).strip()
+
+    def generate_json(self, prompt_text: str, max_tokens: int = 512, cache_key=None):
+        """ollama_generate asking for a reply that follows REPLY_SCHEMA; returns (text, structured).
 
-    def groq_generate(self, prompt_text: str):
-        """Call Groq API using OpenAI client."""
-        response = self.groq_client.chat.completions.create(
-            model=self.groq_model,
-            messages=[{"role": "user", "content": prompt_text}],
-            max_tokens=512,
-            temperature=0.3,
+        ``structured`` is True when the server constrained the reply with the
+        schema (LLM_STRUCTURED_OUTPUT=1 and 'format' supported).
+        """
+        data, structured = get_client().chat_json(
+            self.ollama_model,
+            [{"role": "user", "content": prompt_text}],
+            REPLY_SCHEMA,
+            options={"temperature": 0.3, "num_predict": max_tokens},
+            cache_key=cache_key,
+            endpoint='narrative',
         )
-        # The response format is similar to OpenAI
-        return response.choices[0].message.content.strip()
+        return message_text(data).strip(), structured
 
     def generate_image_for_event(self, universe, event, class_number):
         """No genera imágenes en modo ligero."""
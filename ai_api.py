@@ -1,11 +1,17 @@
-import os
 import time
-import asyncio
 from flask import Blueprint, request, jsonify
-from local_knowledge import LocalKnowledgeBase
-
-import requests
-import tiktoken
+from context_store import get_context_store
+from effects_parser import parse_choices, parse_effects
+from local_knowledge import get_knowledge_base
+from jobs import job_response
+from llm_cache import generation_key
+from llm_client import get_client, message_text, offline_reply
+from rate_limiter import get_limiter
+from reply_parser import REPLY_SCHEMA, extract_json
+from semantic_cache import get_semantic_cache
+from storage import get_storage
+from streaming import relay_reply, sse, sse_response
+from token_count import estimate_tokens
 
 # Configuración
 
@@ -13,80 +19,72 @@ DEFAULT_OLLAMA_MODEL = "gpt-oss:120b"
 MAX_INPUT_TOKENS = 150
 MAX_OUTPUT_TOKENS = 350
 SIMILARITY_THRESHOLD = 0.80
-RATE_LIMIT_RPM = 80
-TOKEN_LIMIT_TPM = 30000
 
 # Inicialización
-kb = LocalKnowledgeBase()
-rate_limit_queue = []  # timestamps de requests
-player_context = {}  # playerId: [mensajes]
+kb = get_knowledge_base()  # en disco (KB_PATH): la comparten todos los workers
 
 bp = Blueprint('ai', __name__)
 
-# Utilidad para estimar tokens
-try:
-    enc = tiktoken.encoding_for_model("gpt-3.5-turbo")
-except Exception:
-    enc = tiktoken.get_encoding("cl100k_base")
-
-def estimate_tokens(text):
-    return len(enc.encode(text))
-
-def cleanup_rate_limit():
-    now = time.time()
-    while rate_limit_queue and now - rate_limit_queue[0] > 60:
-        rate_limit_queue.pop(0)
-
-def can_make_request():
-    cleanup_rate_limit()
-    return len(rate_limit_queue) < RATE_LIMIT_RPM
-
-def register_request():
-    rate_limit_queue.append(time.time())
-
 
 # --- SIEMPRE usar OllamaFreeAPI con modelo forzado ---
 def get_available_ollama_model(preferred=DEFAULT_OLLAMA_MODEL):
     # Solo retorna el modelo preferido, ya que la API oficial requiere nombre exacto
     return preferred
 
-def call_ollama_llm(message, context=None, model_name=None):
+def _chat_request(message, context=None, model_name=None):
     prompt = build_game_prompt(context, message)
     model = get_available_ollama_model(model_name or DEFAULT_OLLAMA_MODEL)
     print(f"[AI_API] Usando modelo oficial Ollama: {model}")
-    api_key = os.environ.get("OLLAMA_API_KEY")
-    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
     # Construir historial de mensajes para el endpoint /api/chat
     messages = []
     # Mensaje de sistema (instrucción)
     messages.append({"role": "system", "content": prompt})
     # Mensaje del usuario
     messages.append({"role": "user", "content": message})
-    payload = {
-        "model": model,
-        "messages": messages,
-        "stream": False,
-        "options": {
-            "temperature": 0.3,
-            "num_predict": MAX_OUTPUT_TOKENS
-        }
-        # No se incluye 'format' para máxima compatibilidad
+    options = {
+        "temperature": 0.3,
+        "num_predict": MAX_OUTPUT_TOKENS
     }
+    # 'format' (esquema JSON) sólo con LLM_STRUCTURED_OUTPUT=1: lo añade LLMClient.chat_json
+    # Caché: mismo modelo, mensaje normalizado y mismo contexto de conversación
+    cache_key = generation_key(model, message, state=context)
+    return model, messages, options, cache_key
+
+
+def _parse_chat_reply(data):
+    """(respuesta, tokens, generada): 'generada' es False si ningún modelo la escribió (vacía o del proveedor offline)."""
+    print(f"[AI_API] Respuesta cruda Ollama: {data}")
+    # Si no hay content, message_text usa thinking como fallback
+    reply = message_text(data)
+    generated = bool(reply) and not offline_reply(data)
+    reply = reply or "[Sin respuesta de Ollama]"
+    # una respuesta servida desde la caché no consume tokens
+    tokens_used = 0 if data.get("cached") else data.get("eval_count", len(reply.split()))
+    return reply, tokens_used, generated
+
+
+def _unavailable_reply(model, e):
+    print(f"[AI_API] Error Ollama API (modelo {model}): {e}")
+    return f"[El sistema está saturado o el modelo '{model}' no está disponible. Intenta más tarde o cambia de modelo.]", 0, False
+
+
+def call_ollama_llm(message, context=None, model_name=None):
+    model, messages, options, cache_key = _chat_request(message, context, model_name)
     try:
-        r = requests.post("https://ollama.com/api/chat", json=payload, headers=headers, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-        print(f"[AI_API] Respuesta cruda Ollama: {data}")
-        msg = data.get("message", {})
-        reply = msg.get("content", "")
-        if not reply:
-            # Si no hay respuesta, usar thinking como fallback
-            reply = msg.get("thinking", "[Sin respuesta de Ollama]")
-        tokens_used = data.get("eval_count", len(reply.split()))
-        return reply, tokens_used
+        data, _ = get_client().chat_json(model, messages, REPLY_SCHEMA, options, cache_key=cache_key,
+                                         endpoint='message')
+        return _parse_chat_reply(data)
+    except Exception as e:
+        return _unavailable_reply(model, e)
+
+
+async def acall_ollama_llm(message, context=None, model_name=None):
+    """Async variant of call_ollama_llm over the shared httpx pool."""
+    model, messages, options, _ = _chat_request(message, context, model_name)
+    try:
+        return _parse_chat_reply(await get_client().achat(model, messages, options, endpoint='message'))
     except Exception as e:
-        print(f"[AI_API] Error Ollama API (modelo {model}): {e}")
-        return f"[El sistema está saturado o el modelo '{model}' no está disponible. Intenta más tarde o cambia de modelo.]", 0
+        return _unavailable_reply(model, e)
 
 def build_game_prompt(context, user_message):
     base_instruction = (
@@ -106,97 +104,117 @@ def build_game_prompt(context, user_message):
     prompt += f"\n\nStudent action: {user_message}"
     return prompt
 
-@bp.route('/ai/message', methods=['POST'])
-def ai_message():
-    data = request.json or {}
+def _message_context(data):
+    """Comprobaciones comunes a /ai/message y /ai/message/stream.
+
+    Devuelve (respuesta, None) si se responde sin LLM (petición inválida,
+    respuesta local o rate limit) o (None, contexto) si hay que llamar al LLM.
+    """
     player_id = data.get('playerId')
     message = data.get('message', '')
     if not player_id or not message:
-        return jsonify({'error': 'playerId and message required'}), 400
+        return (jsonify({'error': 'playerId and message required'}), 400), None
     # Limitar tokens de entrada
     if estimate_tokens(message) > MAX_INPUT_TOKENS:
-        return jsonify({'error': 'Mensaje demasiado largo'}), 400
+        return (jsonify({'error': 'Mensaje demasiado largo'}), 400), None
     # Buscar en base local
     local_reply, score = kb.most_similar(message, threshold=SIMILARITY_THRESHOLD)
     if local_reply:
         print(f"[AI_API] Respuesta local encontrada (score={score:.2f}) para playerId={player_id}")
-        return jsonify({'reply': local_reply, 'source': 'local', 'tokensUsed': 0})
-    # Rate limit
-    if not can_make_request():
-        print(f"[AI_API] Rate limit alcanzado para playerId={player_id}")
-        return jsonify({'reply': '[Límite de uso alcanzado, intenta en unos segundos]', 'source': 'llm', 'tokensUsed': 0}), 429
-    register_request()
-    # Contexto resumido
-    context = None
-    if player_id in player_context:
-        ctx = player_context[player_id]
-        ctx_text = ' '.join(ctx)
-        if estimate_tokens(ctx_text) > 1000:
-            ctx_text = ctx_text[-1000:]
-        context = ctx_text
-    # Llamada a Groq con la librería oficial
+        return jsonify({'reply': local_reply, 'source': 'local', 'tokensUsed': 0}), None
+    # Caché semántica (opcional): la misma acción dicha con otras palabras, en el mismo universo
+    semantic = get_semantic_cache()
+    if semantic is not None:
+        cached, similarity = semantic.lookup(message, data.get('universe_id'))
+        if cached is not None:
+            print(f"[AI_API] Respuesta de la caché semántica (sim={similarity:.2f}) para playerId={player_id}")
+            return jsonify({**cached, 'source': 'semantic', 'tokensUsed': 0, 'eventId': None}), None
+    # Rate limit: peticiones y tokens, globales y por jugador; puede esperar hasta RATE_LIMIT_MAX_WAIT
+    wait = get_limiter().acquire(player_id, tokens=estimate_tokens(message))
+    if wait:
+        print(f"[AI_API] Rate limit alcanzado para playerId={player_id} (reintentar en {wait:.1f}s)")
+        body = {'reply': '[Límite de uso alcanzado, intenta en unos segundos]', 'source': 'llm', 'tokensUsed': 0}
+        return (jsonify(body), 429, {'Retry-After': str(max(1, round(wait)))}), None
+    # Contexto: últimos mensajes del jugador (y resumen de los anteriores si CONTEXT_SUMMARY_TOKENS > 0)
+    return None, get_context_store().context(player_id)
+
+
+@bp.route('/ai/message', methods=['POST'])
+def ai_message():
+    data = request.json or {}
+    early, context = _message_context(data)
+    if early is not None:
+        return early
+    return job_response('message', _message_job, data, context)
+
+
+def _message_job(data, context):
+    """Llamada al LLM de /ai/message, ejecutada como job; devuelve (cuerpo, status)."""
+    player_id = data.get('playerId')
     print(f"[AI_API] Enviando petición a OllamaFreeAPI para playerId={player_id}")
-    reply, tokens_used = call_ollama_llm(message, context)
+    reply, tokens_used, generated = call_ollama_llm(data.get('message', ''), context)
     print(f"[AI_API] Respuesta OllamaFreeAPI recibida para playerId={player_id}, tokens usados: {tokens_used}")
+    return _message_result(data, reply, tokens_used, generated), 200
+
+
+@bp.route('/ai/message/stream', methods=['POST'])
+def ai_message_stream():
+    """Como /ai/message, pero envía la narrativa por server-sent events según se genera.
+
+    Eventos: 'narrative' ({text}) con cada trozo nuevo, 'field' ({key, value})
+    cuando effects/choices están completos, y 'done' con el mismo cuerpo que
+    /ai/message.
+    """
+    started = time.perf_counter()
+    data = request.json or {}
+    early, context = _message_context(data)
+    if early is not None:
+        return early
+    player_id = data.get('playerId')
+    model, messages, options, cache_key = _chat_request(data.get('message', ''), context)
+
+    def events():
+        reply, tokens_used, generated = yield from relay_reply(
+            get_client().chat_stream(model, messages, options, cache_key=cache_key, endpoint='message'),
+            f'ai/message playerId={player_id}', started)
+        if not reply:
+            reply, tokens_used, generated = _unavailable_reply(model, 'empty stream')
+        yield sse('done', _message_result(data, reply, tokens_used, generated))
+
+    return sse_response(events())
+
+
+def _message_result(data, reply, tokens_used, generated=True):
+    """Interpreta la respuesta del LLM, guarda el evento con opciones y devuelve el cuerpo de la respuesta.
+
+    Con ``generated`` False (error, respuesta vacía o del proveedor offline) no
+    se aprende nada: ni la base local ni la caché semántica la repetirán.
+    """
+    player_id = data.get('playerId')
+    message = data.get('message', '')
+    # los tokens de la respuesta sólo se conocen ahora
+    get_limiter().charge(player_id, tokens_used)
     # Procesar JSON si es posible
     narrative = reply
     effects = {}
     choices = []
     imageNote = None
     event_id = None
-    import json as _json
     import uuid
-    def try_repair_json(s):
-        s = s.strip()
-        if not s.endswith('}'):  # Si falta cerrar
-            s += '"}' if s.count('"') % 2 == 1 else '}'
-        if 'choices' in s and s.count('[') > s.count(']'):
-            s += ']'
-        return s
-    json_found = False
-    try:
-        start = reply.find('{')
-        end = reply.rfind('}')
-        json_text = None
-        if start != -1 and end != -1 and end > start:
-            json_text = reply[start:end+1]
-        elif start != -1:
-            json_text = try_repair_json(reply[start:])
-        if json_text:
-            try:
-                data = _json.loads(json_text)
-                narrative = data.get('narrative', narrative)
-                effects = data.get('effects', {})
-                choices = data.get('choices', [])
-                imageNote = data.get('image_note', None)
-                json_found = True
-            except Exception as e2:
-                print(f"[AI_API] Reparación de JSON fallida: {e2}")
-    except Exception as e:
-        print(f"[AI_API] No se pudo extraer JSON de la respuesta Ollama: {e}")
-    import re
+    # Un solo recorrido: tolera texto alrededor del JSON y respuestas cortadas por el límite de tokens
+    parsed, repaired = extract_json(reply)
+    json_found = parsed is not None
+    if json_found:
+        if repaired:
+            print(f"[AI_API] JSON incompleto reparado para playerId={player_id}")
+        narrative = parsed.get('narrative', narrative)
+        effects = parsed.get('effects', {})
+        choices = parsed.get('choices', [])
+        imageNote = parsed.get('image_note', None)
     if not json_found:
-        # Fallback: intentar extraer efectos y opciones con regex si no hay JSON
-        effects = {}
-        m_points = re.search(r'(\+|\-)?\d+\s*(puntos|points)', reply, re.IGNORECASE)
-        m_money = re.search(r'(\+|\-)?\d+\s*(monedas|dinero|money)', reply, re.IGNORECASE)
-        m_life = re.search(r'(\+|\-)?\d+\s*%?\s*(vida|life)', reply, re.IGNORECASE)
-        if m_points:
-            effects['points'] = int(re.search(r'(\+|\-)?\d+', m_points.group()).group())
-        if m_money:
-            effects['money'] = int(re.search(r'(\+|\-)?\d+', m_money.group()).group())
-        if m_life:
-            effects['lifePercent'] = int(re.search(r'(\+|\-)?\d+', m_life.group()).group())
-        # Opciones: buscar líneas que empiecen con "Opciones:" o "Options:"
-        choices = []
-        m_choices = re.search(r'(Opciones|Options)\s*[:：]\s*(.+)', reply, re.IGNORECASE)
-        if m_choices:
-            # Separar por , o ;
-            raw = m_choices.group(2)
-            for opt in re.split(r'[;,]', raw):
-                opt = opt.strip()
-                if opt:
-                    choices.append(opt)
+        # Fallback: extraer efectos y opciones del texto libre si no hay JSON
+        effects = parse_effects(reply)
+        choices = parse_choices(reply)
     # Generar y guardar un evento real si hay choices
     event_id = None
     if choices:
@@ -218,12 +236,9 @@ def ai_message():
         if 'class_number' in data:
             class_number = data['class_number']
         # Si no, intentar deducir de storage
+        storage = get_storage()
         try:
-            from storage import Storage
-            import os as _os
-            storage = Storage(_os.path.join(_os.path.dirname(__file__), 'data'))
-            chars = storage.load_characters()
-            char = next((c for c in chars if c.get('id') == character_id), None)
+            char = storage.get_character(character_id)
             if char:
                 student = student or char.get('student') or char.get('name')
                 universe_id = universe_id or char.get('currentUniverse')
@@ -241,19 +256,22 @@ def ai_message():
             'class_number': class_number,
             'choices': choices,
             'result': None,
-            'embedding': None
+            'embedding_row': None
         }
         try:
             storage.append_event(event)
         except Exception as e:
             print(f"[AI_API] No se pudo guardar el evento con opciones: {e}")
     # Guardar contexto
-    player_context.setdefault(player_id, []).append(message)
-    player_context[player_id] = player_context[player_id][-20:]
-    # Aprendizaje: guardar solo la narrativa en embeddings locales
-    if narrative and narrative != '[El sistema está saturado. Intenta más tarde]':
+    get_context_store().append(player_id, message)
+    # Aprendizaje: guardar solo la narrativa en embeddings locales, y sólo de respuestas bien formadas
+    if generated and json_found and not repaired and narrative:
         kb.add_entry(narrative)
     # Si la narrativa es vacía, mostrar mensaje claro
     if not narrative or narrative.strip() == "Sin respuesta":
         narrative = "[El modelo no devolvió una respuesta. Intenta de nuevo o cambia el prompt.]"
-    return jsonify({'reply': narrative, 'effects': effects, 'choices': choices, 'imageNote': imageNote, 'source': 'llm', 'tokensUsed': tokens_used, 'eventId': event_id})
+    elif generated and json_found and not repaired and get_semantic_cache() is not None:
+        # sólo respuestas bien formadas: un error, un texto suelto o uno cortado no debe repetirse
+        get_semantic_cache().add(message, {'reply': narrative, 'effects': effects, 'choices': choices,
+                                           'imageNote': imageNote}, data.get('universe_id'))
+    return {'reply': narrative, 'effects': effects, 'choices': choices, 'imageNote': imageNote, 'source': 'llm', 'tokensUsed': tokens_used, 'eventId': event_id}
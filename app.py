@@ -7,26 +7,35 @@ print("[DEBUG] Importing uuid")
 import uuid
 print("[DEBUG] Importing json")
 import json
+import time
 print("[DEBUG] Setting OLLAMA_API_KEY")
-# Configurar la API key de Ollama.com para todo el backend
-os.environ["OLLAMA_API_KEY"] = "4d8096350fbd448cb71ce635a6092075.zYanmZA03H90lj1wM7q8U8Qw"
+# API key de Ollama.com por defecto para todo el backend (una OLLAMA_API_KEY del entorno tiene prioridad)
+os.environ.setdefault("OLLAMA_API_KEY", "4d8096350fbd448cb71ce635a6092075.zYanmZA03H90lj1wM7q8U8Qw")
 print("[DEBUG] Importing Flask")
 from flask import Flask, request, jsonify, send_file, render_template_string
 print("[DEBUG] Importing ai_api")
 from ai_api import bp
 print("[DEBUG] Importing storage")
-from storage import Storage
+from storage import get_storage
 print("[DEBUG] Importing ai")
 from ai import AI
+from llm_cache import generation_key, get_cache
+from context_store import get_context_store
+from effects_parser import parse_effects
+from jobs import busy_response, get_jobs, job_response
+from llm_client import get_client, offline_reply
+from rate_limiter import get_limiter
+from reply_parser import extract_json
+from semantic_cache import get_semantic_cache
+from singleflight import get_singleflight
+from streaming import relay_reply, sse, sse_response
 
 print("[DEBUG] Creating Flask app")
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 print("[DEBUG] Registering blueprint")
 app.register_blueprint(bp)
-print("[DEBUG] Setting up data_dir")
-data_dir = os.path.join(os.path.dirname(__file__), 'data')
 print("[DEBUG] Creating Storage")
-storage = Storage(data_dir)
+storage = get_storage()
 print("[DEBUG] Creating AI instance")
 ai = AI()
 print("[DEBUG] Flask app fully initialized")
@@ -35,6 +44,38 @@ print("[DEBUG] Flask app fully initialized")
 def health():
     return "ok", 200
 
+@app.route('/api/stats')
+def stats():
+    """Per-worker performance counters."""
+    cache = get_cache()
+    semantic = get_semantic_cache()
+    return jsonify({'pid': os.getpid(), 'storage_cache': storage.cache_stats(),
+                    'llm': get_client().stats(),
+                    'llm_cache': cache.stats() if cache else None,
+                    'llm_singleflight': get_singleflight().stats(),
+                    'rate_limiter': get_limiter().stats(),
+                    'jobs': get_jobs().stats(),
+                    'player_context': get_context_store().stats(),
+                    'semantic_cache': semantic.stats() if semantic else None})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of an LLM job; ?wait=N (s, max 30) holds the request until it finishes.
+
+    When done, 'result' is the body the endpoint would have returned and
+    'http_status' its status code.
+    """
+    try:
+        wait = min(30.0, max(0.0, float(request.args.get('wait', 0))))
+    except ValueError:
+        wait = 0.0
+    record = get_jobs().get(job_id, wait)
+    if record is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(record)
+
+
 @app.route('/')
 def index():
     """Serve the main chat interface."""
@@ -64,11 +105,9 @@ def get_universes():
 @app.route('/api/character/<character_id>', methods=['GET'])
 def get_character(character_id):
     """Return a specific character."""
-    chars = storage.load_characters()
-    if isinstance(chars, list):
-        for c in chars:
-            if c.get('id') == character_id:
-                return jsonify(c)
+    c = storage.get_character(character_id)
+    if c:
+        return jsonify(c)
     return jsonify({'error': 'not found'}), 404
 
 
@@ -81,18 +120,20 @@ def get_universe(universe_id):
     return jsonify({'error': 'not found'}), 404
 
 
-@app.route('/api/action', methods=['POST'])
-def handle_action():
-    payload = request.json or {}
+def _prepare_action(payload):
+    """Validate the action, record its event and build the LLM prompt.
+
+    Returns (error_response, None) or (None, context) for _finish_action.
+    """
     required = ['student', 'universe_id', 'character_id', 'prompt', 'class_number']
     for r in required:
         if r not in payload:
-            return jsonify({'error': f'missing {r}'}), 400
+            return (jsonify({'error': f'missing {r}'}), 400), None
 
     # Validate action against rules
     valid = storage.validate_action(payload)
     if not valid.get('valid', False):
-        return jsonify({'error': 'action invalid', 'detail': valid}), 400
+        return (jsonify({'error': 'action invalid', 'detail': valid}), 400), None
 
     # Create event
     event = storage.create_event(payload)
@@ -102,13 +143,16 @@ def handle_action():
         event.setdefault('pre_effects', valid.get('effects'))
 
     # Create embedding for the prompt + minimal context
+    # (stored as a row of the binary sidecar, never inline in the event)
     embedding = ai.get_embedding(payload['prompt'])
-    event['embedding'] = embedding.tolist()
+    event['embedding_row'] = storage.add_embedding(embedding)
     storage.append_event(event)
 
     # Search similar events for context and also include recent universe events
     events = storage.load_events()
-    top = ai.search_similar(embedding, events, top_k=5)
+    scored = ai.search_similar(embedding, events, top_k=5, vectors=storage.load_embeddings(), with_scores=True)
+    top = [e for e, _ in scored]
+    similarity = {e.get('id'): score for e, score in scored if isinstance(e, dict)}
     # include last N events from the same universe to ensure full context
     try:
         recent_events = [e for e in events if e.get('universe_id') == payload.get('universe_id')]
@@ -128,25 +172,77 @@ def handle_action():
         combined.append(e)
 
     # Load character for context
-    characters = storage.load_characters()
-    current_char = None
-    for c in characters:
-        if c.get('id') == payload['character_id']:
-            current_char = c
-            break
+    current_char = storage.get_character(payload['character_id'])
 
     # Build prompt for LLM: rules + character context + recent events
     universe = storage.load_universe(payload['universe_id'])
-    system_prompt = ai.build_system_prompt(universe, current_char, combined)
+    system_prompt, story = ai.build_system_prompt(universe, current_char, combined, similarity, with_story=True)
+    return None, {'payload': payload, 'event': event, 'universe': universe, 'character': current_char,
+                  'system_prompt': system_prompt, 'story': story}
+
+
+@app.route('/api/action', methods=['POST'])
+def handle_action():
+    payload = request.json or {}
+    # refuse before the event is recorded, so a busy server leaves no unanswered action behind
+    if get_jobs().full():
+        return busy_response()
+    error, ctx = _prepare_action(payload)
+    if error is not None:
+        return error
+
+    return job_response('action', _generate_action, ctx, on_refused=lambda: _refuse_action(ctx))
+
+
+def _refuse_action(ctx):
+    # the queue filled up between the check and the submit: close the recorded event
+    event = ctx['event']
+    event['result'] = {'error': 'server busy, try again shortly'}
+    storage.update_event(event['id'], event)
+
 
+def _generate_action(ctx):
     # Ask LLM to interpret and propose changes (expects JSON in reply)
-    response_text = ai.generate_narrative(system_prompt, payload['prompt'])
+    response_text = ai.generate_narrative(ctx['system_prompt'], ctx['payload']['prompt'],
+                                          rules=ctx['universe'].get('rules'), character=ctx['character'],
+                                          story=ctx['story'])
+    return _finish_action(ctx, response_text)
+
+
+@app.route('/api/action/stream', methods=['POST'])
+def handle_action_stream():
+    """Like /api/action, but streams the narrative as server-sent events.
+
+    Emits 'narrative' ({text}) chunks and 'field' ({key, value}) events while
+    the model generates, then 'done' with the /api/action response body (or
+    'error').
+    """
+    started = time.perf_counter()
+    payload = request.json or {}
+    error, ctx = _prepare_action(payload)
+    if error is not None:
+        return error
+
+    def events():
+        reply, _, _ = yield from relay_reply(
+            ai.stream_narrative(ctx['system_prompt'], payload['prompt'],
+                                rules=ctx['universe'].get('rules'), character=ctx['character'],
+                                story=ctx['story']),
+            'api/action', started)
+        body, status = _finish_action(ctx, ai.reply_json(reply) or reply)
+        yield sse('done' if status == 200 else 'error', body)
 
+    return sse_response(events())
+
+
+def _finish_action(ctx, response_text):
+    """Apply the LLM reply to the action's event; returns (response body, status)."""
+    payload, event, universe = ctx['payload'], ctx['event'], ctx['universe']
     # Apply effects suggested by the LLM (assumed JSON)
     try:
         result = storage.apply_event_result(event, response_text)
     except Exception as e:
-        return jsonify({'error': 'failed to apply result', 'detail': str(e)}), 500
+        return {'error': 'failed to apply result', 'detail': str(e)}, 500
 
     # Load updated character (if available from result) so UI can refresh stats
     updated_character = None
@@ -154,11 +250,7 @@ def handle_action():
         updated_character = result['character']
     else:
         # fallback: reload from storage
-        chars = storage.load_characters()
-        for c in chars:
-            if c.get('id') == event['character_id']:
-                updated_character = c
-                break
+        updated_character = storage.get_character(event['character_id'])
 
     # Optionally generate image for the class
     if universe.get('enable_images'):
@@ -182,14 +274,14 @@ def handle_action():
         event['choices'] = event_choices
         storage.update_event(event['id'], event)
 
-    # Remove embedding from response (keep internally, but not in API response)
-    event_response = {k: v for k, v in event.items() if k != 'embedding'}
+    # Remove embedding reference from response (internal only)
+    event_response = {k: v for k, v in event.items() if k not in ('embedding', 'embedding_row')}
 
     # Add image note if generation was attempted but failed
     if universe.get('enable_images') and not event_response.get('image'):
         event_response['image_note'] = 'Configure SD_MODEL_PATH to generate images'
 
-    return jsonify({'event': event_response, 'narrative': response_text, 'applied': result, 'character': updated_character})
+    return {'event': event_response, 'narrative': response_text, 'applied': result, 'character': updated_character}, 200
 
 
 @app.route('/api/choice', methods=['POST'])
@@ -208,64 +300,42 @@ def apply_choice():
     # Si no se recibe, error
     if not choice_text or not character_id:
         return jsonify({'error': 'missing choice_text or character_id'}), 400
+    return job_response('choice', _choice_result, choice_text, character_id, universe_id, student, class_number)
+
+
+def _choice_result(choice_text, character_id, universe_id, student, class_number):
+    """LLM part of /api/choice, run as a job; returns (response body, status)."""
     # Llamar al LLM como si fuera un nuevo mensaje
     from ai_api import call_ollama_llm
     # Opcional: contexto del personaje
     context = None
     try:
-        chars = storage.load_characters()
-        char = next((c for c in chars if c.get('id') == character_id), None)
+        char = storage.get_character(character_id)
         if char:
             context = f"Historial: {char.get('history', [])}"
     except Exception:
         pass
-    reply, tokens_used = call_ollama_llm(choice_text, context)
+    reply, tokens_used, _ = call_ollama_llm(choice_text, context)
     # Procesar respuesta del LLM (igual que en /ai/message)
     import json as _json
-    import re
     narrative = reply
     effects = {}
     choices = []
     imageNote = None
-    json_found = False
-    try:
-        start = reply.find('{')
-        end = reply.rfind('}')
-        json_text = None
-        if start != -1 and end != -1 and end > start:
-            json_text = reply[start:end+1]
-        elif start != -1:
-            json_text = reply[start:]
-        if json_text:
-            try:
-                data = _json.loads(json_text)
-                narrative = data.get('narrative', narrative)
-                effects = data.get('effects', {})
-                choices = data.get('choices', [])
-                imageNote = data.get('image_note', None)
-                json_found = True
-            except Exception:
-                pass
-    except Exception:
-        pass
+    data, _ = extract_json(reply)
+    json_found = data is not None
+    if json_found:
+        narrative = data.get('narrative', narrative)
+        effects = data.get('effects', {})
+        choices = data.get('choices', [])
+        imageNote = data.get('image_note', None)
     if not json_found:
-        m_points = re.search(r'(\+|\-)?\d+\s*(puntos|points)', reply, re.IGNORECASE)
-        m_money = re.search(r'(\+|\-)?\d+\s*(monedas|dinero|money)', reply, re.IGNORECASE)
-        m_life = re.search(r'(\+|\-)?\d+\s*%?\s*(vida|life)', reply, re.IGNORECASE)
-        if m_points:
-            effects['points'] = int(re.search(r'(\+|\-)?\d+', m_points.group()).group())
-        if m_money:
-            effects['money'] = int(re.search(r'(\+|\-)?\d+', m_money.group()).group())
-        if m_life:
-            effects['lifePercent'] = int(re.search(r'(\+|\-)?\d+', m_life.group()).group())
+        effects = parse_effects(reply)
     # Aplicar efectos al personaje
     # Crear y guardar evento
     import datetime
     event_id = None
     try:
-        from storage import Storage
-        import os as _os
-        storage2 = Storage(_os.path.join(_os.path.dirname(__file__), 'data'))
         event_id = str(uuid.uuid4())
         event = {
             'id': event_id,
@@ -277,38 +347,27 @@ def apply_choice():
             'class_number': class_number,
             'choices': [],
             'result': None,
-            'embedding': None
+            'embedding_row': None
         }
-        storage2.append_event(event)
-        res = storage2.apply_event_result(event, _json.dumps({'effects': effects, 'narrative': narrative}))
+        storage.append_event(event)
+        res = storage.apply_event_result(event, _json.dumps({'effects': effects, 'narrative': narrative}))
         # Obtener el personaje actualizado
         updated_char = None
         try:
-            chars = storage2.load_characters()
-            updated_char = next((c for c in chars if c.get('id') == character_id), None)
+            updated_char = storage.get_character(character_id)
         except Exception:
             pass
     except Exception as e:
-        return jsonify({'error': f'failed to apply result: {e}'}), 500
-    return jsonify({'event': event, 'applied': res, 'narrative': narrative, 'effects': effects, 'choices': choices, 'imageNote': imageNote, 'character': updated_char})
+        return {'error': f'failed to apply result: {e}'}, 500
+    return {'event': event, 'applied': res, 'narrative': narrative, 'effects': effects, 'choices': choices, 'imageNote': imageNote, 'character': updated_char}, 200
 
 
 @app.route('/api/evaluate/<character_id>', methods=['GET'])
 def evaluate_character(character_id):
     """Calculate final grade for a character."""
     try:
-        events = storage.load_events()
-        characters = storage.load_characters()
-        universes = storage.load_universes()
-        
         # Find the character
-        char = None
-        chars_list = characters if isinstance(characters, list) else []
-        for c in chars_list:
-            if c.get('id') == character_id:
-                char = c
-                break
-        
+        char = storage.get_character(character_id)
         if not char:
             return jsonify({'error': f'character {character_id} not found'}), 404
         
@@ -323,7 +382,7 @@ def evaluate_character(character_id):
 
         points = float(char.get('points', 0))
         money = float(char.get('money', 0))
-        history_len = len(char.get('history', []) if isinstance(char.get('history', []), list) else [])
+        history_len = storage.history.count(char, 'history')
 
         # Normalize heuristics (tunable)
         metrics = {
@@ -388,28 +447,30 @@ def translate_text():
     
     if not text:
         return jsonify({'error': 'missing text'}), 400
-    
+    return job_response('translate', _translate, text, target_lang)
+
+
+def _translate(text, target_lang):
     try:
-        import os
-        import requests
-        api_key = os.environ.get("OLLAMA_API_KEY")
-        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
-        payload_ollama = {
-            "model": "deepseek-r1:1.5b",
-            "messages": [
+        model = "deepseek-r1:1.5b"
+        data = get_client().chat(
+            model,
+            [
                 {"role": "system", "content": "Eres un traductor experto. Traduce todo al español, sin explicaciones."},
                 {"role": "user", "content": text}
             ],
-            "stream": False,
-            "options": {"temperature": 0.0, "num_predict": 200}
-        }
-        r = requests.post("https://ollama.com/api/chat", json=payload_ollama, headers=headers, timeout=60)
-        r.raise_for_status()
-        data = r.json()
+            options={"temperature": 0.0, "num_predict": 200},
+            cache_key=generation_key(model, text, normalize=False),
+            endpoint='translate',
+        )
+        if offline_reply(data):
+            # el proveedor offline no traduce: devuelve el texto tal cual
+            return {'original': text, 'translated': text, 'language': target_lang,
+                    'error': 'no hay ningún proveedor de LLM disponible'}, 200
         translation = data.get("message", {}).get("content", "")
-        return jsonify({'original': text, 'translated': translation, 'language': target_lang})
+        return {'original': text, 'translated': translation, 'language': target_lang}, 200
     except Exception as e:
-        return jsonify({'original': text, 'translated': text, 'language': target_lang, 'error': str(e)}), 200
+        return {'original': text, 'translated': text, 'language': target_lang, 'error': str(e)}, 200
 
 
 @app.route('/api/evaluation/submit', methods=['POST'])
@@ -457,8 +518,7 @@ def buy_market_item():
     item_id = payload.get('item_id')
     if not character_id or not item_id:
         return jsonify({'error': 'missing character_id or item_id'}), 400
-    chars = storage.load_characters()
-    char = next((c for c in chars if c.get('id') == character_id), None)
+    char = storage.get_character(character_id)
     if not char:
         return jsonify({'error': 'character not found'}), 404
 
@@ -477,8 +537,8 @@ def buy_market_item():
     inv.append(item)
     char['inventory'] = inv
 
-    # save characters
-    storage.save_json(storage.characters_path, chars)
+    # save character
+    storage.save_character(char)
     return jsonify({'character': char, 'item': item})
 
 
@@ -492,8 +552,7 @@ def use_inventory_item():
     if not character_id or not item_id:
         return jsonify({'error': 'missing character_id or item_id'}), 400
 
-    chars = storage.load_characters()
-    char = next((c for c in chars if c.get('id') == character_id), None)
+    char = storage.get_character(character_id)
     if not char:
         return jsonify({'error': 'character not found'}), 404
 
@@ -521,24 +580,19 @@ def use_inventory_item():
     except Exception as e:
         return jsonify({'error': 'failed to apply item effects', 'detail': str(e)}), 500
 
-    # Remove item if consumable
+    # Reload character to get updated state from apply_event_result
     try:
-        consumable = item.get('consumable', True)
-        if consumable:
-            inv = [i for i in inv if i.get('id') != item_id]
-            char['inventory'] = inv
-            # save characters
-            storage.save_json(storage.characters_path, chars)
+        char = storage.get_character(character_id) or char
     except Exception:
         pass
 
-    # Reload character to get updated state from apply_event_result
+    # Remove item if consumable (on the fresh copy, so the item effects are kept)
     try:
-        chars_fresh = storage.load_characters()
-        for c in chars_fresh:
-            if c.get('id') == character_id:
-                char = c
-                break
+        consumable = item.get('consumable', True)
+        if consumable:
+            inv = [i for i in (char.get('inventory') or []) if i.get('id') != item_id]
+            char['inventory'] = inv
+            storage.save_character(char)
     except Exception:
         pass
 
@@ -565,16 +619,19 @@ def start_mission():
     mission = next((m for m in missions if m.get('id') == mission_id), None)
     if not mission:
         return jsonify({'error': 'mission not found'}), 404
-    chars = storage.load_characters()
-    char = next((c for c in chars if c.get('id') == character_id), None)
+    char = storage.get_character(character_id)
     if not char:
         return jsonify({'error': 'character not found'}), 404
     # Construir contexto para el LLM
     context = f"Misión: {mission.get('title')}\nDescripción: {mission.get('description')}\nObjetivo: {mission.get('objective')}\nRecompensa: {mission.get('reward_points')} puntos, {mission.get('reward_money')} monedas\nDificultad: {mission.get('difficulty')}\nPersonaje: {char.get('name')}\nUniverso: {universe_id}"
     prompt = f"INICIA_MISION: {mission.get('title')}\n{context}"
+    return job_response('mission', _mission_narrative, prompt, char, mission)
+
+
+def _mission_narrative(prompt, char, mission):
     # Llamar al LLM para generar narrativa
     try:
         narrative = ai.generate_mission_narrative(prompt, char, mission)
     except Exception as e:
-        return jsonify({'error': 'LLM error', 'detail': str(e)}), 500
-    return jsonify({'narrative': narrative, 'mission': mission})
+        return {'error': 'LLM error', 'detail': str(e)}, 500
+    return {'narrative': narrative, 'mission': mission}, 200
@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from token_count import estimate_tokens
+
+# recent messages kept verbatim per player, by count and by tokens
+CONTEXT_MAX_MESSAGES = int(os.environ.get('CONTEXT_MAX_MESSAGES', '20'))
+CONTEXT_MAX_TOKENS = int(os.environ.get('CONTEXT_MAX_TOKENS', '1000'))
+# tokens of rolling summary kept for messages that left the window; 0 = older messages are dropped
+CONTEXT_SUMMARY_TOKENS = int(os.environ.get('CONTEXT_SUMMARY_TOKENS', '0'))
+# players kept; idle ones expire after CONTEXT_TTL seconds, the least recently used go first past the caps
+CONTEXT_MAX_PLAYERS = int(os.environ.get('CONTEXT_MAX_PLAYERS', '10000'))
+CONTEXT_MAX_BYTES = int(os.environ.get('CONTEXT_MAX_BYTES', str(16 * 1024 * 1024)))
+CONTEXT_TTL = float(os.environ.get('CONTEXT_TTL', str(6 * 3600)))
+# SQLite file shared by every gunicorn worker; empty = per-process contexts
+CONTEXT_PATH = os.environ.get('CONTEXT_PATH', '')
+
+# words of each older message that make it into the rolling summary
+SUMMARY_WORDS = 12
+SUMMARY_SEP = ' | '
+# rough per-entry bookkeeping, so the byte cap also bounds many tiny contexts
+_ENTRY_OVERHEAD = 200
+_MESSAGE_OVERHEAD = 60
+
+
+def rolling_summary(summary, dropped, budget):
+    """Extractive summary: the start of each dropped message, oldest parts cut first to fit ``budget`` tokens."""
+    parts = [summary] if summary else []
+    for text in dropped:
+        words = text.split()
+        parts.append(' '.join(words[:SUMMARY_WORDS]) + ('…' if len(words) > SUMMARY_WORDS else ''))
+    out = SUMMARY_SEP.join(parts)
+    while out and estimate_tokens(out) > budget:
+        out = out.partition(SUMMARY_SEP)[2]
+    return out
+
+
+class ContextBuffer:
+    """One player's recent messages, pre-joined, with a running token total.
+
+    Each message is counted once when appended; messages leaving the window
+    are cut off the front of the joined text and their tokens subtracted, so
+    reading the context never re-joins or re-tokenizes the conversation.
+    """
+
+    __slots__ = ('messages', 'text', 'tokens', 'summary', 'updated')
+
+    def __init__(self, messages=(), text='', tokens=0, summary='', updated=0.0):
+        self.messages = [tuple(m) for m in messages]  # (text, tokens), oldest first
+        self.text = text
+        self.tokens = tokens
+        self.summary = summary
+        self.updated = updated
+
+    def append(self, message, max_messages, max_tokens):
+        """Add a message; returns the texts that fell out of the window."""
+        n = estimate_tokens(message)
+        self.messages.append((message, n))
+        self.text = f'{self.text} {message}' if self.text else message
+        self.tokens += n
+        dropped = []
+        # the newest message always stays, even if it alone is over max_tokens
+        while len(self.messages) > 1 and (len(self.messages) > max_messages or self.tokens > max_tokens):
+            old, old_n = self.messages.pop(0)
+            self.text = self.text[len(old) + 1:]
+            self.tokens -= old_n
+            dropped.append(old)
+        return dropped
+
+    def context(self):
+        if not self.summary:
+            return self.text
+        return f"Resumen de mensajes anteriores: {self.summary}\nÚltimos mensajes: {self.text}"
+
+    def size(self):
+        """Approximate bytes held."""
+        # the joined text and the message list hold about the same characters
+        return _ENTRY_OVERHEAD + 2 * len(self.text) + len(self.summary) + _MESSAGE_OVERHEAD * len(self.messages)
+
+    def to_json(self):
+        return json.dumps({'messages': self.messages, 'text': self.text, 'tokens': self.tokens,
+                           'summary': self.summary}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw, updated):
+        return cls(updated=updated, **json.loads(raw))
+
+
+class ContextStore(ABC):
+    """Recent conversation per player, bounded in players, bytes and age.
+
+    ``context`` returns the text to put in the prompt (None for an unknown or
+    expired player) and ``append`` records a message. Messages beyond the
+    window are dropped or, with ``summary_tokens``, folded into a rolling
+    summary by ``summarizer``. Subclasses store the buffers: in process
+    (MemoryContextStore) or in SQLite, shared by all workers
+    (SqliteContextStore).
+    """
+
+    def __init__(self, max_messages=CONTEXT_MAX_MESSAGES, max_tokens=CONTEXT_MAX_TOKENS,
+                 summary_tokens=CONTEXT_SUMMARY_TOKENS, max_players=CONTEXT_MAX_PLAYERS,
+                 max_bytes=CONTEXT_MAX_BYTES, ttl=CONTEXT_TTL, summarizer=rolling_summary):
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.max_players = max_players
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.summarizer = summarizer
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.summarized = 0
+
+    def _update(self, buf, message, now):
+        dropped = buf.append(message, self.max_messages, self.max_tokens)
+        if dropped and self.summary_tokens > 0:
+            buf.summary = self.summarizer(buf.summary, dropped, self.summary_tokens)
+            with self._stats_lock:
+                self.summarized += len(dropped)
+        buf.updated = now
+
+    def _count(self, found):
+        with self._stats_lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @abstractmethod
+    def context(self, player_id):
+        """Prompt text of the player's recent conversation, or None."""
+
+    @abstractmethod
+    def append(self, player_id, message):
+        """Record one message of the player."""
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'backend': type(self).__name__,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'summarized_messages': self.summarized,
+                'limits': {'messages': self.max_messages, 'tokens': self.max_tokens,
+                           'summary_tokens': self.summary_tokens, 'players': self.max_players,
+                           'bytes': self.max_bytes, 'ttl': self.ttl},
+            }
+
+
+class MemoryContextStore(ContextStore):
+    """Buffers in an OrderedDict, least recently used first (contexts are per process)."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._buffers = OrderedDict()  # player_id -> ContextBuffer
+        self._bytes = 0
+
+    def _drop(self, player_id):
+        self._bytes -= self._buffers.pop(player_id).size()
+
+    def context(self, player_id):
+        now = time.time()
+        with self._lock:
+            buf = self._buffers.get(player_id)
+            if buf is not None and now - buf.updated > self.ttl:
+                self._drop(player_id)
+                with self._stats_lock:
+                    self.expirations += 1
+                buf = None
+            if buf is not None:
+                self._buffers.move_to_end(player_id)
+            out = buf.context() if buf is not None else None
+        self._count(out is not None)
+        return out
+
+    def append(self, player_id, message):
+        now = time.time()
+        with self._lock:
+            buf = self._buffers.pop(player_id, None)
+            if buf is None:
+                buf = ContextBuffer()
+            else:
+                self._bytes -= buf.size()
+            self._update(buf, message, now)
+            self._buffers[player_id] = buf
+            self._bytes += buf.size()
+            self._evict(now)
+
+    def _evict(self, now):
+        # the front is the least recently used: expired entries go first, then whatever exceeds the caps
+        while len(self._buffers) > 1:
+            player_id, buf = next(iter(self._buffers.items()))
+            expired = now - buf.updated > self.ttl
+            if not expired and len(self._buffers) <= self.max_players and self._bytes <= self.max_bytes:
+                break
+            self._drop(player_id)
+            with self._stats_lock:
+                if expired:
+                    self.expirations += 1
+                else:
+                    self.evictions += 1
+
+    def stats(self):
+        out = super().stats()
+        with self._lock:
+            out['players'] = len(self._buffers)
+            out['bytes'] = self._bytes
+        return out
+
+
+class SqliteContextStore(ContextStore):
+    """Buffers in a SQLite table, shared by every gunicorn worker.
+
+    A player's next message may land on any worker; each append is one short
+    IMMEDIATE transaction over the player's row. Caps are enforced every few
+    appends by deleting the rows written longest ago.
+    """
+
+    PRUNE_EVERY = 64
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        self._appends = 0
+        self._db().execute('CREATE TABLE IF NOT EXISTS player_context (player_id TEXT PRIMARY KEY, '
+                           'data TEXT NOT NULL, size INTEGER NOT NULL, updated REAL NOT NULL)')
+        self._db().execute('CREATE INDEX IF NOT EXISTS player_context_updated ON player_context (updated)')
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def context(self, player_id):
+        row = self._db().execute('SELECT data, updated FROM player_context WHERE player_id = ?',
+                                 (str(player_id),)).fetchone()
+        out = None
+        if row is not None and time.time() - row[1] <= self.ttl:
+            out = ContextBuffer.from_json(*row).context()
+        self._count(out is not None)
+        return out
+
+    def append(self, player_id, message):
+        now = time.time()
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute('SELECT data, updated FROM player_context WHERE player_id = ?',
+                             (str(player_id),)).fetchone()
+            buf = ContextBuffer()
+            if row is not None and now - row[1] <= self.ttl:
+                buf = ContextBuffer.from_json(*row)
+            self._update(buf, message, now)
+            db.execute('INSERT OR REPLACE INTO player_context (player_id, data, size, updated) VALUES (?, ?, ?, ?)',
+                       (str(player_id), buf.to_json(), buf.size(), now))
+            self._appends += 1
+            if self._appends >= self.PRUNE_EVERY:
+                self._appends = 0
+                self._prune(db, now)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def _prune(self, db, now):
+        expired = db.execute('DELETE FROM player_context WHERE updated < ?', (now - self.ttl,)).rowcount
+        count, total = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM player_context').fetchone()
+        evicted = 0
+        if count > self.max_players or total > self.max_bytes:
+            # oldest first until both caps hold again
+            drop = []
+            for player_id, size in db.execute('SELECT player_id, size FROM player_context ORDER BY updated'):
+                if count <= self.max_players and total <= self.max_bytes:
+                    break
+                drop.append((player_id,))
+                count -= 1
+                total -= size
+            db.executemany('DELETE FROM player_context WHERE player_id = ?', drop)
+            evicted = len(drop)
+        with self._stats_lock:
+            self.expirations += expired
+            self.evictions += evicted
+
+    def stats(self):
+        out = super().stats()
+        count, total = self._db().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM player_context').fetchone()
+        out['players'] = count
+        out['bytes'] = total
+        return out
+
+
+_store = None
+
+
+def get_context_store():
+    """Process-wide context store configured from the environment."""
+    global _store
+    if _store is None:
+        _store = SqliteContextStore(CONTEXT_PATH) if CONTEXT_PATH else MemoryContextStore()
+    return _store
@@ -0,0 +1,137 @@
+import re
+
+# Effects mentioned in free text, for LLM replies that are not valid JSON.
+#
+# Every value is a delta, as in the JSON 'effects' object: points and money
+# are added to the character and lifePercent is percentage points of life
+# gained or lost. An amount counts as a delta when it is signed (+10, -5),
+# follows a gain/loss verb (gana, pierdes, recovers, loses...), is labelled
+# (puntos: 10, "lifePercent": -5) or is a life change phrase ("your life is
+# reduced by 1"). Signed mentions of a key add up ("gana 10 puntos y pierde
+# 5 puntos" is 5). A labelled value is the effect itself, typically from
+# broken JSON, so the first one wins over everything else; later labels
+# belong to the effects of the choices. Bare amounts ("100 monedas") count
+# for points and money only when nothing else mentions that key; a bare
+# life percentage ("80% de vida") describes the current state, not a
+# change, and is ignored.
+
+_GAIN = frozenset('''gana ganas ganan ganaste obtiene obtienes obtienen obtuviste recibe recibes reciben recupera
+    recuperas consigue consigues suma sumas gain gains gained earn earns earned win wins won receive receives
+    received recover recovers recovered heal heals healed get gets got obtain obtains obtained restore restores
+    restored'''.split())
+_LOSS = frozenset('''pierde pierdes pierden perdiste gasta gastas gastan paga pagas pagan resta restas cuesta lose
+    loses lost spend spends spent pay pays paid cost costs take takes took suffer suffers suffered sufre
+    sufres'''.split())
+_UP = frozenset('increased increases rises rose restored sube subió aumenta aumentó mejora mejoró'.split())
+_DOWN = frozenset('''reduced decreased decreases drop drops dropped fall falls fell baja bajó disminuye disminuyó
+    reducida reduce empeora'''.split())
+_LIFE = frozenset('vida life salud health hp vitalidad vitality'.split())
+# words allowed between a verb and its amount: 'gana un 10% de vida', 'reduced by 1'
+_ARTICLES = frozenset('un una a an another otro otros'.split())
+_BY = frozenset('by en un a'.split())
+_LABELS = {'points': 'points', 'puntos': 'points', 'money': 'money', 'dinero': 'money', 'monedas': 'money',
+           'coins': 'money', 'gold': 'money', 'oro': 'money', 'lifepercent': 'lifePercent',
+           'life_percent': 'lifePercent', 'life': 'lifePercent', 'vida': 'lifePercent', 'hp': 'lifePercent'}
+
+# 35000, 35.000 or 35,000 (thousands separators)
+_NUMBER = re.compile(r'[0-9]+(?:[.,][0-9]{3}(?![0-9]))*')
+# the unit right after an amount
+_UNIT = re.compile(r'\s*%?\s*(?:(?:de|of)\s+)?(?:(?:tu|su|your|his|her)\s+)?(?:(puntos?|points?|pts|xp|experiencia|'
+                   r'experience)|(monedas?|dinero|money|coins?|oro|gold|plata|silver|créditos|credits)|'
+                   r'(vida|life|salud|health|hp|vitalidad|vitality))\b', re.IGNORECASE)
+# 'change_universe_to: X', 'te mueves al universo X', 'you travel to universe X'
+_UNIVERSE = re.compile(
+    r'(?:\bchange_universe_to["\']?\s*[:=]?\s*["\']?|\b(?:mueve|mueves|muevo|muevan|viaja|viajas|viajo|'
+    r'cambia|cambias|moves?|moved|travels?|travelled|traveled|go|goes|went|teleports?)\s+'
+    r'(?:a|al|hacia|to|into)\s+(?:(?:el|the|otro|another)\s+)?(?:universo|universe)\s+)'
+    r'(?!(?:de|del|of)\b)([A-Za-z0-9_\-]+)', re.IGNORECASE)
+# characters looked at before an amount; enough for 'your life has been reduced by'
+_WINDOW = 48
+_PUNCT = '"\'{}[](),;:=.!?¡¿'
+
+_CHOICES = re.compile(r'(?:Opciones|Options)\s*[:：]\s*(.+)', re.IGNORECASE)
+_CHOICE_SEP = re.compile(r'[;,]')
+
+
+def _int(text):
+    return int(text.replace('.', '').replace(',', ''))
+
+
+def _life_change(words):
+    """+1 / -1 if the words end like 'your life is reduced (by)', else 0."""
+    i = len(words) - 1
+    if i >= 0 and words[i] in _BY:
+        i -= 1
+    if i < 1 or (words[i] not in _UP and words[i] not in _DOWN):
+        return 0
+    if not _LIFE.intersection(words[max(0, i - 4):i]):
+        return 0
+    return 1 if words[i] in _UP else -1
+
+
+def _verb(words):
+    """+1 / -1 if the words end with a gain / loss verb (maybe plus an article), else 0."""
+    i = len(words) - 1
+    if i >= 1 and words[i] in _ARTICLES:
+        i -= 1
+    if i < 0:
+        return 0
+    return 1 if words[i] in _GAIN else -1 if words[i] in _LOSS else 0
+
+
+def parse_effects(text):
+    """Effects dict (points, money, lifePercent, change_universe_to) found in free text."""
+    if not text:
+        return {}
+    labelled = {}
+    signed = {}
+    bare = {}
+    # one regex pass finds the amounts; the few words around each one say
+    # what it is, checked with set lookups instead of more patterns
+    for m in _NUMBER.finditer(text):
+        start = m.start()
+        prev = text[start - 1] if start else ' '
+        sign = 0
+        if prev in '+-−' and (start < 2 or not text[start - 2].isalnum()):
+            sign = 1 if prev == '+' else -1
+            start -= 1
+        elif prev.isalnum() or prev in '.,_':
+            continue  # the tail of a word or a longer number
+        value = _int(m.group()) * (sign or 1)
+        tail = text[max(0, start - _WINDOW):start].split()[-6:]
+        words = [w.strip(_PUNCT).lower() for w in tail]
+        if not sign:
+            change = _life_change(words)
+            if change:
+                signed['lifePercent'] = signed.get('lifePercent', 0) + change * value
+                continue
+        # 'puntos: 10', '"lifePercent": -5', 'life -10%' (without a colon the value must be signed)
+        if words and words[-1] in _LABELS and (tail[-1].rstrip('"\'').endswith((':', '='))
+                                               or sign and tail[-1].strip('"\'').lower() == words[-1]):
+            labelled.setdefault(_LABELS[words[-1]], value)
+            continue
+        unit = _UNIT.match(text, m.end())
+        if not unit:
+            continue
+        key = 'points' if unit.group(1) else 'money' if unit.group(2) else 'lifePercent'
+        verb = _verb(words)
+        if verb < 0 and not sign:
+            value = -value
+        if sign or verb:
+            signed[key] = signed.get(key, 0) + value
+        elif key != 'lifePercent':
+            bare.setdefault(key, value)
+    effects = {**bare, **signed, **labelled}
+    # the last mention wins: it is where the character ends up
+    if 'univers' in text.lower():
+        for m in _UNIVERSE.finditer(text):
+            effects['change_universe_to'] = m.group(1)
+    return effects
+
+
+def parse_choices(text):
+    """Choices from an 'Opciones: a, b; c' line, or []."""
+    m = _CHOICES.search(text or '')
+    if not m:
+        return []
+    return [opt.strip() for opt in _CHOICE_SEP.split(m.group(1)) if opt.strip()]
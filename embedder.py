@@ -0,0 +1,66 @@
+import os
+import re
+import zlib
+import unicodedata
+
+import numpy as np
+
+EMBED_DIM = int(os.environ.get('EMBED_DIM', '384'))
+# Optional sentence-transformers model (e.g. all-MiniLM-L6-v2); empty = hashing only
+EMBED_MODEL = os.environ.get('EMBED_MODEL', '')
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_model = None
+_model_failed = False
+
+
+def normalize_text(text):
+    """Lowercase and strip accents so 'Atacó' and 'ataco' hash alike."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return text.lower()
+
+
+def hashing_embedding(text, dim=EMBED_DIM):
+    """Deterministic feature-hashing embedding: words plus character trigrams.
+
+    Needs no model download; uses crc32 so vectors are stable across processes.
+    """
+    vec = np.zeros(dim, dtype=np.float32)
+    for word in _WORD_RE.findall(normalize_text(text)):
+        feats = [word]
+        padded = f'#{word}#'
+        feats.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        for feat in feats:
+            h = zlib.crc32(feat.encode('utf-8'))
+            vec[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = np.linalg.norm(vec)
+    if norm > 0:
+        vec /= norm
+    return vec
+
+
+def _load_model():
+    global _model, _model_failed
+    if _model is None and not _model_failed and EMBED_MODEL:
+        try:
+            from sentence_transformers import SentenceTransformer
+            print(f"[EMBED] Loading embedding model: {EMBED_MODEL}...")
+            _model = SentenceTransformer(EMBED_MODEL, device='cpu')
+        except Exception as e:
+            print(f"[EMBED] Falling back to hashing embeddings: {e}")
+            _model_failed = True
+    return _model
+
+
+def embedder_name():
+    """Identity of the vectors embed_text returns: the model name, or 'hashing'."""
+    return EMBED_MODEL if _load_model() is not None else 'hashing'
+
+
+def embed_text(text):
+    """Embed text with the local model if configured, else the hashing vectorizer."""
+    model = _load_model()
+    if model is not None:
+        return np.asarray(model.encode(text or '', normalize_embeddings=True), dtype=np.float32)
+    return hashing_embedding(text)
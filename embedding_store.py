@@ -0,0 +1,148 @@
+import os
+import json
+
+import numpy as np
+from filelock import FileLock
+
+from embedder import embed_text, embedder_name
+
+# float16 halves the sidecar again at a small precision cost
+EMBEDDING_DTYPE = os.environ.get('EMBEDDING_DTYPE', 'float32')
+
+
+class EmbeddingStore:
+    """Event embeddings kept as a raw row-major matrix in a binary sidecar file.
+
+    Row i of the matrix belongs to the event whose ``embedding_row`` is i. The
+    dimension, dtype and embedder (see embedder.embedder_name) live in a small
+    JSON header next to the data file and are fixed by the first vector
+    written: vectors from another embedder are refused, since their
+    similarities would be noise. Reads go through a read-only
+    ``numpy.memmap`` so similarity search never parses or copies vectors.
+    """
+
+    def __init__(self, path, dtype=EMBEDDING_DTYPE):
+        self.path = path
+        self.meta_path = os.path.splitext(path)[0] + '.json'
+        self._lock = FileLock(path + '.lock')
+        self.dim = None
+        self.dtype = np.dtype(dtype)
+        self.embedder = None
+        self._map = None
+        self._map_rows = 0
+        self._load_meta()
+
+    def _load_meta(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.dim = int(meta['dim'])
+            self.dtype = np.dtype(meta.get('dtype', 'float32'))
+            # None for sidecars written before the header recorded it
+            self.embedder = meta.get('embedder')
+
+    def _write_meta(self, dim):
+        self.dim = int(dim)
+        self.embedder = embedder_name()
+        # readers load the header without the lock, so never expose a partial one
+        tmp = self.meta_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'dim': self.dim, 'dtype': self.dtype.name, 'embedder': self.embedder}, f)
+        os.replace(tmp, self.meta_path)
+
+    @property
+    def row_bytes(self):
+        return self.dim * self.dtype.itemsize
+
+    def __len__(self):
+        if self.dim is None:
+            self._load_meta()
+            if self.dim is None:
+                return 0
+        try:
+            return os.path.getsize(self.path) // self.row_bytes
+        except FileNotFoundError:
+            return 0
+
+    def append(self, vector):
+        """Append one vector from embedder.embed_text and return its row number."""
+        vec = np.asarray(vector, dtype=self.dtype).reshape(-1)
+        with self._lock:
+            if self.dim is None:
+                self._load_meta()
+                if self.dim is None:
+                    self._write_meta(vec.shape[0])
+            if vec.shape[0] != self.dim:
+                raise ValueError(f'embedding has dim {vec.shape[0]}, store expects {self.dim}')
+            if self.embedder is not None and self.embedder != embedder_name():
+                raise ValueError(f'embedding comes from {embedder_name()}, store holds {self.embedder} vectors')
+            with open(self.path, 'ab') as f:
+                size = f.tell()
+                row, torn = divmod(size, self.row_bytes)
+                if torn:
+                    # drop a partially written row left by a crashed writer
+                    f.truncate(row * self.row_bytes)
+                f.write(vec.tobytes())
+            return row
+
+    def matrix(self):
+        """Return a read-only (rows, dim) view of every stored vector."""
+        rows = len(self)
+        if rows == 0:
+            return np.empty((0, self.dim or 0), dtype=self.dtype)
+        if self._map is None or self._map_rows != rows:
+            self._map = np.memmap(self.path, dtype=self.dtype, mode='r', shape=(rows, self.dim))
+            self._map_rows = rows
+        return self._map
+
+    def get(self, row):
+        if row is None or row < 0:
+            return None
+        m = self.matrix()
+        if row >= m.shape[0]:
+            return None
+        return m[row]
+
+    def current(self):
+        """True unless the stored vectors come from another embedder than the configured one."""
+        self._load_meta()
+        return self.dim is None or len(self) == 0 or self.embedder == embedder_name()
+
+    def reembed(self, texts):
+        """Recompute every row with the configured embedder, unless it already wrote them.
+
+        ``texts(rows)`` returns the text of each row (None for a row no event
+        uses, left as zeros). Row numbers do not change, so events keep their
+        ``embedding_row``. Returns the number of rows rewritten.
+        """
+        with self._lock:
+            if self.current():
+                return 0
+            rows = len(self)
+            vectors = [None if t is None else embed_text(t) for t in texts(rows)]
+            dim = next((v.shape[0] for v in vectors if v is not None), None) or embed_text('').shape[0]
+            mat = np.zeros((rows, dim), dtype=self.dtype)
+            for row, vec in enumerate(vectors):
+                if vec is not None:
+                    mat[row] = vec
+            tmp = self.path + '.reembed.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(mat.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            # data first: a crash before the header is replaced just re-embeds again
+            os.replace(tmp, self.path)
+            self._write_meta(dim)
+            self._map = None
+            return rows
+
+    def externalize(self, event):
+        """Move an inline ``embedding`` list out of an event into the sidecar.
+
+        Inline vectors were written by another model than embedder.embed_text,
+        so the event's prompt is embedded again instead of keeping them.
+        """
+        emb = event.pop('embedding', None)
+        if isinstance(emb, list) and emb:
+            event['embedding_row'] = self.append(embed_text(event.get('prompt') or ''))
+        return event
@@ -0,0 +1,240 @@
+import os
+import json
+import threading
+from filelock import FileLock
+
+# Compaction kicks in once the journal holds at least this many records and
+# superseded records outnumber live ones by COMPACT_RATIO.
+COMPACT_MIN_RECORDS = int(os.environ.get('EVENT_LOG_COMPACT_MIN', '1000'))
+COMPACT_RATIO = float(os.environ.get('EVENT_LOG_COMPACT_RATIO', '1.0'))
+
+
+def _dump_line(event):
+    return (json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class EventLog:
+    """Append-only, line-delimited event journal.
+
+    Every line holds a full event; a later line with the same id supersedes the
+    earlier one, so appends and updates only write the record itself. An
+    in-memory offset index (event id -> byte offset of its latest record) is
+    built once and then caught up incrementally from the end of the file, which
+    keeps several processes appending to the same journal coherent. Within a
+    process the index is guarded by ``_index_lock`` (taken after the file
+    lock, never before it).
+    """
+
+    def __init__(self, path, compact_min=COMPACT_MIN_RECORDS, compact_ratio=COMPACT_RATIO):
+        self.path = path
+        self.compact_min = compact_min
+        self.compact_ratio = compact_ratio
+        self._lock = FileLock(path + '.lock')
+        self._index_lock = threading.RLock()
+        self._reset_index()
+        if not os.path.exists(path):
+            with self._lock:
+                if not os.path.exists(path):
+                    open(path, 'ab').close()
+
+    @property
+    def lock(self):
+        """The journal's FileLock (reentrant), for callers batching several writes."""
+        return self._lock
+
+    def _reset_index(self):
+        self._offsets = {}  # id -> offset of latest record
+        self._order = []  # ids in first-seen order (timeline order)
+        self._records = 0
+        self._end = 0
+        self._ino = None
+
+    def _refresh(self):
+        """Bring the offset index up to date with what is on disk; caller holds _index_lock."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset_index()
+            return
+        if st.st_ino != self._ino or st.st_size < self._end:
+            # compacted or replaced by another process: rebuild from scratch
+            self._reset_index()
+            self._ino = st.st_ino
+        if st.st_size == self._end:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._end)
+            offset = self._end
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # torn write from a crashed writer; not committed yet
+                    break
+                if line.strip():
+                    try:
+                        eid = json.loads(line).get('id')
+                    except Exception:
+                        eid = None
+                    if eid is not None:
+                        if eid not in self._offsets:
+                            self._order.append(eid)
+                        self._offsets[eid] = offset
+                    self._records += 1
+                offset += len(line)
+            self._end = offset
+
+    def _read_at(self, f, offset):
+        f.seek(offset)
+        return json.loads(f.readline())
+
+    def __len__(self):
+        with self._index_lock:
+            self._refresh()
+            return len(self._offsets)
+
+    def __contains__(self, eid):
+        with self._index_lock:
+            self._refresh()
+            return eid in self._offsets
+
+    def _open_indexed(self, eid=None):
+        """(file, offset of eid, indexed end) for the journal the index describes.
+
+        Another process may compact (replace) the file between the refresh and
+        the open; the opened file is checked against the indexed inode and size
+        and the index caught up again until they match. ``file`` is None when
+        ``eid`` is given and unknown.
+        """
+        while True:
+            with self._index_lock:
+                self._refresh()
+                offset = self._offsets.get(eid) if eid is not None else 0
+                ino, end = self._ino, self._end
+            if offset is None:
+                return None, None, None
+            f = open(self.path, 'rb')
+            st = os.fstat(f.fileno())
+            if st.st_ino == ino and st.st_size >= end:
+                return f, offset, end
+            f.close()
+
+    def load(self):
+        """Return all live events in timeline order."""
+        events = {}
+        f, _, end = self._open_indexed()
+        with f:
+            data = f.read(end)
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                e = json.loads(line)
+            except Exception:
+                continue
+            # dict keeps the first-seen position when a later record replaces the value
+            events[e.get('id')] = e
+        return list(events.values())
+
+    def get(self, eid):
+        f, offset, _ = self._open_indexed(eid)
+        if f is None:
+            return None
+        with f:
+            return self._read_at(f, offset)
+
+    def _append_record(self, event):
+        line = _dump_line(event)
+        with open(self.path, 'a+b') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size > self._end:
+                # a previous writer died mid-line: terminate it so it is skipped
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+                    size += 1
+            f.write(line)
+        eid = event.get('id')
+        if eid not in self._offsets:
+            self._order.append(eid)
+        self._offsets[eid] = size
+        self._records += 1
+        self._end = size + len(line)
+
+    def append(self, event):
+        with self._lock, self._index_lock:
+            self._refresh()
+            self._append_record(event)
+            self._maybe_compact()
+
+    def update(self, eid, event):
+        """Supersede the record for eid. Returns False if the id is unknown."""
+        with self._lock, self._index_lock:
+            self._refresh()
+            if eid not in self._offsets:
+                return False
+            self._append_record(event)
+            self._maybe_compact()
+            return True
+
+    def replace(self, events):
+        """Atomically replace the whole journal with the given events."""
+        with self._lock, self._index_lock:
+            _write_journal(self.path, events)
+            self._reset_index()
+            self._refresh()
+
+    def _maybe_compact(self):
+        live = len(self._offsets)
+        dead = self._records - live
+        if self._records >= self.compact_min and dead > live * self.compact_ratio:
+            self._compact_locked()
+
+    def compact(self, transform=None):
+        """Rewrite the journal keeping only the latest record of each event.
+
+        ``transform`` optionally rewrites each live event on the way through.
+        """
+        with self._lock, self._index_lock:
+            self._refresh()
+            self._compact_locked(transform)
+
+    def _compact_locked(self, transform=None):
+        tmp = self.path + '.compact.tmp'
+        with open(self.path, 'rb') as src, open(tmp, 'wb') as dst:
+            for eid in self._order:
+                src.seek(self._offsets[eid])
+                line = src.readline()
+                if transform is not None:
+                    line = _dump_line(transform(json.loads(line)))
+                dst.write(line)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp, self.path)
+        self._reset_index()
+        self._refresh()
+
+
+def migrate_json_array(json_path, log_path, transform=None):
+    """One-shot conversion of a legacy events.json array into a journal.
+
+    Writes to a temp file and renames, so an interrupted migration leaves no
+    half-written journal behind. ``transform`` is applied to every event
+    before it is written. Returns the number of migrated events.
+    """
+    with FileLock(json_path + '.lock'):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            events = json.load(f)
+    _write_journal(log_path, events, transform)
+    return len(events)
+
+
+def _write_journal(path, events, transform=None):
+    tmp = path + '.write.tmp'
+    with open(tmp, 'wb') as f:
+        for e in events:
+            if transform is not None:
+                e = transform(e)
+            f.write(_dump_line(e))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
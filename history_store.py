@@ -0,0 +1,93 @@
+import os
+import json
+from urllib.parse import quote
+
+import atomic_io
+
+# Entries kept inline on the entity; older ones are rolled into segment files
+# once HISTORY_SEGMENT_SIZE of them have accumulated past the hot tail.
+HISTORY_HOT_TAIL = int(os.environ.get('HISTORY_HOT_TAIL', '20'))
+HISTORY_SEGMENT_SIZE = int(os.environ.get('HISTORY_SEGMENT_SIZE', '200'))
+
+STAT_FIELDS = ('points', 'money', 'lifePercent')
+
+
+def _empty_stats():
+    return {'count': 0, 'by_class': {}, 'segments': []}
+
+
+def _accumulate(stats, entry):
+    stats['count'] += 1
+    cls = entry.get('class_number')
+    bucket = stats['by_class'].setdefault(
+        'unclassified' if cls is None else str(cls), {'count': 0, **{f: 0 for f in STAT_FIELDS}})
+    bucket['count'] += 1
+    effects = entry.get('effects') if isinstance(entry.get('effects'), dict) else {}
+    for f in STAT_FIELDS:
+        v = effects.get(f)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            bucket[f] += v
+
+
+class HistoryStore:
+    """Segmented storage for append-only entity lists (character history, universe timeline).
+
+    The newest ``hot_tail`` entries stay inline on the entity so prompts and
+    the UI keep reading them directly; older entries are written once into
+    immutable compact JSONL segments under ``root``. The entity carries
+    ``<field>_stats``: the total count, per-class totals of the numeric
+    effects and the list of its segments, so counts and totals never need
+    the full list.
+    """
+
+    def __init__(self, root, hot_tail=HISTORY_HOT_TAIL, segment_size=HISTORY_SEGMENT_SIZE):
+        self.root = root
+        self.hot_tail = hot_tail
+        self.segment_size = segment_size
+
+    def stats(self, entity, field):
+        """The entity's rolling aggregates, backfilled from the inline list for legacy entities."""
+        key = f'{field}_stats'
+        stats = entity.get(key)
+        if not isinstance(stats, dict):
+            stats = _empty_stats()
+            for entry in entity.get(field) or []:
+                if isinstance(entry, dict):
+                    _accumulate(stats, entry)
+            entity[key] = stats
+        return stats
+
+    def count(self, entity, field):
+        return self.stats(entity, field)['count']
+
+    def append(self, kind, entity, field, entry):
+        """Append entry to entity[field], update the aggregates and roll old entries out.
+
+        Mutates ``entity``; the caller persists it (segments are durable first).
+        """
+        stats = self.stats(entity, field)
+        items = list(entity.get(field) or [])
+        items.append(entry)
+        _accumulate(stats, entry)
+        if len(items) >= self.hot_tail + self.segment_size:
+            cut = len(items) - self.hot_tail
+            # named by sequence, so a segment orphaned by a failed commit is simply rewritten
+            name = f"{kind}/{quote(str(entity.get('id')), safe='')}/{field}-{len(stats['segments']):06d}.jsonl"
+            payload = b''.join(
+                (json.dumps(e, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+                for e in items[:cut])
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_io.write_files([(path, payload)])
+            stats['segments'].append({'file': name, 'count': cut})
+            items = items[cut:]
+        entity[field] = items
+
+    def load(self, entity, field):
+        """Full list: every segment in order followed by the inline tail."""
+        full = []
+        for seg in self.stats(entity, field)['segments']:
+            with open(os.path.join(self.root, seg['file']), 'r', encoding='utf-8') as f:
+                full.extend(json.loads(line) for line in f if line.strip())
+        full.extend(entity.get(field) or [])
+        return full
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import sqlite3
+import itertools
+import threading
+from collections import OrderedDict
+
+from flask import jsonify, request
+
+# threads per process running LLM jobs (bounds concurrent generations)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+# queued jobs per process before new ones are refused with 503
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', '64'))
+# how long finished jobs stay available to pollers (s)
+JOB_TTL = float(os.environ.get('JOB_TTL', '600'))
+# how long a synchronous request waits for its job before answering 202 + job id
+JOB_WAIT_TIMEOUT = float(os.environ.get('JOB_WAIT_TIMEOUT', '120'))
+# SQLite file so any gunicorn worker can answer /api/jobs/<id>; empty = memory, only valid with a single worker
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jobs.db'))
+
+# lower runs first: interactive play before mission intros before translations
+PRIORITY = {'action': 0, 'choice': 0, 'message': 0, 'mission': 1, 'translate': 2}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    """One queued call. ``fn(*args)`` must return ``(json body, http status)``."""
+
+    def __init__(self, kind, fn, args, priority):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.priority = priority
+        self.status = 'queued'  # queued | running | done | error
+        self.result = None
+        self.http_status = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {'id': self.id, 'kind': self.kind, 'status': self.status, 'result': self.result,
+                'http_status': self.http_status, 'error': self.error, 'created': self.created,
+                'started': self.started, 'finished': self.finished}
+
+
+class MemoryJobStore:
+    """Job records of this process, oldest first."""
+
+    def __init__(self, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, record):
+        with self._lock:
+            self._records[record['id']] = record
+            self._records.move_to_end(record['id'])
+            now = time.time()
+            while self._records:
+                first = next(iter(self._records.values()))
+                if not first['finished'] or now - first['finished'] < self.ttl:
+                    break
+                self._records.popitem(last=False)
+
+    def get(self, job_id):
+        with self._lock:
+            record = self._records.get(job_id)
+            return dict(record) if record else None
+
+
+class SqliteJobStore:
+    """Job records in SQLite, readable from every gunicorn worker."""
+
+    def __init__(self, path, ttl=JOB_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._last_prune = 0.0
+        self._db().execute('CREATE TABLE IF NOT EXISTS jobs '
+                           '(id TEXT PRIMARY KEY, record TEXT NOT NULL, finished REAL)')
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def save(self, record):
+        db = self._db()
+        db.execute('INSERT OR REPLACE INTO jobs (id, record, finished) VALUES (?, ?, ?)',
+                   (record['id'], json.dumps(record, ensure_ascii=False, default=str), record['finished']))
+        now = time.time()
+        if now - self._last_prune > 60:
+            db.execute('DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?', (now - self.ttl,))
+            self._last_prune = now
+
+    def get(self, job_id):
+        row = self._db().execute('SELECT record FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+class JobQueue:
+    """Priority queue of LLM jobs executed by a bounded pool of threads.
+
+    Web requests submit the slow part of their work (the model call and what
+    depends on its reply) and either wait for it or hand the client a job id
+    to poll, so request threads are no longer tied up by generations. Jobs
+    run in the process that accepted them; their records go to ``store`` so
+    pollers can read them (SqliteJobStore when there are several workers).
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, store=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.store = store if store is not None else MemoryJobStore()
+        self._heap = []
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._pid = None
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.queue_time = 0.0
+        self.run_time = 0.0
+
+    def _ensure_workers(self):
+        # threads do not survive a fork: start the pool in each gunicorn worker
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._heap = []
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True).start()
+
+    def submit(self, kind, fn, *args, priority=None):
+        job = Job(kind, fn, args, PRIORITY.get(kind, 1) if priority is None else priority)
+        with self._cond:
+            self._ensure_workers()
+            if len(self._heap) >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull(f'{len(self._heap)} jobs pending')
+            heapq.heappush(self._heap, (job.priority, next(self._seq), job))
+            self._cond.notify()
+        self.store.save(job.to_dict())
+        return job
+
+    def full(self):
+        """True when submit() would refuse a job right now."""
+        with self._cond:
+            return len(self._heap) >= self.max_pending
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._heap)
+                self.running += 1
+            job.status, job.started = 'running', time.time()
+            try:
+                self.store.save(job.to_dict())
+                job.result, job.http_status = job.fn(*job.args)
+                job.status = 'done'
+            except Exception as e:
+                print(f"[JOBS] {job.kind} {job.id} failed: {e}")
+                job.status, job.error, job.http_status = 'error', str(e), 500
+            job.finished = time.time()
+            job.fn = job.args = None
+            try:
+                self.store.save(job.to_dict())
+            except Exception as e:
+                print(f"[JOBS] could not store {job.id}: {e}")
+            with self._cond:
+                self.running -= 1
+                if job.status == 'done':
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.queue_time += job.started - job.created
+                self.run_time += job.finished - job.started
+            job._done.set()
+
+    def get(self, job_id, wait=0.0):
+        """Job record, polling the store up to ``wait`` seconds for it to finish."""
+        deadline = time.monotonic() + wait
+        while True:
+            record = self.store.get(job_id)
+            if record is None or record['status'] in ('done', 'error') or time.monotonic() >= deadline:
+                return record
+            time.sleep(min(0.1, max(0.0, deadline - time.monotonic())))
+
+    def stats(self):
+        with self._cond:
+            pending = {}
+            for _, _, job in self._heap:
+                pending[job.kind] = pending.get(job.kind, 0) + 1
+            finished = self.completed + self.failed
+            return {
+                'workers': self.workers,
+                'pending': pending,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'avg_queue_ms': round(self.queue_time / finished * 1000, 1) if finished else 0.0,
+                'avg_run_ms': round(self.run_time / finished * 1000, 1) if finished else 0.0,
+                'store': type(self.store).__name__,
+            }
+
+
+_jobs = None
+
+
+def get_jobs():
+    """Process-wide job queue configured from the environment."""
+    global _jobs
+    if _jobs is None:
+        _jobs = JobQueue(store=SqliteJobStore(JOB_STORE_PATH) if JOB_STORE_PATH else None)
+    return _jobs
+
+
+def wants_async():
+    """Client asked for a job id instead of waiting (Prefer: respond-async, ?async=1 or "async": true)."""
+    if 'respond-async' in request.headers.get('Prefer', '') or request.args.get('async') in ('1', 'true'):
+        return True
+    body = request.get_json(silent=True)
+    return isinstance(body, dict) and body.get('async') is True
+
+
+def busy_response():
+    """503 answer for a job the queue has no room for."""
+    return jsonify({'error': 'server busy, try again shortly'}), 503, {'Retry-After': '5'}
+
+
+def job_response(kind, fn, *args, on_refused=None):
+    """Run ``fn(*args) -> (body, status)`` on the job pool and build the Flask response.
+
+    Async clients get 202 with the job id at once; the others wait for the
+    job (up to JOB_WAIT_TIMEOUT, then 202 as well) and get its body.
+    ``on_refused`` is called when the queue is full, to undo what the request
+    already did before submitting.
+    """
+    try:
+        job = get_jobs().submit(kind, fn, *args)
+    except QueueFull as e:
+        print(f"[JOBS] {kind} refused: {e}")
+        if on_refused is not None:
+            on_refused()
+        return busy_response()
+    if wants_async() or not job.wait(JOB_WAIT_TIMEOUT):
+        return jsonify({'job_id': job.id, 'status': job.status, 'poll': f'/api/jobs/{job.id}'}), 202
+    if job.status == 'error':
+        return jsonify({'error': 'job failed', 'detail': job.error}), 500
+    return jsonify(job.result), job.http_status
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from embedder import normalize_text
+
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', '1') != '0'
+LLM_CACHE_TTL = float(os.environ.get('LLM_CACHE_TTL', '3600'))
+LLM_CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+# optional SQLite file shared by every worker; empty = memory only
+LLM_CACHE_PATH = os.environ.get('LLM_CACHE_PATH', '')
+
+
+def normalize_prompt(text):
+    """Case, accents and whitespace folded, so trivially different prompts share a key."""
+    return ' '.join(normalize_text(text).split()).strip(' .!?¡¿')
+
+
+def state_bucket(character):
+    """Coarse character state for cache keys: nearby states share generations."""
+    if not character:
+        return None
+    try:
+        life = float(character.get('lifePercent', 1.0))
+        if life > 1:
+            life /= 100.0
+    except (TypeError, ValueError):
+        life = 1.0
+    def magnitude(value):
+        # doubling steps: 0, 1, 2-3, 4-7, ... (negatives share the 0 bucket)
+        try:
+            return max(0, int(value or 0)).bit_length()
+        except (TypeError, ValueError):
+            return 0
+
+    return {
+        'universe': character.get('currentUniverse'),
+        'life': round(life * 4),  # quarters
+        'points': magnitude(character.get('points')),
+        'money': magnitude(character.get('money')),
+    }
+
+
+def generation_key(model, prompt, rules=None, state=None, normalize=True):
+    """Cache key for one generation: model, normalized prompt, universe rules, state bucket."""
+    parts = [model, normalize_prompt(prompt) if normalize else prompt, rules or {}, state]
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """TTL + LRU cache of LLM responses, capped in bytes.
+
+    Entries live in an in-process OrderedDict (least recently used first);
+    with ``path`` set they are also written to a small SQLite table so other
+    gunicorn workers and restarts can reuse them.
+    """
+
+    def __init__(self, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES, path=LLM_CACHE_PATH):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.path = path
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            self._db().execute('CREATE TABLE IF NOT EXISTS llm_cache '
+                               '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, size INTEGER NOT NULL)')
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _drop(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def _store(self, key, value, expires):
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (expires, value)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(entry[1])
+                self._drop(key)
+        if self.path:
+            row = self._db().execute('SELECT value, expires FROM llm_cache WHERE key = ? AND expires > ?',
+                                     (key, now)).fetchone()
+            if row is not None:
+                with self._lock:
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                return json.loads(row[0])
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        text = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        if len(text) > self.max_bytes:
+            return
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._store(key, text, expires)
+        if self.path:
+            db = self._db()
+            db.execute('INSERT OR REPLACE INTO llm_cache (key, value, expires, size) VALUES (?, ?, ?, ?)',
+                       (key, text, expires, len(text)))
+            db.execute('DELETE FROM llm_cache WHERE expires <= ?', (time.time(),))
+            total = db.execute('SELECT COALESCE(SUM(size), 0) FROM llm_cache').fetchone()[0]
+            if total > self.max_bytes:
+                # oldest first (they expire first)
+                db.execute('DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY expires '
+                           'LIMIT (SELECT COUNT(*) / 4 + 1 FROM llm_cache))')
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'evictions': self.evictions,
+                'persistent': bool(self.path),
+            }
+
+
+_cache = None
+
+
+def get_cache():
+    """Process-wide cache configured from the environment, or None if disabled."""
+    global _cache
+    if _cache is None and LLM_CACHE_ENABLED:
+        _cache = LLMCache()
+    return _cache
@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_cache import get_cache
+from singleflight import get_singleflight
+
+OLLAMA_BASE_URL = os.environ.get('OLLAMA_BASE_URL', 'https://ollama.com')
+# keep-alive pool: hosts kept and connections kept per host
+LLM_POOL_CONNECTIONS = int(os.environ.get('LLM_POOL_CONNECTIONS', '4'))
+LLM_POOL_MAXSIZE = int(os.environ.get('LLM_POOL_MAXSIZE', '16'))
+LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', '5'))
+# overall deadline of one call, retries included
+LLM_DEADLINE = float(os.environ.get('LLM_DEADLINE', '60'))
+LLM_RETRIES = int(os.environ.get('LLM_RETRIES', '2'))
+LLM_BACKOFF = float(os.environ.get('LLM_BACKOFF', '0.5'))
+
+# opt-in: send the reply's JSON schema as 'format' (constrained decoding) instead of relying on the prompt
+LLM_STRUCTURED_OUTPUT = os.environ.get('LLM_STRUCTURED_OUTPUT', '0') == '1'
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# answers of a server that does not understand a schema in 'format'
+FORMAT_UNSUPPORTED_STATUS = {400, 415, 422, 501}
+
+
+# 'provider' of the stand-in replies of llm_providers.OfflineProvider
+OFFLINE_PROVIDER = 'offline'
+
+
+class LLMError(Exception):
+    pass
+
+
+def offline_reply(data):
+    """True for a stand-in reply no model generated: never cached, shared or learned from."""
+    return (data or {}).get('provider') == OFFLINE_PROVIDER
+
+
+def message_text(data):
+    """Reply text of an /api/chat response; falls back to the model's 'thinking'."""
+    msg = data.get('message') or {}
+    return msg.get('content') or msg.get('thinking') or ''
+
+
+def _cacheable(data):
+    return {k: data[k] for k in ('model', 'message', 'eval_count', 'prompt_eval_count') if k in data}
+
+
+class LLMClient:
+    """Pooled HTTP client for the Ollama chat API.
+
+    The sync path reuses one keep-alive ``requests.Session`` per process (so
+    calls stop paying TCP+TLS setup); the async path uses a shared
+    ``httpx.AsyncClient``. Both enforce a per-call deadline across retries and
+    back off with full jitter on connection errors and 429/5xx answers.
+    """
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, api_key=None, pool_connections=LLM_POOL_CONNECTIONS,
+                 pool_maxsize=LLM_POOL_MAXSIZE, deadline=LLM_DEADLINE, retries=LLM_RETRIES, backoff=LLM_BACKOFF,
+                 structured=LLM_STRUCTURED_OUTPUT):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key if api_key is not None else os.environ.get('OLLAMA_API_KEY')
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.structured = structured
+        self.format_supported = None  # unknown until the first structured call
+        self._session = None
+        self._pid = None
+        self._session_lock = threading.Lock()
+        self._async_client = None
+        self._async_loop = None
+
+    def _headers(self):
+        return {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+
+    def session(self):
+        # sessions must not be shared across a fork (gunicorn workers)
+        if self._session is None or self._pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._pid != os.getpid():
+                    s = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                    s.mount('http://', adapter)
+                    s.mount('https://', adapter)
+                    self._session, self._pid = s, os.getpid()
+        return self._session
+
+    def _sleep_for(self, attempt, remaining):
+        return min(random.uniform(0, self.backoff * (2 ** attempt)), max(0.0, remaining))
+
+    def post(self, path, payload, deadline=None, endpoint=None):
+        """POST JSON and return the decoded answer, retrying within the deadline.
+
+        ``endpoint`` names the app feature making the call (see
+        llm_providers.ENDPOINTS); a single server ignores it, the provider
+        router picks each provider's model for it.
+        """
+        r = self._send(path, payload, time.monotonic(), deadline or self.deadline)
+        return r.json()
+
+    def _send(self, path, payload, start, deadline, stream=False):
+        url = self.base_url + path
+        last = None
+        attempt = 0
+        for attempt in range(self.retries + 1):
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            try:
+                r = self.session().post(url, json=payload, headers=self._headers(), stream=stream,
+                                        timeout=(min(LLM_CONNECT_TIMEOUT, remaining), remaining))
+                if r.status_code not in RETRY_STATUS:
+                    r.raise_for_status()
+                    return r
+                r.close()
+                last = LLMError(f'{url} answered {r.status_code}')
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last = e
+            if attempt < self.retries:
+                time.sleep(self._sleep_for(attempt, deadline - (time.monotonic() - start)))
+        raise LLMError(f'{url} failed after {attempt + 1} attempt(s): {last}') from last
+
+    def _cache_lookup(self, cache_key, options, extra):
+        """(cache, full key, cached response) for a call.
+
+        The key is None without ``cache_key``; cache is None when not caching,
+        even if the call has a key (single-flight still uses it).
+        """
+        if cache_key is None:
+            return None, None, None
+        raw = json.dumps([cache_key, options or {}, extra], sort_keys=True, default=str)
+        key = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+        cache = get_cache()
+        hit = cache.get(key) if cache is not None else None
+        if hit is not None:
+            hit['cached'] = True
+        return cache, key, hit
+
+    def chat(self, model, messages, options=None, deadline=None, cache_key=None, endpoint=None, **extra):
+        """Non-streaming /api/chat call.
+
+        With ``cache_key`` (see llm_cache.generation_key) concurrent calls
+        with the same key share one request (see singleflight), and successful
+        answers are served from and stored in the generation cache when it is
+        enabled. Answers that
+        were not generated for this call carry ``'cached': True``; offline
+        stand-ins (see offline_reply) are neither cached nor shared.
+        """
+        cache, key, hit = self._cache_lookup(cache_key, options, extra)
+        if hit is not None:
+            return hit
+        payload = {'model': model, 'messages': messages, 'stream': False, **extra}
+        if options:
+            payload['options'] = options
+        if key is None:
+            return self.post('/api/chat', payload, deadline, endpoint)
+
+        def call():
+            data = self.post('/api/chat', payload, deadline, endpoint)
+            if cache is not None and message_text(data) and not offline_reply(data):
+                cache.put(key, _cacheable(data))
+            return data
+
+        data, shared = get_singleflight().do(key, call, timeout=deadline or self.deadline,
+                                             share=lambda d: not offline_reply(d))
+        if shared:
+            data['cached'] = True
+        return data
+
+    def chat_json(self, model, messages, schema, options=None, deadline=None, cache_key=None, endpoint=None):
+        """chat() asking for a reply that follows the JSON ``schema``; returns (response, structured).
+
+        With structured output on, the schema goes in the 'format' field and
+        the server constrains generation to it. A server that rejects the
+        field is remembered and this falls back to a plain chat() (the
+        prompt alone asks for JSON), as it does with structured output off;
+        ``structured`` says which of the two the response came from.
+        """
+        if self.structured and self.format_supported is not False:
+            try:
+                data = self.chat(model, messages, options, deadline, cache_key, endpoint, format=schema)
+                self.format_supported = True
+                return data, True
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status not in FORMAT_UNSUPPORTED_STATUS:
+                    raise
+                print(f"[LLM] {self.base_url} no acepta un esquema en 'format' ({status}); sólo prompt desde ahora")
+                self.format_supported = False
+        return self.chat(model, messages, options, deadline, cache_key, endpoint), False
+
+    def chat_stream(self, model, messages, options=None, deadline=None, cache_key=None, endpoint=None, **extra):
+        """Yield the NDJSON chunks of a streaming /api/chat call as they arrive.
+
+        Retries only happen before the first byte; once streaming, the deadline
+        bounds every read and the stream as a whole. A cached generation is
+        replayed as a single final chunk.
+        """
+        cache, key, hit = self._cache_lookup(cache_key, options, extra)
+        if hit is not None:
+            yield {**hit, 'done': True}
+            return
+        content, thinking = [], []
+        payload = {'model': model, 'messages': messages, 'stream': True, **extra}
+        if options:
+            payload['options'] = options
+        for chunk in self.stream_chunks(payload, deadline or self.deadline, endpoint):
+            msg = chunk.get('message') or {}
+            content.append(msg.get('content') or '')
+            thinking.append(msg.get('thinking') or '')
+            yield chunk
+            if chunk.get('done'):
+                if cache is not None and (any(content) or any(thinking)) and not offline_reply(chunk):
+                    full = {'role': 'assistant', 'content': ''.join(content), 'thinking': ''.join(thinking)}
+                    cache.put(key, _cacheable({**chunk, 'message': full}))
+                return
+
+    def stream_chunks(self, payload, deadline, endpoint=None):
+        """Decoded NDJSON chunks of a streaming /api/chat call, up to the 'done' one."""
+        start = time.monotonic()
+        with self._send('/api/chat', payload, start, deadline, stream=True) as r:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise LLMError(chunk['error'])
+                yield chunk
+                if chunk.get('done'):
+                    return
+                if time.monotonic() - start > deadline:
+                    raise LLMError(f'{self.base_url}/api/chat stream exceeded its {deadline}s deadline')
+
+    def async_client(self):
+        import httpx
+        loop = asyncio.get_running_loop()
+        # an AsyncClient is bound to the loop that created it
+        if self._async_client is None or self._async_loop is not loop:
+            limits = httpx.Limits(max_connections=self.pool_maxsize, max_keepalive_connections=self.pool_maxsize)
+            self._async_client = httpx.AsyncClient(limits=limits, headers=self._headers())
+            self._async_loop = loop
+        return self._async_client
+
+    async def apost(self, path, payload, deadline=None, endpoint=None):
+        import httpx
+        url = self.base_url + path
+        start = time.monotonic()
+        deadline = deadline or self.deadline
+        last = None
+        attempt = 0
+        for attempt in range(self.retries + 1):
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            try:
+                timeout = httpx.Timeout(remaining, connect=min(LLM_CONNECT_TIMEOUT, remaining))
+                r = await self.async_client().post(url, json=payload, timeout=timeout)
+                if r.status_code not in RETRY_STATUS:
+                    r.raise_for_status()
+                    return r.json()
+                last = LLMError(f'{url} answered {r.status_code}')
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                last = e
+            if attempt < self.retries:
+                await asyncio.sleep(self._sleep_for(attempt, deadline - (time.monotonic() - start)))
+        raise LLMError(f'{url} failed after {attempt + 1} attempt(s): {last}') from last
+
+    async def achat(self, model, messages, options=None, deadline=None, endpoint=None, **extra):
+        payload = {'model': model, 'messages': messages, 'stream': False, **extra}
+        if options:
+            payload['options'] = options
+        return await self.apost('/api/chat', payload, deadline, endpoint)
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def stats(self):
+        return {'base_url': self.base_url, 'structured': self.structured, 'format_supported': self.format_supported}
+
+
+_client = None
+
+
+def get_client():
+    """Process-wide client configured from the environment.
+
+    One Ollama server (OLLAMA_BASE_URL) unless LLM_PROVIDERS lists several
+    providers, which are then routed by llm_providers.ProviderRouter.
+    """
+    global _client
+    if _client is None:
+        # the providers subclass LLMClient, hence the late import
+        from llm_providers import LLM_PROVIDERS, build_router
+        _client = build_router(LLM_PROVIDERS) if LLM_PROVIDERS else LLMClient()
+    return _client
@@ -0,0 +1,463 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+
+import requests
+
+from llm_client import FORMAT_UNSUPPORTED_STATUS, LLM_RETRIES, LLM_STRUCTURED_OUTPUT, OFFLINE_PROVIDER, OLLAMA_BASE_URL, LLMClient, LLMError
+
+# providers in order of preference, e.g. 'ollama_local,ollama_cloud,offline';
+# an entry may carry its own URL ('ollama_local@http://10.0.0.5:11434'). Empty = OLLAMA_BASE_URL only
+LLM_PROVIDERS = os.environ.get('LLM_PROVIDERS', '')
+OLLAMA_LOCAL_URL = os.environ.get('OLLAMA_LOCAL_URL', 'http://127.0.0.1:11434')
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com')
+# seconds between background health checks (0 = only the first one) and timeout of each probe
+LLM_HEALTH_INTERVAL = float(os.environ.get('LLM_HEALTH_INTERVAL', '30'))
+LLM_HEALTH_TIMEOUT = float(os.environ.get('LLM_HEALTH_TIMEOUT', '2'))
+# retries on one provider before failing over to the next
+LLM_FAILOVER_RETRIES = int(os.environ.get('LLM_FAILOVER_RETRIES', '0'))
+
+# features that call the LLM; LLM_MODELS_<KIND> picks a model per feature,
+# e.g. LLM_MODELS_OLLAMA_LOCAL='llama3.2:3b,translate=qwen2.5:1.5b'
+ENDPOINTS = ('narrative', 'mission', 'message', 'translate')
+DEFAULT_MODELS = {'openai': 'gpt-4o-mini'}
+
+# weight of the newest sample in the moving average of a provider's latency
+LATENCY_ALPHA = 0.3
+
+OPENAI_CHAT_PATH = '/v1/chat/completions'
+
+
+def parse_models(spec):
+    """{'default': model, endpoint: model} from 'model,endpoint=model,...'."""
+    models = {}
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        endpoint, sep, model = item.partition('=')
+        if not sep:
+            endpoint, model = 'default', endpoint
+        if endpoint != 'default' and endpoint not in ENDPOINTS:
+            raise ValueError(f'unknown LLM endpoint {endpoint!r} (expected one of {", ".join(ENDPOINTS)})')
+        models[endpoint] = model.strip()
+    return models
+
+
+class HTTPProvider(LLMClient, ABC):
+    """An LLM server reached over HTTP, with its own pool and a model per endpoint."""
+
+    kind = None
+    offline = False
+
+    def __init__(self, name, base_url, api_key=None, models=None, **kwargs):
+        super().__init__(base_url, api_key, **kwargs)
+        self.name = name
+        self.models = models or {}
+
+    def model_for(self, endpoint, model):
+        return self.models.get(endpoint) or self.models.get('default') or model
+
+    @abstractmethod
+    def health(self, timeout):
+        """Raise if the server cannot take calls now."""
+
+
+class OllamaProvider(HTTPProvider):
+    """Ollama's own API: a local server or ollama.com."""
+
+    kind = 'ollama'
+
+    def health(self, timeout):
+        r = self.session().get(self.base_url + '/api/tags', headers=self._headers(), timeout=timeout)
+        r.raise_for_status()
+        served = {m.get('name') for m in r.json().get('models', [])}
+        # only models named in the configuration can be checked; others are whatever the caller asks for
+        missing = sorted(m for m in set(self.models.values()) if m not in served and f'{m}:latest' not in served)
+        if missing:
+            raise LLMError(f"{self.base_url} does not serve {', '.join(missing)}")
+
+
+class OpenAIProvider(HTTPProvider):
+    """OpenAI-compatible /v1/chat/completions (OpenAI, Groq, vLLM, llama.cpp, LM Studio...).
+
+    Requests and answers are translated to and from Ollama's /api/chat
+    shape, so callers and the generation cache see one format.
+    """
+
+    kind = 'openai'
+
+    def _request(self, payload):
+        options = payload.get('options') or {}
+        body = {'model': payload['model'], 'messages': payload['messages'], 'stream': bool(payload.get('stream'))}
+        if 'temperature' in options:
+            body['temperature'] = options['temperature']
+        if 'num_predict' in options:
+            body['max_tokens'] = options['num_predict']
+        fmt = payload.get('format')
+        if isinstance(fmt, dict):
+            body['response_format'] = {'type': 'json_schema', 'json_schema': {'name': 'reply', 'schema': fmt}}
+        elif fmt == 'json':
+            body['response_format'] = {'type': 'json_object'}
+        return body
+
+    @staticmethod
+    def _response(data):
+        choice = (data.get('choices') or [{}])[0]
+        usage = data.get('usage') or {}
+        return {'model': data.get('model'),
+                'message': {'role': 'assistant', 'content': (choice.get('message') or {}).get('content') or ''},
+                'done': True,
+                'prompt_eval_count': usage.get('prompt_tokens'),
+                'eval_count': usage.get('completion_tokens')}
+
+    def post(self, path, payload, deadline=None, endpoint=None):
+        return self._response(super().post(OPENAI_CHAT_PATH, self._request(payload), deadline))
+
+    async def apost(self, path, payload, deadline=None, endpoint=None):
+        return self._response(await super().apost(OPENAI_CHAT_PATH, self._request(payload), deadline))
+
+    def stream_chunks(self, payload, deadline, endpoint=None):
+        start = time.monotonic()
+        with self._send(OPENAI_CHAT_PATH, self._request(payload), start, deadline, stream=True) as r:
+            # server-sent events: 'data: {...}' lines, then 'data: [DONE]'
+            for line in r.iter_lines():
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                chunk = json.loads(data)
+                if chunk.get('error'):
+                    raise LLMError(chunk['error'])
+                delta = (chunk.get('choices') or [{}])[0].get('delta') or {}
+                if delta.get('content'):
+                    yield {'model': chunk.get('model'), 'message': {'role': 'assistant', 'content': delta['content']},
+                           'done': False}
+                if time.monotonic() - start > deadline:
+                    raise LLMError(f'{self.base_url}{OPENAI_CHAT_PATH} stream exceeded its {deadline}s deadline')
+        yield {'model': payload['model'], 'message': {'role': 'assistant', 'content': ''}, 'done': True}
+
+    def health(self, timeout):
+        self.session().get(self.base_url + '/v1/models', headers=self._headers(),
+                           timeout=timeout).raise_for_status()
+
+
+_OFFLINE_SCENES = (
+    'El entorno reacciona a tu decisión y descubres una pista que te acerca a tu objetivo.',
+    'Un aliado inesperado aparece en el momento justo, aunque el esfuerzo te deja agotado.',
+    'La situación se complica: un rival se adelanta, pero consigues salir con algo de valor.',
+    'Tras un momento de duda, la jugada sale bien y el camino queda despejado.',
+)
+_OFFLINE_CHOICES = (
+    ('Seguir explorando', 'Volver al campamento'),
+    ('Pedir ayuda a un aliado', 'Actuar en solitario'),
+    ('Investigar la pista', 'Ignorarla y avanzar'),
+)
+
+
+class OfflineProvider:
+    """Deterministic answers without any network, so the app runs and benchmarks offline.
+
+    The same prompt always gets the same reply: a JSON object that follows
+    reply_parser.REPLY_SCHEMA (narrative and choices drawn from a hash of the
+    prompt, no effects), or the text itself for translations. The router
+    tries it after every network provider. Replies carry ``'provider':
+    'offline'`` so they are never cached, shared or learned from
+    (llm_client.offline_reply).
+    """
+
+    name = OFFLINE_PROVIDER
+    kind = OFFLINE_PROVIDER
+    offline = True
+    models = {}
+
+    def model_for(self, endpoint, model):
+        return 'offline'
+
+    def health(self, timeout):
+        pass
+
+    def reply(self, payload, endpoint=None):
+        user = [m.get('content') or '' for m in payload.get('messages', []) if m.get('role') == 'user']
+        text = user[-1] if user else ''
+        if endpoint == 'translate':
+            return text
+        rng = random.Random(hashlib.sha256(text.encode('utf-8')).digest())
+        # the player's action closes the narrative prompts
+        action = text.rsplit('Student action:', 1)[-1].strip()[:80]
+        return json.dumps({
+            # no model judged the action: a stand-in must not reward or hurt real characters
+            'effects': {},
+            'narrative': f'Decides: «{action}». {rng.choice(_OFFLINE_SCENES)}',
+            'choices': list(rng.choice(_OFFLINE_CHOICES)),
+        }, ensure_ascii=False)
+
+    def post(self, path, payload, deadline=None, endpoint=None):
+        content = self.reply(payload, endpoint)
+        return {'model': 'offline', 'provider': OFFLINE_PROVIDER,
+                'message': {'role': 'assistant', 'content': content}, 'done': True,
+                'prompt_eval_count': sum(len((m.get('content') or '').split()) for m in payload.get('messages', [])),
+                'eval_count': len(content.split())}
+
+    async def apost(self, path, payload, deadline=None, endpoint=None):
+        return self.post(path, payload, deadline, endpoint)
+
+    def stream_chunks(self, payload, deadline, endpoint=None):
+        content = self.reply(payload, endpoint)
+        for i in range(0, len(content), 16):
+            yield {'model': 'offline', 'provider': OFFLINE_PROVIDER,
+                   'message': {'role': 'assistant', 'content': content[i:i + 16]}, 'done': False}
+        yield {'model': 'offline', 'provider': OFFLINE_PROVIDER, 'message': {'role': 'assistant', 'content': ''},
+               'done': True, 'eval_count': len(content.split())}
+
+    async def aclose(self):
+        pass
+
+
+class _Health:
+    __slots__ = ('healthy', 'rtt', 'latency', 'calls', 'failures', 'error')
+
+    def __init__(self):
+        self.healthy = None  # unknown until checked or used
+        self.rtt = None  # health probe round trip, seconds
+        self.latency = None  # moving average of answered calls, seconds
+        self.calls = 0
+        self.failures = 0
+        self.error = None
+
+
+class ProviderRouter(LLMClient):
+    """LLMClient over several providers: the fastest healthy one answers, the rest are failover.
+
+    Providers are ranked healthy first, the offline stub after every network
+    provider, then by measured latency: the moving average of their answered
+    calls, or the health probe's round trip for one not used yet. A provider
+    that fails a call is marked unhealthy and the call moves on to the next
+    within the same deadline; a streamed call only fails over before its
+    first chunk. A provider rejecting the schema in 'format' ends the call
+    instead: chat_json then turns structured output off and asks again
+    without it, rather than letting a lower-ranked provider (or the offline
+    stub) answer every structured call. Health probes run once on first use and then every
+    ``health_interval`` seconds in a background thread. Caching, single-flight
+    and structured output work as in LLMClient, above the routing.
+    """
+
+    def __init__(self, providers, health_interval=LLM_HEALTH_INTERVAL, health_timeout=LLM_HEALTH_TIMEOUT, **kwargs):
+        if not providers:
+            raise ValueError('ProviderRouter needs at least one provider')
+        super().__init__('providers:' + ','.join(p.name for p in providers), api_key='', **kwargs)
+        self.providers = list(providers)
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._health = {p.name: _Health() for p in self.providers}
+        self._lock = threading.Lock()
+        self._monitor_pid = None
+
+    def check(self):
+        """Probe every provider in parallel; updates health and round-trip times."""
+        threads = [threading.Thread(target=self._probe, args=(p,), daemon=True) for p in self.providers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(self.health_timeout + 1)
+
+    def _probe(self, provider):
+        t0 = time.monotonic()
+        try:
+            provider.health(self.health_timeout)
+            error = None
+        except Exception as e:
+            error = e
+        rtt = time.monotonic() - t0
+        with self._lock:
+            h = self._health[provider.name]
+            h.healthy = error is None
+            h.rtt = rtt if error is None else None
+            if error is not None:
+                h.error = str(error)[:200]
+                print(f"[LLM] proveedor {provider.name} no disponible: {h.error}")
+
+    def _monitor(self):
+        while True:
+            time.sleep(self.health_interval)
+            self.check()
+
+    def _ensure_monitor(self):
+        # threads do not survive a fork: each gunicorn worker starts its own
+        if self._monitor_pid == os.getpid():
+            return
+        with self._lock:
+            if self._monitor_pid == os.getpid():
+                return
+            self._monitor_pid = os.getpid()
+        self.check()
+        if self.health_interval > 0:
+            threading.Thread(target=self._monitor, daemon=True).start()
+
+    def _order(self):
+        with self._lock:
+            def rank(i):
+                p = self.providers[i]
+                h = self._health[p.name]
+                latency = h.latency if h.latency is not None else h.rtt
+                return (h.healthy is False, p.offline, latency if latency is not None else float('inf'), i)
+            return [self.providers[i] for i in sorted(range(len(self.providers)), key=rank)]
+
+    def ranked(self):
+        """Providers in the order a call tries them."""
+        self._ensure_monitor()
+        return self._order()
+
+    def _attempts(self, payload, deadline, endpoint):
+        start = time.monotonic()
+        for p in self.ranked():
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                return
+            yield p, {**payload, 'model': p.model_for(endpoint, payload.get('model'))}, remaining
+
+    def _answered(self, provider, elapsed):
+        with self._lock:
+            h = self._health[provider.name]
+            h.calls += 1
+            h.healthy = True
+            h.latency = elapsed if h.latency is None else (1 - LATENCY_ALPHA) * h.latency + LATENCY_ALPHA * elapsed
+
+    def _failed(self, provider, error):
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+        with self._lock:
+            h = self._health[provider.name]
+            h.calls += 1
+            h.failures += 1
+            h.error = str(error)[:200]
+            # a 4xx is about this request (unknown model, rejected 'format'), not the server being down
+            if status is None or status >= 500:
+                h.healthy = False
+        print(f"[LLM] {provider.name} falló ({h.error}); probando el siguiente proveedor")
+
+    @staticmethod
+    def _rejects_format(body, error):
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+        return 'format' in body and status in FORMAT_UNSUPPORTED_STATUS
+
+    def _exhausted(self, last):
+        # an HTTP error goes up as is: chat_json tells a rejected 'format' by its status
+        if isinstance(last, requests.HTTPError):
+            return last
+        return LLMError(f'no LLM provider answered: {last}')
+
+    def post(self, path, payload, deadline=None, endpoint=None):
+        last = None
+        for p, body, remaining in self._attempts(payload, deadline or self.deadline, endpoint):
+            t0 = time.monotonic()
+            try:
+                data = p.post(path, body, remaining, endpoint)
+            except Exception as e:
+                if self._rejects_format(body, e):
+                    raise
+                self._failed(p, e)
+                last = e
+                continue
+            self._answered(p, time.monotonic() - t0)
+            return data
+        raise self._exhausted(last)
+
+    async def apost(self, path, payload, deadline=None, endpoint=None):
+        last = None
+        for p, body, remaining in self._attempts(payload, deadline or self.deadline, endpoint):
+            t0 = time.monotonic()
+            try:
+                data = await p.apost(path, body, remaining, endpoint)
+            except Exception as e:
+                if self._rejects_format(body, e):
+                    raise
+                self._failed(p, e)
+                last = e
+                continue
+            self._answered(p, time.monotonic() - t0)
+            return data
+        raise self._exhausted(last)
+
+    def stream_chunks(self, payload, deadline, endpoint=None):
+        last = None
+        for p, body, remaining in self._attempts(payload, deadline, endpoint):
+            t0 = time.monotonic()
+            chunks = p.stream_chunks(body, remaining, endpoint)
+            try:
+                first = next(chunks)
+            except Exception as e:
+                if self._rejects_format(body, e):
+                    raise
+                self._failed(p, e if not isinstance(e, StopIteration) else LLMError('empty stream'))
+                last = e
+                continue
+            chunk = first
+            try:
+                # recorded before the 'done' chunk goes out: callers stop reading there
+                while not chunk.get('done'):
+                    yield chunk
+                    chunk = next(chunks, {'done': True})
+            except Exception as e:
+                self._failed(p, e)
+                raise
+            self._answered(p, time.monotonic() - t0)
+            if chunk.get('message') is not None:
+                yield chunk
+            return
+        raise self._exhausted(last)
+
+    async def aclose(self):
+        for p in self.providers:
+            await p.aclose()
+
+    def stats(self):
+        out = super().stats()
+        providers = []
+        for p in self._order():
+            with self._lock:
+                h = self._health[p.name]
+                providers.append({
+                    'name': p.name,
+                    'kind': p.kind,
+                    'url': getattr(p, 'base_url', None),
+                    'models': p.models,
+                    'healthy': h.healthy,
+                    'rtt_ms': round(h.rtt * 1000, 1) if h.rtt is not None else None,
+                    'latency_ms': round(h.latency * 1000, 1) if h.latency is not None else None,
+                    'calls': h.calls,
+                    'failures': h.failures,
+                    'last_error': h.error,
+                })
+        out['providers'] = providers  # in routing order
+        return out
+
+
+def make_provider(entry, **kwargs):
+    """Provider for one LLM_PROVIDERS entry: 'kind' or 'kind@url'."""
+    kind, _, url = entry.strip().partition('@')
+    models = parse_models(os.environ.get(f'LLM_MODELS_{kind.upper()}', DEFAULT_MODELS.get(kind, '')))
+    name = entry.strip()
+    if kind == 'ollama_local':
+        # a local server needs no key: never send it the ollama.com one
+        return OllamaProvider(name, url or OLLAMA_LOCAL_URL, '', models, **kwargs)
+    if kind == 'ollama_cloud':
+        return OllamaProvider(name, url or OLLAMA_BASE_URL, None, models, **kwargs)
+    if kind == 'openai':
+        return OpenAIProvider(name, url or OPENAI_BASE_URL, os.environ.get('OPENAI_API_KEY', ''), models, **kwargs)
+    if kind == 'offline':
+        return OfflineProvider()
+    raise ValueError(f'unknown LLM provider {kind!r} (expected ollama_local, ollama_cloud, openai or offline)')
+
+
+def build_router(spec, structured=LLM_STRUCTURED_OUTPUT):
+    """ProviderRouter for a comma-separated LLM_PROVIDERS value."""
+    entries = [entry for entry in spec.split(',') if entry.strip()]
+    # a lone provider has nothing to fail over to: it keeps LLMClient's retries
+    retries = LLM_FAILOVER_RETRIES if len(entries) > 1 else LLM_RETRIES
+    providers = [make_provider(entry, retries=retries) for entry in entries]
+    return ProviderRouter(providers, structured=structured)
@@ -1,31 +1,305 @@
+import os
+import re
+import math
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import Counter
+
+from embedder import normalize_text
+
+# índice en disco compartido por todos los workers; vacío = sólo en memoria (por proceso)
+KB_PATH = os.environ.get('KB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'knowledge.db'))
+# entradas máximas; al pasarse se expulsan las menos útiles
+KB_MAX_ENTRIES = int(os.environ.get('KB_MAX_ENTRIES', '20000'))
+# parámetros de BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+# candidatos de BM25 que se puntúan con la similitud normalizada
+CANDIDATES = 10
+
+_WORD = re.compile(r'\w+')
+# palabras vacías frecuentes: no distinguen textos y alargan las listas de postings
+STOPWORDS = frozenset(
+    'a al algo con de del el ella en es esta este hay la las le lo los mas me mi muy no o para pero por que '
+    'se si sin su sus te tu un una uno y ya the and of to in is it you'.split()
+)
+
+
+def terms(text):
+    """Términos de un texto: minúsculas, sin tildes y sin palabras vacías."""
+    return [w for w in _WORD.findall(normalize_text(text)) if w not in STOPWORDS]
+
+
+def _digest(words):
+    return hashlib.blake2b(' '.join(words).encode('utf-8'), digest_size=16).digest()
+
+
+def _prepare(text):
+    """(narrativa, términos, huella) de una entrada nueva; términos vacíos si no hay nada que indexar."""
+    # Solo almacena el texto relevante (narrativa)
+    narrative = text
+    if '\nN:' in text:
+        parts = text.split('\nN:', 1)
+        narrative = parts[1].strip()
+    words = terms(narrative)
+    return narrative, words, _digest(words) if words else None
+
+
+def _jaccard(qset, tset):
+    inter = len(qset & tset)
+    return inter / (len(qset) + len(tset) - inter + 1e-6)
+
+
+class _Entry:
+    __slots__ = ('text', 'tf', 'length', 'digest', 'hits', 'last_used')
+
+    def __init__(self, text, tf, digest):
+        self.text = text
+        self.tf = tf
+        self.length = sum(tf.values())
+        self.digest = digest
+        self.hits = 0
+        self.last_used = time.time()
+
 
 class LocalKnowledgeBase:
-    def __init__(self):
-        self.texts = []
+    """Respuestas ya generadas, para contestar sin llamar al LLM.
+
+    Índice invertido (término -> {entrada: frecuencia}) con estadísticas
+    mantenidas al añadir, así que una búsqueda sólo recorre los postings de
+    los términos de la consulta. BM25 elige los candidatos y la puntuación
+    devuelta es el Jaccard de términos normalizados (la misma escala 0-1 que
+    antes, así que los umbrales conservan su sentido). Los textos repetidos
+    (tras normalizar) no se vuelven a guardar y, pasado ``max_entries``, se
+    expulsan las entradas menos útiles: menos aciertos y uso más antiguo.
+    """
+
+    def __init__(self, max_entries=KB_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = {}  # id -> _Entry
+        self._postings = {}  # término -> {id: frecuencia}
+        self._by_digest = {}  # huella del texto normalizado -> id
+        self._total_length = 0
+        self._next_id = 0
+        self._lock = threading.RLock()
+        self.duplicates = 0
+        self.evictions = 0
+
+    @property
+    def texts(self):
+        with self._lock:
+            return [e.text for e in self._entries.values()]
+
+    def __len__(self):
+        return len(self._entries)
 
     def add_entry(self, text):
-        # Solo almacena el texto relevante (narrativa)
-        narrative = text
-        if '\nN:' in text:
-            parts = text.split('\nN:', 1)
-            narrative = parts[1].strip()
-        self.texts.append(narrative)
+        narrative, words, digest = _prepare(text)
+        if not words:
+            return False
+        with self._lock:
+            if digest in self._by_digest:
+                self.duplicates += 1
+                return False
+            entry_id = self._next_id
+            self._next_id += 1
+            entry = _Entry(narrative, Counter(words), digest)
+            self._entries[entry_id] = entry
+            self._by_digest[digest] = entry_id
+            self._total_length += entry.length
+            for term, tf in entry.tf.items():
+                self._postings.setdefault(term, {})[entry_id] = tf
+            if len(self._entries) > self.max_entries:
+                self._evict()
+        return True
+
+    def add_entries(self, texts):
+        """Alta en bloque; devuelve cuántas entradas eran nuevas."""
+        return sum(1 for t in texts if self.add_entry(t))
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        del self._by_digest[entry.digest]
+        self._total_length -= entry.length
+        for term in entry.tf:
+            posting = self._postings[term]
+            del posting[entry_id]
+            if not posting:
+                del self._postings[term]
+
+    def _evict(self):
+        # de golpe un 10% por debajo del tope: la ordenación se amortiza entre muchas altas
+        target = int(self.max_entries * 0.9)
+        victims = sorted(self._entries, key=lambda i: (self._entries[i].hits, self._entries[i].last_used))
+        for entry_id in victims[:len(self._entries) - target]:
+            self._remove(entry_id)
+            self.evictions += 1
+
+    def _bm25(self, qterms):
+        n = len(self._entries)
+        avg = self._total_length / n
+        scores = {}
+        for term in set(qterms):
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for entry_id, tf in posting.items():
+                length = self._entries[entry_id].length
+                norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg))
+                scores[entry_id] = scores.get(entry_id, 0.0) + idf * norm
+        return scores
 
     def search(self, query, top_k=1):
-        # Búsqueda muy ligera: coincidencia de palabras clave (puedes mejorar con TF-IDF si quieres)
-        if not self.texts:
+        qterms = terms(query)
+        with self._lock:
+            if not self._entries or not qterms:
+                return []
+            scores = self._bm25(qterms)
+            best = sorted(scores, key=scores.get, reverse=True)[:max(top_k, CANDIDATES)]
+            qset = set(qterms)
+            results = []
+            for entry_id in best:
+                entry = self._entries[entry_id]
+                results.append({'text': entry.text, 'score': _jaccard(qset, entry.tf.keys()),
+                                'bm25': scores[entry_id], 'id': entry_id})
+        results.sort(key=lambda r: (r['score'], r['bm25']), reverse=True)
+        return results[:top_k]
+
+    def most_similar(self, query, threshold=0.20):
+        results = self.search(query, top_k=1)
+        if results and results[0]['score'] >= threshold:
+            with self._lock:
+                entry = self._entries.get(results[0]['id'])
+                if entry is not None:
+                    # cuenta como útil: evitó una llamada al LLM
+                    entry.hits += 1
+                    entry.last_used = time.time()
+            return results[0]['text'], results[0]['score']
+        return None, 0.0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'terms': len(self._postings),
+                    'duplicates': self.duplicates, 'evictions': self.evictions}
+
+
+class SqliteKnowledgeBase:
+    """La misma base de conocimiento, en un fichero SQLite con índice FTS5.
+
+    Todos los workers leen el mismo fichero (WAL: las lecturas no esperan a
+    las escrituras) y cada alta es una transacción corta; SQLite serializa a
+    los escritores. Arrancar es abrir el fichero, sin reconstruir nada. FTS5
+    ordena por BM25 sobre los términos ya normalizados y, como en memoria, la
+    puntuación devuelta es el Jaccard de términos. ``scripts/build_kb.py``
+    construye el índice en bloque.
+    """
+
+    def __init__(self, path=KB_PATH, max_entries=KB_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._adds = 0
+        self.duplicates = 0
+        self.evictions = 0
+        db = self._db()
+        db.execute('CREATE TABLE IF NOT EXISTS kb_entries (id INTEGER PRIMARY KEY, text TEXT NOT NULL, '
+                   'terms TEXT NOT NULL, digest BLOB NOT NULL UNIQUE, hits INTEGER NOT NULL DEFAULT 0, '
+                   'last_used REAL NOT NULL)')
+        db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS kb_fts USING fts5(terms, content='kb_entries', "
+                   "content_rowid='id')")
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @property
+    def texts(self):
+        return [r[0] for r in self._db().execute('SELECT text FROM kb_entries ORDER BY id')]
+
+    def __len__(self):
+        return self._db().execute('SELECT COUNT(*) FROM kb_entries').fetchone()[0]
+
+    def _insert(self, db, text, now):
+        narrative, words, digest = _prepare(text)
+        if not words:
+            return False
+        cur = db.execute('INSERT OR IGNORE INTO kb_entries (text, terms, digest, last_used) VALUES (?, ?, ?, ?)',
+                         (narrative, ' '.join(words), digest, now))
+        if not cur.rowcount:
+            self.duplicates += 1
+            return False
+        db.execute('INSERT INTO kb_fts (rowid, terms) VALUES (?, ?)', (cur.lastrowid, ' '.join(words)))
+        return True
+
+    def add_entries(self, texts):
+        """Alta en bloque en una sola transacción; devuelve cuántas entradas eran nuevas."""
+        db = self._db()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            added = sum(1 for t in texts if self._insert(db, t, now))
+            self._adds += added
+            # contar filas cuesta: el tope se revisa cada cierto número de altas
+            if self._adds >= 256 or added > 1:
+                self._adds = 0
+                self._evict(db)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return added
+
+    def add_entry(self, text):
+        return self.add_entries([text]) == 1
+
+    def _evict(self, db):
+        count = db.execute('SELECT COUNT(*) FROM kb_entries').fetchone()[0]
+        if count <= self.max_entries:
+            return
+        victims = db.execute('SELECT id, terms FROM kb_entries ORDER BY hits, last_used LIMIT ?',
+                             (count - int(self.max_entries * 0.9),)).fetchall()
+        db.executemany("INSERT INTO kb_fts (kb_fts, rowid, terms) VALUES ('delete', ?, ?)", victims)
+        db.executemany('DELETE FROM kb_entries WHERE id = ?', [(v[0],) for v in victims])
+        self.evictions += len(victims)
+
+    def search(self, query, top_k=1):
+        qterms = terms(query)
+        if not qterms:
             return []
-        scored = []
-        qwords = set(query.lower().split())
-        for t in self.texts:
-            tw = set(t.lower().split())
-            score = len(qwords & tw) / (len(qwords | tw) + 1e-6)
-            scored.append((score, t))
-        scored.sort(reverse=True)
-        return [{'text': t, 'score': s} for s, t in scored[:top_k]]
+        match = ' OR '.join(f'"{t}"' for t in sorted(set(qterms)))
+        rows = self._db().execute(
+            'SELECT e.id, e.text, e.terms, bm25(kb_fts) FROM kb_fts JOIN kb_entries e ON e.id = kb_fts.rowid '
+            'WHERE kb_fts MATCH ? ORDER BY bm25(kb_fts) LIMIT ?', (match, max(top_k, CANDIDATES))).fetchall()
+        qset = set(qterms)
+        # bm25() de FTS5 es negativo: cuanto menor, mejor
+        results = [{'text': text, 'score': _jaccard(qset, set(tterms.split())), 'bm25': -rank, 'id': entry_id}
+                   for entry_id, text, tterms, rank in rows]
+        results.sort(key=lambda r: (r['score'], r['bm25']), reverse=True)
+        return results[:top_k]
 
     def most_similar(self, query, threshold=0.20):
         results = self.search(query, top_k=1)
         if results and results[0]['score'] >= threshold:
+            # cuenta como útil: evitó una llamada al LLM
+            self._db().execute('UPDATE kb_entries SET hits = hits + 1, last_used = ? WHERE id = ?',
+                               (time.time(), results[0]['id']))
             return results[0]['text'], results[0]['score']
         return None, 0.0
+
+    def stats(self):
+        return {'entries': len(self), 'duplicates': self.duplicates, 'evictions': self.evictions,
+                'path': self.path}
+
+
+def get_knowledge_base():
+    """Base de conocimiento del proceso: en disco (KB_PATH) o, con KB_PATH vacío, en memoria."""
+    return SqliteKnowledgeBase(KB_PATH) if KB_PATH else LocalKnowledgeBase()
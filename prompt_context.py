@@ -0,0 +1,90 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+
+from token_count import estimate_tokens
+
+# token budget of the whole system prompt built for an action
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', '1200'))
+# story events always get at least this much, even when the fixed part is large
+PROMPT_MIN_EVENT_TOKENS = int(os.environ.get('PROMPT_MIN_EVENT_TOKENS', '200'))
+SNIPPET_CHARS = 200
+
+# snippet score = similarity + recency + same character
+WEIGHT_SIMILARITY = 1.0
+WEIGHT_RECENCY = 0.5
+WEIGHT_SAME_CHARACTER = 0.3
+
+
+def event_line(event):
+    """One 'Recent Story Events' line: narrative (or prompt) snippet and effects."""
+    # prefer stored narrative, else prompt
+    result = event.get('result')
+    narrative = result.get('narrative') if isinstance(result, dict) else None
+    if not narrative:
+        narrative = event.get('prompt') or '<no prompt>'
+    effects = result.get('effects') if isinstance(result, dict) else None
+    student = event.get('student', 'Player')
+    snippet = (str(narrative)[:SNIPPET_CHARS]).replace('\n', ' ')
+    if effects:
+        return f"- {student}: {snippet} (effects: {json.dumps(effects, ensure_ascii=False, separators=(',', ':'))})"
+    return f"- {student}: {snippet}"
+
+
+class ContextAssembler:
+    """Pick the story events that go into a prompt, under a token budget.
+
+    Candidates are scored by similarity to the action, recency and whether
+    they belong to the acting character, then packed greedily (best first,
+    skipping those that no longer fit) and emitted in timeline order. The
+    rendered line and its token count are cached per event id and state, so
+    an event is encoded once rather than on every request.
+    """
+
+    def __init__(self, cache_size=4096):
+        self.cache_size = cache_size
+        self._lines = OrderedDict()  # (event id, has result) -> (line, tokens)
+        self._lock = threading.Lock()
+
+    def line(self, event):
+        eid = event.get('id')
+        if eid is None:
+            text = event_line(event)
+            return text, estimate_tokens(text)
+        # an event gets its narrative once the LLM answers: that changes the line
+        key = (eid, isinstance(event.get('result'), dict))
+        with self._lock:
+            hit = self._lines.get(key)
+            if hit is not None:
+                self._lines.move_to_end(key)
+                return hit
+        text = event_line(event)
+        hit = (text, estimate_tokens(text) + 1)  # + the newline joining it
+        with self._lock:
+            self._lines[key] = hit
+            while len(self._lines) > self.cache_size:
+                self._lines.popitem(last=False)
+        return hit
+
+    def select(self, events, budget, similarity=None, character_id=None):
+        """(lines in timeline order, tokens used, candidates, chosen events) for the events that fit in budget."""
+        similarity = similarity or {}
+        candidates = [e for e in events if isinstance(e, dict)]
+        # ISO timestamps sort chronologically; events without one count as oldest
+        order = sorted(range(len(candidates)), key=lambda i: candidates[i].get('timestamp') or '')
+        recency = {i: rank / max(1, len(order) - 1) for rank, i in enumerate(order)}
+        scored = []
+        for i, e in enumerate(candidates):
+            score = (WEIGHT_SIMILARITY * similarity.get(e.get('id'), 0.0) + WEIGHT_RECENCY * recency[i]
+                     + (WEIGHT_SAME_CHARACTER if character_id and e.get('character_id') == character_id else 0.0))
+            scored.append((score, i))
+        scored.sort(reverse=True)
+        chosen, used = [], 0
+        for _, i in scored:
+            text, tokens = self.line(candidates[i])
+            if used + tokens <= budget:
+                chosen.append(i)
+                used += tokens
+        chosen.sort(key=lambda i: (candidates[i].get('timestamp') or '', i))
+        return [self.line(candidates[i])[0] for i in chosen], used, len(candidates), [candidates[i] for i in chosen]
@@ -0,0 +1,235 @@
+import os
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+# limits per minute; 0 disables that bucket
+RATE_LIMIT_RPM = int(os.environ.get('RATE_LIMIT_RPM', '80'))
+TOKEN_LIMIT_TPM = int(os.environ.get('TOKEN_LIMIT_TPM', '30000'))
+RATE_LIMIT_PLAYER_RPM = int(os.environ.get('RATE_LIMIT_PLAYER_RPM', '12'))
+TOKEN_LIMIT_PLAYER_TPM = int(os.environ.get('TOKEN_LIMIT_PLAYER_TPM', '4000'))
+# how long a caller may be held waiting for capacity before getting a 429; 0 = never wait
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', '0'))
+# SQLite file shared by every gunicorn worker; empty = per-process buckets
+RATE_LIMIT_PATH = os.environ.get('RATE_LIMIT_PATH', '')
+
+
+def _refill(tokens, updated, capacity, rate, now):
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class RateLimiter(ABC):
+    """Token buckets for requests and LLM tokens, global and per player.
+
+    Each limit is a bucket holding up to one minute of allowance and refilling
+    continuously, so every check is O(1) whatever the traffic. ``acquire``
+    takes from all the buckets of a call at once (or from none) and can hold
+    the caller up to ``max_wait`` seconds for capacity; ``charge`` bills the
+    tokens a reply actually used once they are known. Subclasses store the
+    bucket state: in process (MemoryRateLimiter) or in SQLite, shared by all
+    workers (SqliteRateLimiter).
+    """
+
+    def __init__(self, rpm=RATE_LIMIT_RPM, tpm=TOKEN_LIMIT_TPM, player_rpm=RATE_LIMIT_PLAYER_RPM,
+                 player_tpm=TOKEN_LIMIT_PLAYER_TPM, max_wait=RATE_LIMIT_MAX_WAIT):
+        self.limits = {'requests': (rpm, player_rpm), 'tokens': (tpm, player_tpm)}
+        self.max_wait = max_wait
+        self._stats_lock = threading.Lock()
+        self.allowed = 0
+        self.queued = 0
+        self.rejected = 0
+        self.waited = 0.0
+
+    def _costs(self, player_id, requests, tokens):
+        """[(bucket key, capacity, refill per second, cost)] for one call."""
+        out = []
+        for kind, cost in (('requests', requests), ('tokens', tokens)):
+            if not cost:
+                continue
+            for scope, limit in zip(('global', f'player:{player_id}'), self.limits[kind]):
+                if limit > 0 and (scope == 'global' or player_id is not None):
+                    # a single call bigger than the bucket would otherwise never fit
+                    out.append((f'{scope}:{kind}', float(limit), limit / 60.0, min(float(cost), float(limit))))
+        return out
+
+    def acquire(self, player_id, requests=1, tokens=0, max_wait=None):
+        """Take capacity for one call; returns 0.0 if granted, else seconds until it could be."""
+        costs = self._costs(player_id, requests, tokens)
+        if not costs:
+            return 0.0
+        max_wait = self.max_wait if max_wait is None else max_wait
+        started = time.monotonic()
+        slept = False
+        while True:
+            wait = self._take(costs, time.time())
+            elapsed = time.monotonic() - started
+            if wait <= 0:
+                with self._stats_lock:
+                    self.allowed += 1
+                    if slept:
+                        self.queued += 1
+                        self.waited += elapsed
+                return 0.0
+            if elapsed + wait > max_wait:
+                with self._stats_lock:
+                    self.rejected += 1
+                return wait
+            time.sleep(wait)
+            slept = True
+
+    def charge(self, player_id, tokens):
+        """Bill tokens after the fact; buckets may go into debt (down to -capacity)."""
+        costs = self._costs(player_id, 0, tokens)
+        if costs:
+            self._debit(costs, time.time())
+
+    @abstractmethod
+    def _take(self, costs, now):
+        """Pay every cost if all buckets can; returns 0.0 if paid, else seconds to wait."""
+
+    @abstractmethod
+    def _debit(self, costs, now):
+        """Pay every cost unconditionally (buckets may go into debt)."""
+
+    @staticmethod
+    def _plan(costs, levels):
+        """Seconds to wait until every bucket can pay its cost (0 = now)."""
+        wait = 0.0
+        for (_, _, rate, cost), level in zip(costs, levels):
+            if level < cost:
+                wait = max(wait, (cost - level) / rate)
+        return wait
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'backend': type(self).__name__,
+                'allowed': self.allowed,
+                'queued': self.queued,
+                'rejected': self.rejected,
+                'waited_s': round(self.waited, 3),
+                'limits': {'rpm': self.limits['requests'][0], 'tpm': self.limits['tokens'][0],
+                           'player_rpm': self.limits['requests'][1], 'player_tpm': self.limits['tokens'][1]},
+            }
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Buckets in a dict, for a single worker (limits are per process)."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # key -> [tokens, updated, capacity, rate], least recently used first
+
+    def _levels(self, costs, now):
+        levels = []
+        for key, capacity, rate, _ in costs:
+            b = self._buckets.get(key)
+            levels.append(capacity if b is None else _refill(b[0], b[1], capacity, rate, now))
+        return levels
+
+    def _store(self, costs, levels, now):
+        for (key, capacity, rate, cost), level in zip(costs, levels):
+            self._buckets[key] = [max(-capacity, level - cost), now, capacity, rate]
+            self._buckets.move_to_end(key)
+        # buckets of idle players are full again: same as absent, drop them
+        while self._buckets:
+            key, (tokens, updated, capacity, rate) = next(iter(self._buckets.items()))
+            if _refill(tokens, updated, capacity, rate, now) < capacity:
+                break
+            del self._buckets[key]
+
+    def _take(self, costs, now):
+        with self._lock:
+            levels = self._levels(costs, now)
+            wait = self._plan(costs, levels)
+            if wait <= 0:
+                self._store(costs, levels, now)
+            return wait
+
+    def _debit(self, costs, now):
+        with self._lock:
+            self._store(costs, self._levels(costs, now), now)
+
+    def stats(self):
+        out = super().stats()
+        with self._lock:
+            out['buckets'] = len(self._buckets)
+        return out
+
+
+class SqliteRateLimiter(RateLimiter):
+    """Buckets in a SQLite table, shared by every gunicorn worker.
+
+    Each check is one short IMMEDIATE transaction over the call's few rows, so
+    the configured limits hold for the whole deployment.
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        self._last_prune = 0.0
+        self._db().execute('CREATE TABLE IF NOT EXISTS rate_buckets '
+                           '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _apply(self, costs, now, check):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            keys = [c[0] for c in costs]
+            rows = {key: (tokens, updated) for key, tokens, updated in db.execute(
+                f"SELECT key, tokens, updated FROM rate_buckets WHERE key IN ({','.join('?' * len(keys))})", keys)}
+            levels = []
+            for key, capacity, rate, _ in costs:
+                if key in rows:
+                    levels.append(_refill(*rows[key], capacity, rate, now))
+                else:
+                    levels.append(capacity)
+            wait = self._plan(costs, levels) if check else 0.0
+            if wait <= 0:
+                db.executemany('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                               [(key, max(-capacity, level - cost), now)
+                                for (key, capacity, _, cost), level in zip(costs, levels)])
+                if now - self._last_prune > 60:
+                    # two minutes idle refills any per-minute bucket, even from full debt
+                    db.execute('DELETE FROM rate_buckets WHERE updated < ?', (now - 120,))
+                    self._last_prune = now
+            db.execute('COMMIT')
+            return wait
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def _take(self, costs, now):
+        return self._apply(costs, now, True)
+
+    def _debit(self, costs, now):
+        self._apply(costs, now, False)
+
+    def stats(self):
+        out = super().stats()
+        out['buckets'] = self._db().execute('SELECT COUNT(*) FROM rate_buckets').fetchone()[0]
+        return out
+
+
+_limiter = None
+
+
+def get_limiter():
+    """Process-wide limiter configured from the environment."""
+    global _limiter
+    if _limiter is None:
+        _limiter = SqliteRateLimiter(RATE_LIMIT_PATH) if RATE_LIMIT_PATH else MemoryRateLimiter()
+    return _limiter
@@ -0,0 +1,341 @@
+import re
+import json
+
+_DECODER = json.JSONDecoder(strict=False)
+
+
+def _decode_fragment(raw):
+    return _DECODER.decode('"' + raw + '"')
+
+
+class StreamingReplyParser:
+    """Incremental parser for the game master's JSON reply.
+
+    ``feed()`` takes the text chunks as the model streams them and returns the
+    events each chunk completes:
+
+    - ``('narrative', text)`` for every new piece of the narrative string,
+      decoded as soon as it arrives, long before the JSON is complete;
+    - ``('field', key, value)`` for every other top-level member (effects,
+      choices, ...) once its value has been fully received.
+
+    A reply that does not start with a JSON object (or a ```json fence) is
+    streamed as narrative text verbatim. The final, authoritative parse is
+    still done on the complete reply by the callers.
+    """
+
+    def __init__(self, stream_key='narrative'):
+        self.stream_key = stream_key
+        self.raw = ''
+        self.fields = {}
+        self.mode = None  # None (undecided) | 'fence' | 'json' | 'text'
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._u_left = 0
+        self._high = False  # a \uD800-\uDBFF escape waits for its low surrogate
+        self._expect = 'key'  # at depth 1: key | colon | value | comma
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._streaming = False
+        self._flushed = 0  # raw index up to which the streamed string was emitted
+        self._safe = 0  # raw index up to which it can be decoded (no open escape)
+        self._narrative = []
+
+    @property
+    def narrative(self):
+        return ''.join(self._narrative)
+
+    def feed(self, chunk):
+        events = []
+        self.raw += chunk
+        raw = self.raw
+        while self._pos < len(raw) and not self.done:
+            i = self._pos
+            ch = raw[i]
+            self._pos += 1
+            if self.mode is None:
+                if ch.isspace():
+                    continue
+                if ch == '{':
+                    self._open_object()
+                elif ch == '`':
+                    self.mode = 'fence'
+                else:
+                    self.mode = 'text'
+                    self._flushed = i
+                    self._pos = len(raw)
+            elif self.mode == 'fence':
+                if ch == '{':
+                    self._open_object()
+            elif self.mode == 'json':
+                self._scan(ch, i, events)
+            else:
+                self._pos = len(raw)
+        if self.mode == 'text':
+            self._emit(raw[self._flushed:], events)
+            self._flushed = len(raw)
+        elif self._streaming:
+            self._flush(self._safe, events)
+        return events
+
+    def _open_object(self):
+        self.mode = 'json'
+        self._depth = 1
+        self._expect = 'key'
+
+    def _emit(self, text, events):
+        if text:
+            self._narrative.append(text)
+            events.append(('narrative', text))
+
+    def _flush(self, end, events):
+        if end > self._flushed:
+            self._emit(_decode_fragment(self.raw[self._flushed:end]), events)
+            self._flushed = end
+
+    def _scan(self, ch, i, events):
+        if self._in_str:
+            if self._esc:
+                self._esc = False
+                if ch == 'u':
+                    self._u_left = 4
+            elif self._u_left:
+                self._u_left -= 1
+                if not self._u_left:
+                    was_high = self._high
+                    self._high = not was_high and 0xD800 <= int(self.raw[i - 3:i + 1], 16) < 0xDC00
+            elif ch == '\\':
+                self._esc = True
+            elif ch == '"':
+                self._in_str = False
+                self._end_string(i, events)
+                return
+            else:
+                self._high = False
+            if self._streaming and not self._esc and not self._u_left and not self._high:
+                self._safe = i + 1
+            return
+        top = self._depth == 1
+        if ch == '"':
+            self._in_str = True
+            if top and self._expect == 'key':
+                self._key_start = i + 1
+            elif top and self._expect == 'value':
+                self._value_start = i
+                if self._key == self.stream_key:
+                    self._streaming = True
+                    self._flushed = self._safe = i + 1
+        elif ch in '{[':
+            if top and self._expect == 'value' and self._value_start is None:
+                self._value_start = i
+            self._depth += 1
+        elif ch in '}]':
+            self._depth -= 1
+            if self._depth == 1 and self._expect == 'value':
+                self._end_value(i + 1, events)
+            elif self._depth == 0:
+                if self._expect == 'value' and self._value_start is not None:
+                    self._end_value(i, events)
+                self.done = True
+        elif top:
+            if ch == ':' and self._expect == 'colon':
+                self._expect = 'value'
+                self._value_start = None
+            elif ch == ',':
+                if self._expect == 'value' and self._value_start is not None:
+                    self._end_value(i, events)
+                self._expect = 'key'
+            elif self._expect == 'value' and self._value_start is None and not ch.isspace():
+                self._value_start = i
+
+    def _end_string(self, i, events):
+        if self._depth != 1:
+            return
+        if self._expect == 'key':
+            self._key = _decode_fragment(self.raw[self._key_start:i])
+            self._expect = 'colon'
+        elif self._expect == 'value':
+            if self._streaming:
+                self._flush(i, events)
+                self._streaming = False
+            self._end_value(i + 1, events)
+
+    def _end_value(self, end, events):
+        text = self.raw[self._value_start:end].strip()
+        try:
+            value = _DECODER.decode(text)
+        except ValueError:
+            value = text
+        self.fields[self._key] = value
+        if self._key != self.stream_key:
+            events.append(('field', self._key, value))
+        self._expect = 'comma'
+        self._value_start = None
+
+
+# '{' positions tried before giving up on a reply
+MAX_OBJECTS = 16
+_CLOSE = {'{': '}', '[': ']'}
+_OPEN_ESCAPE = re.compile(r'\\(?:u[0-9a-fA-F]{0,3})?$')
+
+
+def _closers(stack):
+    return ''.join(_CLOSE[c] for c in reversed(stack))
+
+
+def _scan_object(text, start):
+    """Scan the object opening at ``text[start]`` once.
+
+    Returns ``(end, None)`` when it closes at ``end``, or ``(len(text),
+    candidates)`` when the text ends first: repaired versions of the
+    truncated object to try, best first (the open string closed, so a cut
+    narrative is kept; then everything up to the last complete member).
+    """
+    stack = []
+    expect_key = []  # per open container: an object waiting for a key
+    in_str = esc = is_key = False
+    safe = None  # (index, open containers) after the last complete member
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == '\\':
+                esc = True
+            elif ch == '"':
+                in_str = False
+                if not is_key:
+                    safe = (i + 1, ''.join(stack))
+        elif ch == '"':
+            in_str = True
+            is_key = stack[-1] == '{' and expect_key[-1]
+        elif ch in '{[':
+            stack.append(ch)
+            expect_key.append(ch == '{')
+        elif ch in '}]':
+            stack.pop()
+            expect_key.pop()
+            if not stack:
+                return i + 1, None
+            safe = (i + 1, ''.join(stack))
+        elif ch == ',':
+            expect_key[-1] = stack[-1] == '{'
+            safe = (i, ''.join(stack))
+        elif ch == ':':
+            expect_key[-1] = False
+    body = text[start:]
+    candidates = []
+    if in_str and not is_key:
+        candidates.append(_OPEN_ESCAPE.sub('', body) + '"' + _closers(stack))
+    elif not in_str and body.rstrip().rstrip(',').endswith(('"', '}', ']')):
+        # a number or literal at the very end may itself be cut ("money": 2 of 2000): never kept
+        candidates.append(body.rstrip().rstrip(',') + _closers(stack))
+    if safe is not None:
+        candidates.append(text[start:safe[0]] + _closers(safe[1]))
+    return len(text), candidates
+
+
+def extract_json(text):
+    """The JSON object in a model reply, tolerating what models get wrong.
+
+    One scan from the first '{', aware of strings, so braces inside the
+    narrative do not count. Text around the object (prose, ```json fences,
+    a second object with the rest of the keys) is skipped or merged, and an
+    object cut short by the token limit is closed: a partial narrative plus
+    whatever effects were complete. Returns ``(object, repaired)``; object
+    is None when no JSON object can be recovered.
+    """
+    result = None
+    repaired = False
+    pos = text.find('{') if text else -1
+    for _ in range(MAX_OBJECTS):
+        if pos == -1:
+            break
+        end, candidates = _scan_object(text, pos)
+        obj = None
+        for raw in candidates if candidates is not None else [text[pos:end]]:
+            try:
+                obj = _DECODER.decode(raw)
+                break
+            except ValueError:
+                continue
+        if isinstance(obj, dict):
+            if result is None:
+                result = obj
+            else:
+                for key, value in obj.items():
+                    result.setdefault(key, value)
+            if candidates is not None:
+                repaired = True
+                break
+            pos = text.find('{', end)
+        else:
+            # not JSON after all ('{NUMBERS}' in prose): try the next brace
+            pos = text.find('{', pos + 1)
+    return result, repaired
+
+
+_EFFECTS_SCHEMA = {
+    'type': 'object',
+    'properties': {'points': {'type': 'number'}, 'money': {'type': 'number'}, 'lifePercent': {'type': 'number'}},
+    'additionalProperties': False,
+}
+
+# JSON schema of the game master's reply, sent as /api/chat 'format' in structured-output mode
+REPLY_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'effects': _EFFECTS_SCHEMA,
+        'narrative': {'type': 'string'},
+        'choices': {
+            'type': 'array',
+            'items': {'anyOf': [
+                {'type': 'string'},
+                {'type': 'object',
+                 'properties': {'description': {'type': 'string'}, 'effects': _EFFECTS_SCHEMA,
+                                'image_prompt': {'type': 'string'}},
+                 'required': ['description']},
+            ]},
+        },
+    },
+    'required': ['effects', 'narrative'],
+}
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _effects_problems(effects, where):
+    if not isinstance(effects, dict):
+        return [f'{where} is not an object']
+    return [f'{where}.{k} is not an allowed number' for k, v in effects.items()
+            if k not in _EFFECTS_SCHEMA['properties'] or not _number(v)]
+
+
+def validate_reply(obj):
+    """Problems that make ``obj`` break REPLY_SCHEMA; empty when it conforms."""
+    if not isinstance(obj, dict):
+        return ['reply is not a JSON object']
+    problems = [f'missing {k}' for k in REPLY_SCHEMA['required'] if k not in obj]
+    if 'narrative' in obj and not (isinstance(obj['narrative'], str) and obj['narrative'].strip()):
+        problems.append('narrative is not a non-empty string')
+    if 'effects' in obj:
+        problems += _effects_problems(obj['effects'], 'effects')
+    choices = obj.get('choices', [])
+    if not isinstance(choices, list):
+        problems.append('choices is not an array')
+        choices = []
+    for n, choice in enumerate(choices):
+        if isinstance(choice, dict):
+            if not isinstance(choice.get('description'), str):
+                problems.append(f'choices[{n}].description is not a string')
+            if 'effects' in choice:
+                problems += _effects_problems(choice['effects'], f'choices[{n}].effects')
+        elif not isinstance(choice, str):
+            problems.append(f'choices[{n}] is neither a string nor an object')
+    return problems
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from context_store import MemoryContextStore, SqliteContextStore
+from token_count import estimate_tokens
+
+# Contexto de conversación por jugador: el dict anterior (lista de los últimos
+# 20 mensajes por jugador, unida y vuelta a tokenizar en cada mensaje, sin
+# expulsar jugadores nunca) frente al almacén acotado, en memoria y en SQLite
+# (CONTEXT_PATH). --players jugadores distintos envían --messages mensajes en
+# total; se mide el coste por mensaje (leer contexto + guardar mensaje) y la
+# memoria que queda ocupada.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--players', type=int, default=50000)
+parser.add_argument('--messages', type=int, default=200000)
+parser.add_argument('--max-players', type=int, default=10000)
+args = parser.parse_args()
+
+rng = random.Random(0)
+words = ('ataco al dragón con mi espada busco monedas en el cofre hablo con el guardia '
+         'huyo hacia el bosque bebo una poción exploro la cueva').split()
+traffic = [(f'p{rng.randrange(args.players)}', ' '.join(rng.choices(words, k=rng.randint(3, 12))))
+           for _ in range(args.messages)]
+
+
+class LegacyContext:
+    def __init__(self):
+        self.ctx = {}
+
+    def context(self, player_id):
+        if player_id not in self.ctx:
+            return None
+        text = ' '.join(self.ctx[player_id])
+        if estimate_tokens(text) > 1000:
+            text = text[-1000:]
+        return text
+
+    def append(self, player_id, message):
+        self.ctx.setdefault(player_id, []).append(message)
+        if len(self.ctx[player_id]) > 20:
+            self.ctx[player_id] = self.ctx[player_id][-20:]
+
+
+tmp = tempfile.mkdtemp(prefix='bench-ctx-')
+stores = (('legacy dict', LegacyContext),
+          ('MemoryContextStore', lambda: MemoryContextStore(max_players=args.max_players)),
+          ('SqliteContextStore', lambda: SqliteContextStore(os.path.join(tmp, f'ctx-{time.time()}.db'),
+                                                            max_players=args.max_players)))
+
+
+def replay(store):
+    for player_id, message in traffic:
+        store.context(player_id)
+        store.append(player_id, message)
+    return store
+
+
+print(f"{args.messages} messages from {args.players} players (cap {args.max_players} players)")
+for name, factory in stores:
+    t0 = time.perf_counter()
+    replay(factory())
+    elapsed = time.perf_counter() - t0
+    # segunda pasada con tracemalloc, que ralentiza: sólo para la memoria
+    tracemalloc.start()
+    store = replay(factory())
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    players = len(store.ctx) if isinstance(store, LegacyContext) else store.stats()['players']
+    print(f"  {name:20s} {elapsed / args.messages * 1e6:7.1f} µs/message   "
+          f"{held / 1e6:7.1f} MB held   {players} players kept")
@@ -0,0 +1,67 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import atomic_io
+
+# Escrituras por segundo de un characters.json realista con cada modo de
+# durabilidad (STORAGE_DURABILITY), con 1 y N hilos escribiendo a la vez.
+# 'legacy' es el json.dump(indent=2) en el sitio que se usaba antes.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--threads', default='1,8')
+parser.add_argument('--writes', type=int, default=200, help='writes per thread')
+parser.add_argument('--characters', type=int, default=50)
+args = parser.parse_args()
+
+
+def sample_doc(n):
+    history = [{'event_id': f'e{i}', 'class_number': 1, 'points': 5, 'money': 10, 'lifePercent': -2,
+                'narrative': 'El héroe avanza por el multiverso.'} for i in range(20)]
+    return [{'id': f'c{i}', 'name': f'Personaje {i}', 'currentUniverse': 'u1', 'points': 100,
+             'money': 50, 'lifePercent': 100, 'history': history} for i in range(n)]
+
+
+def legacy_write(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def run(mode, threads, writes, data, tmpdir):
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def worker(tid):
+        path = os.path.join(tmpdir, f'{mode}_{tid}.json')
+        for _ in range(writes):
+            if mode == 'legacy':
+                legacy_write(path, data)
+            else:
+                atomic_io.write_files([(path, payload)], durability=mode)
+
+    ts = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return threads * writes / (time.perf_counter() - t0)
+
+
+data = sample_doc(args.characters)
+print(f"document: {args.characters} characters, "
+      f"{len(json.dumps(data, ensure_ascii=False, indent=2))} bytes pretty / "
+      f"{len(json.dumps(data, ensure_ascii=False, separators=(',', ':')))} bytes compact")
+with tempfile.TemporaryDirectory(dir=ROOT) as tmpdir:
+    for threads in [int(t) for t in args.threads.split(',')]:
+        for mode in ('legacy', 'relaxed', 'grouped', 'strict'):
+            groups = atomic_io._committer.groups
+            rate = run(mode, threads, args.writes, data, tmpdir)
+            extra = f"  ({atomic_io._committer.groups - groups} group commits)" if mode == 'grouped' else ''
+            print(f"threads={threads:2d}  {mode:8s} {rate:9.1f} writes/s{extra}")
@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from filelock import FileLock
+from event_log import EventLog
+
+# Coste de escritura por acción (/api/action hace 1 append + 2 updates del evento):
+# array JSON reescrito completo (implementación anterior) vs journal append-only.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--sizes', default='1000,10000,100000')
+parser.add_argument('--actions', type=int, default=5)
+args = parser.parse_args()
+
+
+def make_event(i):
+    return {
+        'id': str(uuid.uuid4()),
+        'timestamp': '2026-01-01T00:00:00Z',
+        'universe_id': 'u1',
+        'character_id': f'char_{i % 20}',
+        'student': 'Bench',
+        'prompt': 'Ataco al villano',
+        'class_number': 1,
+        'result': {'effects': {'points': 10, 'money': 5, 'lifePercent': -2},
+                   'narrative': 'Golpeas al villano y ganas 10 puntos. ' * 3},
+        'embedding': None,
+    }
+
+
+def legacy_action(path, event):
+    def load():
+        with FileLock(path + '.lock'):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+    def save(data):
+        with FileLock(path + '.lock'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
+    events = load()
+    events.append(event)
+    save(events)
+    for _ in range(2):
+        events = load()
+        for i, e in enumerate(events):
+            if e.get('id') == event['id']:
+                events[i] = event
+                save(events)
+                break
+
+
+def journal_action(log, event):
+    log.append(event)
+    for _ in range(2):
+        log.update(event['id'], event)
+
+
+for n in [int(x) for x in args.sizes.split(',')]:
+    tmp = tempfile.mkdtemp()
+    try:
+        seed = [make_event(i) for i in range(n)]
+        legacy_path = os.path.join(tmp, 'events.json')
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump(seed, f, ensure_ascii=False, indent=2)
+        log = EventLog(os.path.join(tmp, 'events.jsonl'))
+        with open(log.path, 'wb') as f:
+            for e in seed:
+                f.write((json.dumps(e, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8'))
+        len(log)  # build the offset index outside the timed section
+
+        t0 = time.perf_counter()
+        for i in range(args.actions):
+            legacy_action(legacy_path, make_event(n + i))
+        legacy_ms = (time.perf_counter() - t0) * 1000 / args.actions
+
+        t0 = time.perf_counter()
+        for i in range(args.actions):
+            journal_action(log, make_event(n + i))
+        journal_ms = (time.perf_counter() - t0) * 1000 / args.actions
+
+        print(f"{n:>7} eventos: json array {legacy_ms:9.2f} ms/acción | journal {journal_ms:7.3f} ms/acción | x{legacy_ms / journal_ms:,.0f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
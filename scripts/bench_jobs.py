@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import argparse
+import threading
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import requests
+
+from stub_ollama import serve
+
+# Saturación: --clients clientes piden traducciones sin parar a un gunicorn
+# (por defecto el de render.yaml: un worker sync) cuyo LLM es el stub con
+# --latency-ms. Mientras tanto se mide /health y /api/characters. Modo 'sync':
+# cada petición espera al LLM en el worker web, como antes; modo 'jobs': la
+# petición encola un job (Prefer: respond-async) y responde 202 al momento.
+# Se ejecuta sobre una copia temporal del árbol para no tocar data/.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--clients', type=int, default=8)
+parser.add_argument('--seconds', type=float, default=15)
+parser.add_argument('--latency-ms', type=float, default=3000)
+parser.add_argument('--gunicorn-args', default='--workers 1')
+args = parser.parse_args()
+
+stub = serve(0, args.latency_ms)
+workdir = tempfile.mkdtemp(prefix='bench-jobs-')
+tree = os.path.join(workdir, 'app')
+shutil.copytree(ROOT, tree, ignore=shutil.ignore_patterns('.git', '__pycache__', '*.lock', 'history'))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run(mode):
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, OLLAMA_BASE_URL=f'http://127.0.0.1:{stub.server_port}', LLM_CACHE_ENABLED='0',
+               JOB_MAX_PENDING='100000', LLM_DEADLINE=str(args.latency_ms / 1000 * 4 + 10))
+    server = subprocess.Popen(['gunicorn', 'wsgi:app', '--bind', f'127.0.0.1:{port}', '--timeout', '600',
+                               *args.gunicorn_args.split()], cwd=tree, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(300):
+            try:
+                requests.get(base + '/health', timeout=1)
+                break
+            except requests.RequestException:
+                time.sleep(0.1)
+        stop = time.monotonic() + args.seconds
+        headers = {'Prefer': 'respond-async'} if mode == 'jobs' else {}
+        submitted = [0]
+
+        def client(n):
+            i = 0
+            while time.monotonic() < stop:
+                i += 1
+                try:
+                    requests.post(base + '/api/translate', json={'text': f'texto {n}-{i}'}, headers=headers,
+                                  timeout=args.seconds + 60)
+                    submitted[0] += 1
+                except requests.RequestException:
+                    pass
+                if mode == 'jobs':
+                    # a polling client would come back later; keep submission pressure comparable
+                    time.sleep(args.latency_ms / 1000)
+
+        probes = {'/health': [], '/api/characters': []}
+
+        def probe():
+            while time.monotonic() < stop:
+                for path, out in probes.items():
+                    t0 = time.perf_counter()
+                    try:
+                        requests.get(base + path, timeout=30)
+                        out.append(time.perf_counter() - t0)
+                    except requests.RequestException:
+                        out.append(30.0)
+                time.sleep(0.1)
+
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(args.clients)]
+        for t in threads:
+            t.start()
+        time.sleep(0.5)
+        probe()
+        print(f"{mode:5s} {submitted[0]:4d} translations submitted")
+        for path, samples in probes.items():
+            ms = np.asarray(samples) * 1000
+            print(f"      {path:16s} p50 {np.percentile(ms, 50):8.1f} ms   p99 {np.percentile(ms, 99):8.1f} ms"
+                  f"   ({len(ms)} probes)")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+try:
+    for mode in ('sync', 'jobs'):
+        run(mode)
+finally:
+    stub.shutdown()
+    shutil.rmtree(workdir, ignore_errors=True)
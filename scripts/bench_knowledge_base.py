@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from local_knowledge import LocalKnowledgeBase, SqliteKnowledgeBase
+
+# Latencia de consulta de la base de conocimiento local: Jaccard recorriendo
+# todos los textos (implementación anterior) frente al índice invertido con
+# BM25, en memoria y en SQLite FTS5 (KB_PATH). Corpus sintético de frases en
+# español con vocabulario de tamaño --vocab (distribución de Zipf); la mitad
+# de las consultas son textos del corpus ligeramente cambiados, como una
+# acción repetida.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--sizes', default='10000,100000')
+parser.add_argument('--queries', type=int, default=50)
+parser.add_argument('--vocab', type=int, default=20000)
+args = parser.parse_args()
+
+
+class LegacyKnowledgeBase:
+    def __init__(self):
+        self.texts = []
+
+    def add_entry(self, text):
+        self.texts.append(text)
+
+    def search(self, query, top_k=1):
+        scored = []
+        qwords = set(query.lower().split())
+        for t in self.texts:
+            tw = set(t.lower().split())
+            score = len(qwords & tw) / (len(qwords | tw) + 1e-6)
+            scored.append((score, t))
+        scored.sort(reverse=True)
+        return [{'text': t, 'score': s} for s, t in scored[:top_k]]
+
+
+rng = random.Random(0)
+base = ('el la los un una de en con por para que se al del dragón espada castillo bosque río '
+        'atacó encuentras monedas vida puntos camino sombra guardia mercado mago héroe').split()
+vocab = base + [f'pal{i}' for i in range(args.vocab)]
+weights = [1.0 / (i + 1) for i in range(len(vocab))]
+
+
+def sentence():
+    return ' '.join(rng.choices(vocab, weights, k=rng.randint(10, 30)))
+
+
+def timed(kb, queries):
+    out = []
+    for q in queries:
+        t0 = time.perf_counter()
+        kb.search(q, top_k=1)
+        out.append(time.perf_counter() - t0)
+    return np.asarray(out) * 1000
+
+
+for size in [int(s) for s in args.sizes.split(',')]:
+    corpus = [sentence() for _ in range(size)]
+    queries = []
+    for i in range(args.queries):
+        if i % 2:
+            words = rng.choice(corpus).split()
+            words[rng.randrange(len(words))] = rng.choice(vocab)
+            queries.append(' '.join(words))
+        else:
+            queries.append(sentence())
+    print(f"{size} entries")
+    tmp = tempfile.mkdtemp(prefix='bench-kb-')
+    for name, kb in (('legacy Jaccard scan', LegacyKnowledgeBase()), ('inverted index + BM25', LocalKnowledgeBase(size)),
+                     ('SQLite FTS5', SqliteKnowledgeBase(os.path.join(tmp, 'kb.db'), size))):
+        t0 = time.perf_counter()
+        if hasattr(kb, 'add_entries'):
+            kb.add_entries(corpus)
+        else:
+            for text in corpus:
+                kb.add_entry(text)
+        build = time.perf_counter() - t0
+        ms = timed(kb, queries)
+        print(f"  {name:22s} query p50 {np.percentile(ms, 50):8.2f} ms   p99 {np.percentile(ms, 99):8.2f} ms"
+              f"   (build {build:.1f} s)")
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import requests
+
+from llm_client import LLMClient
+from stub_ollama import serve
+
+# Sobrecoste de red por llamada al LLM contra el stub local (latencia del
+# modelo = --latency-ms): requests.post sin sesión (como antes) frente al
+# cliente con pool keep-alive, y N llamadas concurrentes por la vía async.
+# Contra ollama.com el ahorro del pool incluye además el handshake TLS.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--calls', type=int, default=300)
+parser.add_argument('--latency-ms', type=float, default=0.0)
+parser.add_argument('--concurrency', type=int, default=16)
+args = parser.parse_args()
+
+server = serve(0, args.latency_ms)
+base = f'http://127.0.0.1:{server.server_port}'
+payload = {'model': 'stub', 'messages': [{'role': 'user', 'content': 'Ataco al villano'}], 'stream': False}
+
+
+def report(name, samples):
+    ms = np.asarray(samples) * 1000 - args.latency_ms
+    print(f"{name:28s} p50 {np.percentile(ms, 50):7.2f} ms   p99 {np.percentile(ms, 99):7.2f} ms  (overhead)")
+
+
+def timed(fn):
+    out = []
+    for _ in range(args.calls):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+report('requests.post (no pool)', timed(lambda: requests.post(base + '/api/chat', json=payload, timeout=60).json()))
+client = LLMClient(base_url=base, api_key='')
+report('LLMClient.chat (pooled)', timed(lambda: client.chat('stub', payload['messages'])))
+
+
+async def run_async():
+    sem = asyncio.Semaphore(args.concurrency)
+    samples = []
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            await client.achat('stub', payload['messages'])
+            samples.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.calls)))
+    wall = time.perf_counter() - t0
+    await client.aclose()
+    return samples, wall
+
+
+try:
+    samples, wall = asyncio.run(run_async())
+    report(f'LLMClient.achat (x{args.concurrency})', samples)
+    print(f"{'':28s} {args.calls / wall:.1f} calls/s")
+except ImportError:
+    print('httpx not installed; async path skipped')
+server.shutdown()
@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import argparse
+from collections import Counter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from llm_client import LLMClient
+from llm_providers import OfflineProvider, OllamaProvider, OpenAIProvider, ProviderRouter
+from stub_ollama import serve
+
+# Enrutado entre proveedores contra tres stubs locales: uno "remoto" lento
+# (--far-ms, como ollama.com), uno compatible con OpenAI (--mid-ms) y uno
+# "cercano" (--near-ms, un Ollama en la red local), más el stub sin red.
+# Antes todas las llamadas iban a un único servidor fijo; el router elige el
+# más rápido sano. Después se apaga el cercano a mitad de tanda y luego todos,
+# para ver la conmutación: ninguna llamada debe fallar.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--calls', type=int, default=200)
+parser.add_argument('--far-ms', type=float, default=120.0)
+parser.add_argument('--mid-ms', type=float, default=60.0)
+parser.add_argument('--near-ms', type=float, default=15.0)
+args = parser.parse_args()
+
+far, mid, near = (serve(0, ms) for ms in (args.far_ms, args.mid_ms, args.near_ms))
+
+
+def url(server):
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def stop(server):
+    # no new connections, and the open keep-alive ones answer 503
+    server.shutdown()
+    server.server_close()
+    server.RequestHandlerClass.fail_rate = 1.0
+
+
+def answered(client):
+    if not isinstance(client, ProviderRouter):
+        return Counter({client.base_url: 0})
+    return Counter({p['name']: p['calls'] - p['failures'] for p in client.stats()['providers']})
+
+
+def run(client, calls, stop_at=None, servers=()):
+    samples, errors = [], 0
+    before = answered(client)
+    for i in range(calls):
+        if i == stop_at:
+            for server in servers:
+                stop(server)
+        messages = [{'role': 'user', 'content': f'Ataco al villano #{i}'}]
+        t0 = time.perf_counter()
+        try:
+            client.chat('stub', messages, {'num_predict': 64}, endpoint='message')
+        except Exception:
+            errors += 1
+        samples.append(time.perf_counter() - t0)
+    used = answered(client)
+    used.subtract(before)
+    if not isinstance(client, ProviderRouter):
+        used[client.base_url] = calls - errors
+    return np.asarray(samples) * 1000, used, errors
+
+
+def report(name, result):
+    ms, used, errors = result
+    share = ', '.join(f'{name} {n}' for name, n in used.most_common() if n)
+    print(f"  {name:34s} p50 {np.percentile(ms, 50):7.1f} ms   p99 {np.percentile(ms, 99):7.1f} ms   "
+          f"errors {errors:3d}   answered by: {share}")
+
+
+print(f"{args.calls} calls per phase")
+report('fixed server (before)', run(LLMClient(url(far)), args.calls))
+
+router = ProviderRouter([
+    OllamaProvider('ollama_cloud', url(far), '', {'default': 'stub'}, retries=0),
+    OpenAIProvider('openai', url(mid), '', {'default': 'stub'}, retries=0),
+    OllamaProvider('ollama_local', url(near), '', {'default': 'stub'}, retries=0),
+    OfflineProvider(),
+], health_interval=0)
+report('router, all healthy', run(router, args.calls))
+report('router, near server dies halfway', run(router, args.calls, args.calls // 2, (near,)))
+report('router, every server down', run(router, args.calls, 0, (far, mid)))
+print('  provider stats:')
+for p in router.stats()['providers']:
+    print(f"    {p['name']:14s} healthy {str(p['healthy']):5s} latency {p['latency_ms']} ms   "
+          f"calls {p['calls']}   failures {p['failures']}")
@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import tempfile
+import argparse
+import threading
+import multiprocessing as mp
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('LLM_SINGLEFLIGHT_DIR', tempfile.mkdtemp(prefix='singleflight-bench-'))
+
+from llm_client import LLMClient
+from singleflight import get_singleflight
+from stub_ollama import serve
+
+# Una clase entera pulsa "empezar misión" a la vez: --workers procesos (como
+# los workers de gunicorn) con --threads peticiones concurrentes cada uno, todas
+# con la misma clave de generación. Cuenta las llamadas que llegan al modelo
+# (stub con --latency-ms) sin coalescer (sin clave, como antes) y con
+# single-flight, y el tiempo hasta que responde la última petición.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--workers', type=int, default=4)
+parser.add_argument('--threads', type=int, default=8)
+parser.add_argument('--rounds', type=int, default=5)
+parser.add_argument('--latency-ms', type=float, default=300.0)
+args = parser.parse_args()
+
+server = serve(0, args.latency_ms)
+base = f'http://127.0.0.1:{server.server_port}'
+messages = [{'role': 'user', 'content': 'Empieza la misión del bosque'}]
+
+
+def worker(barrier, keyed, round_no, out):
+    client = LLMClient(base_url=base, api_key='')
+    barrier.wait()
+    threads = [threading.Thread(target=client.chat, args=('stub', messages),
+                                kwargs={'cache_key': f'bench-{round_no}' if keyed else None})
+               for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    out.put(get_singleflight().stats() if keyed else None)
+
+
+def run(keyed):
+    ctx = mp.get_context('fork')
+    calls = 0
+    coalesced = [0, 0]
+    wall = 0.0
+    for r in range(args.rounds):
+        barrier = ctx.Barrier(args.workers + 1)
+        out = ctx.Queue()
+        before = server.RequestHandlerClass.calls
+        procs = [ctx.Process(target=worker, args=(barrier, keyed, f'{keyed}-{r}', out)) for _ in range(args.workers)]
+        for p in procs:
+            p.start()
+        barrier.wait()
+        t0 = time.perf_counter()
+        stats = [out.get() for _ in procs]
+        wall += time.perf_counter() - t0
+        for p in procs:
+            p.join()
+        calls += server.RequestHandlerClass.calls - before
+        for s in stats:
+            if s:
+                coalesced[0] += s['coalesced_local']
+                coalesced[1] += s['coalesced_remote']
+    return calls / args.rounds, coalesced, wall / args.rounds
+
+
+requests_per_round = args.workers * args.threads
+for name, keyed in (('without single-flight', False), ('with single-flight', True)):
+    calls, (local, remote), wall = run(keyed)
+    print(f"{name:22s} {requests_per_round} requests -> {calls:5.1f} LLM calls/round, "
+          f"last answer after {wall * 1000:6.0f} ms"
+          + (f"  (coalesced in-process {local}, across workers {remote})" if keyed else ''))
+server.shutdown()
@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from storage import Storage
+
+# Throughput de la parte de almacenamiento de /api/action (validar, crear evento,
+# embedding, append, cargar timeline/personaje/universo, apply_event_result)
+# con N procesos concurrentes, como N workers de gunicorn sobre el mismo data/.
+# La llamada al LLM se excluye: solo se mide el coste y la contención del backend.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--workers', default='1,4')
+parser.add_argument('--actions', type=int, default=50, help='actions per worker')
+args = parser.parse_args()
+
+CHARACTERS = ['ironman_juan', 'luke_maria']
+
+
+def run_worker(data_dir, backend, n, wid, out):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        storage = Storage(data_dir, backend=backend)
+        vec = np.ones(384, dtype=np.float32)
+        t0 = time.perf_counter()
+        for i in range(n):
+            payload = {'student': f'w{wid}', 'universe_id': 'u1', 'character_id': CHARACTERS[i % 2],
+                       'prompt': 'Ataco al villano', 'class_number': 1}
+            storage.validate_action(payload)
+            event = storage.create_event(payload)
+            event['embedding_row'] = storage.add_embedding(vec)
+            storage.append_event(event)
+            storage.load_events()
+            storage.get_character(payload['character_id'])
+            storage.load_universe(payload['universe_id'])
+            reply = json.dumps({'effects': {'points': 1, 'money': 1, 'lifePercent': -1}, 'narrative': 'Golpeas al villano.'})
+            storage.apply_event_result(event, reply)
+        out.put(time.perf_counter() - t0)
+
+
+for backend in ('json', 'sqlite'):
+    for workers in [int(x) for x in args.workers.split(',')]:
+        tmp = tempfile.mkdtemp()
+        try:
+            data_dir = os.path.join(tmp, 'data')
+            shutil.copytree(os.path.join(ROOT, 'data'), data_dir, ignore=shutil.ignore_patterns('*.lock', 'game.db*'))
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                Storage(data_dir, backend=backend)  # migrate/seed before timing
+            out = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=run_worker, args=(data_dir, backend, args.actions, w, out))
+                     for w in range(workers)]
+            t0 = time.perf_counter()
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+            wall = time.perf_counter() - t0
+            total = workers * args.actions
+            print(f"{backend:>6}, {workers} workers: {total / wall:7.1f} acciones/s ({total} acciones en {wall:.2f} s)")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
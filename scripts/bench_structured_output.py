@@ -0,0 +1,55 @@
+import os
+import sys
+import random
+import argparse
+import contextlib
+import io
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ['LLM_CACHE_ENABLED'] = '0'
+
+from stub_ollama import serve
+
+# Llamadas al LLM por acción en AI.generate_narrative contra el stub local:
+# sólo prompt (como antes), con el esquema en 'format' (LLM_STRUCTURED_OUTPUT=1)
+# y con 'format' contra un servidor que no lo acepta (vuelve a sólo prompt
+# tras la primera petición rechazada). --prose-rates son las fracciones de
+# respuestas sin JSON que da el modelo cuando sólo el prompt pide JSON; cada
+# una cuesta una segunda llamada con el otro prompt.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--actions', type=int, default=200)
+parser.add_argument('--prose-rates', default='0,0.05,0.2')
+args = parser.parse_args()
+
+rng = random.Random(0)
+words = 'ataco al dragón busco monedas en el cofre hablo con el guardia huyo hacia el bosque bebo una poción'.split()
+actions = [' '.join(rng.choices(words, k=rng.randint(3, 10))) + f' #{i}' for i in range(args.actions)]
+
+
+def calls_per_action(prose_rate, structured, format_support=True):
+    random.seed(1)  # the stub draws its prose replies from the global generator: same draws in every mode
+    server = serve(0, prose_rate=prose_rate, format_support=format_support)
+    os.environ['OLLAMA_BASE_URL'] = f'http://127.0.0.1:{server.server_port}'
+    import llm_client
+    from ai import AI
+
+    llm_client._client = llm_client.LLMClient(base_url=os.environ['OLLAMA_BASE_URL'], structured=structured)
+    ai = AI()
+    handler = server.RequestHandlerClass
+    handler.calls = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        replies = [ai.generate_narrative('Universo de prueba.', action) for action in actions]
+    server.shutdown()
+    return handler.calls / len(actions), sum(not r.startswith('{') for r in replies)
+
+
+print(f"{args.actions} actions; LLM calls per action (actions left without JSON)")
+for rate in (float(r) for r in args.prose_rates.split(',')):
+    modes = (('prompt only', calls_per_action(rate, structured=False)),
+             ('structured', calls_per_action(rate, structured=True)),
+             ("structured, no 'format'", calls_per_action(rate, structured=True, format_support=False)))
+    print(f"  prose rate {rate:4.2f}  " + '   '.join(f"{name} {calls:5.3f} ({lost})" for name, (calls, lost) in modes))
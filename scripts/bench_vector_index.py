@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from vector_index import VectorIndex
+
+# Búsqueda top-k: bucle por evento (dicts + vectores del sidecar, como el
+# search_similar anterior) frente a VectorIndex (matriz normalizada + argpartition).
+# Con --backend faiss|hnsw se mide además ese backend si está instalado.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--sizes', default='10000,100000,1000000')
+parser.add_argument('--dim', type=int, default=384)
+parser.add_argument('--queries', type=int, default=20)
+parser.add_argument('--legacy-max', type=int, default=100000,
+                    help='skip the per-dict loop above this size (it takes minutes)')
+parser.add_argument('--backend', default='numpy')
+args = parser.parse_args()
+
+rng = np.random.default_rng(0)
+universes = ['u1', 'u2', 'u3', 'u4']
+
+
+def legacy_search(q, events, vectors, top_k=5):
+    qn = np.linalg.norm(q) or 1.0
+    scored = []
+    for e in events:
+        v = vectors[e['embedding_row']]
+        vn = np.linalg.norm(v)
+        if not vn:
+            continue
+        scored.append((float(np.dot(q, v) / (qn * vn)), e))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [e for _, e in scored[:top_k]]
+
+
+def timed(fn, queries):
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - t0) * 1000 / len(queries)
+
+
+for n in [int(x) for x in args.sizes.split(',')]:
+    vectors = rng.standard_normal((n, args.dim), dtype=np.float32)
+    events = [{'id': str(i), 'universe_id': universes[i % 4], 'embedding_row': i} for i in range(n)]
+    groups = [e['universe_id'] for e in events]
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    line = f"{n:>8} vectores:"
+    if n <= args.legacy_max:
+        nq = max(1, min(args.queries, 3))
+        line += f" bucle por dict {timed(lambda q: legacy_search(q, events, vectors), queries[:nq]):9.2f} ms |"
+    else:
+        line += "  bucle por dict      (omitido) |"
+
+    t0 = time.perf_counter()
+    index = VectorIndex(backend=args.backend)
+    index.add_many(list(range(n)), vectors, groups)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    for i in range(100):
+        index.add(n + i, vectors[i], 'u1')
+    add_ms = (time.perf_counter() - t0) * 1000 / 100
+
+    all_ms = timed(lambda q: index.search(q, 5), queries)
+    uni_ms = timed(lambda q: index.search(q, 5, group='u2'), queries)
+    line += f" índice {index._backend.name} {all_ms:7.2f} ms (por universo {uni_ms:6.2f} ms)"
+    line += f" | build {build_ms:8.1f} ms, add {add_ms:.3f} ms/vector (amortizado)"
+    print(line)
+    del vectors, index, events
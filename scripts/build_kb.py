@@ -0,0 +1,80 @@
+import os
+import re
+import sys
+import time
+import argparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from local_knowledge import KB_PATH, SqliteKnowledgeBase
+from storage import Storage
+
+# Construye en bloque la base de conocimiento en disco (KB_PATH, la que leen
+# todos los workers) a partir de las narrativas guardadas en los eventos.
+# Sustituye a populate_kb_from_events.py y populate_kb_jugable.py, que
+# llenaban una instancia en memoria que nunca se guardaba.
+#
+#   python scripts/build_kb.py                 # añade todas las narrativas
+#   python scripts/build_kb.py --playable-only # sólo narrativas jugables
+#   python scripts/build_kb.py --rebuild       # borra el índice y lo rehace
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data-dir', default=os.path.join(ROOT, 'data'))
+parser.add_argument('--path', default=KB_PATH or os.path.join(ROOT, 'data', 'knowledge.db'))
+parser.add_argument('--playable-only', action='store_true',
+                    help='skip short narratives and leaked prompt/system text')
+parser.add_argument('--rebuild', action='store_true', help='delete the existing index first')
+args = parser.parse_args()
+
+# Palabras que suelen indicar instrucciones o texto de sistema
+SYSTEM_KEYWORDS = [
+    'Return only a JSON', 'Respond with a JSON', 'Provide a single valid JSON',
+    'Student action:', 'Player action:', 'Recent relevant events:',
+    'Respond with', 'JSON', 'object with keys', 'no extra explanation',
+    'description of the effects', 'Universe:', 'keys', 'effects', 'narrative',
+    'valid JSON', 'structure', 'object', 'Provide', 'Reply', 'no text', 'no markdown',
+    'no code', 'Respond', 'explanation', 'top-level',
+    'Respond only', 'CRITICAL EXAMPLE', 'Example JSON', 'EFFECTS object', 'DELTA', 'Range:'
+]
+
+
+def is_jugable_narrative(narrative):
+    if not narrative:
+        return False
+    # Debe tener al menos 12 palabras y no contener instrucciones ni palabras clave de sistema
+    if len(narrative.split()) < 12:
+        return False
+    lowered = narrative.lower()
+    if any(kw.lower() in lowered for kw in SYSTEM_KEYWORDS):
+        return False
+    # No debe ser solo una lista de acciones o eventos
+    if re.match(r"^[-•\d\s\w:.,]+$", narrative) and len(set(narrative)) < 20:
+        return False
+    return True
+
+
+def narratives(events):
+    for event in events:
+        result = event.get('result', {})
+        narrative = None
+        if isinstance(result, dict):
+            narrative = result.get('narrative')
+        elif isinstance(result, str):
+            narrative = result
+        if narrative and (not args.playable_only or is_jugable_narrative(narrative)):
+            yield narrative
+
+
+if args.rebuild:
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.path + suffix):
+            os.remove(args.path + suffix)
+
+t0 = time.perf_counter()
+events = Storage(args.data_dir).load_events()
+kb = SqliteKnowledgeBase(args.path)
+candidates = list(narratives(events))
+added = kb.add_entries(candidates)
+print(f"{args.path}: {added} nuevas de {len(candidates)} narrativas ({len(events)} eventos), "
+      f"{len(kb)} entradas en total, {time.perf_counter() - t0:.2f} s")
@@ -0,0 +1,117 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from effects_parser import parse_effects
+
+# Comprueba effects_parser.parse_effects contra el corpus de referencia
+# (scripts/effects_golden.json: narrativas de data/events.json con números y
+# casos escritos a mano, con los efectos esperados) y mide su coste frente a
+# las dos cascadas de regex anteriores (Storage._parse_effects_from_text y el
+# fallback de /ai/message y /choice). Sale con código 1 si algún caso no
+# coincide. --update reescribe los efectos esperados con la salida actual,
+# para cuando un cambio de semántica es intencionado (revisar el diff).
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'effects_golden.json')
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--rounds', type=int, default=200)
+parser.add_argument('--update', action='store_true')
+args = parser.parse_args()
+
+
+def legacy_storage(text):
+    import re
+
+    if not text:
+        return {}
+    effects = {}
+    m = re.search(r"gana\s+(\d+)(?:\s+puntos|\s+points)?", text, re.IGNORECASE)
+    if m:
+        effects['points'] = int(m.group(1))
+    m = re.search(r"pierde\s+(\d+)(?:\s+puntos|\s+points)?", text, re.IGNORECASE)
+    if m:
+        effects['points'] = effects.get('points', 0) - int(m.group(1))
+    m = re.search(r"(\d+)\s+(?:puntos|points)", text, re.IGNORECASE)
+    if m and 'points' not in effects:
+        effects['points'] = int(m.group(1))
+    m = re.search(r"gana\s+(\d+)\s+(?:dinero|money|coins)", text, re.IGNORECASE)
+    if m:
+        effects['money'] = int(m.group(1))
+    m = re.search(r"pierde\s+(\d+)\s+(?:dinero|money|coins)", text, re.IGNORECASE)
+    if m:
+        effects['money'] = effects.get('money', 0) - int(m.group(1))
+    m = re.search(r"(\d+)\s+(?:dinero|money|coins)", text, re.IGNORECASE)
+    if m and 'money' not in effects:
+        effects['money'] = int(m.group(1))
+    m = re.search(r"pierde\s+(\d+)%?\s+de\s+vida", text, re.IGNORECASE)
+    if m:
+        effects['lifePercent'] = -int(m.group(1))
+    m = re.search(r"life[:\s-]+(\d+)%", text, re.IGNORECASE)
+    if m:
+        effects['lifePercent'] = int(m.group(1))
+    m = re.search(r"(\d+)%\s+vida", text, re.IGNORECASE)
+    if m and 'lifePercent' not in effects:
+        effects['lifePercent'] = int(m.group(1))
+    m = re.search(r"change_universe_to[:\s]+([A-Za-z0-9_\-]+)", text, re.IGNORECASE)
+    if m:
+        effects['change_universe_to'] = m.group(1)
+    m = re.search(r"mueve?s?\s+a\s+universo\s+([A-Za-z0-9_\-]+)", text, re.IGNORECASE)
+    if m:
+        effects['change_universe_to'] = m.group(1)
+    return effects
+
+
+def legacy_message(reply):
+    effects = {}
+    m_points = re.search(r'(\+|\-)?\d+\s*(puntos|points)', reply, re.IGNORECASE)
+    m_money = re.search(r'(\+|\-)?\d+\s*(monedas|dinero|money)', reply, re.IGNORECASE)
+    m_life = re.search(r'(\+|\-)?\d+\s*%?\s*(vida|life)', reply, re.IGNORECASE)
+    if m_points:
+        effects['points'] = int(re.search(r'(\+|\-)?\d+', m_points.group()).group())
+    if m_money:
+        effects['money'] = int(re.search(r'(\+|\-)?\d+', m_money.group()).group())
+    if m_life:
+        effects['lifePercent'] = int(re.search(r'(\+|\-)?\d+', m_life.group()).group())
+    return effects
+
+
+with open(GOLDEN, encoding='utf-8') as f:
+    cases = json.load(f)
+
+if args.update:
+    for case in cases:
+        case['effects'] = parse_effects(case['text'])
+    with open(GOLDEN, 'w', encoding='utf-8') as f:
+        json.dump(cases, f, ensure_ascii=False, indent=1)
+    print(f"{GOLDEN}: {len(cases)} casos actualizados")
+    sys.exit(0)
+
+failed = 0
+agree = {'legacy storage': 0, 'legacy /ai/message': 0}
+for case in cases:
+    got = parse_effects(case['text'])
+    if got != case['effects']:
+        failed += 1
+        print(f"FAIL {case['text'][:70]!r}\n     expected {case['effects']}\n     got      {got}")
+    agree['legacy storage'] += legacy_storage(case['text']) == case['effects']
+    agree['legacy /ai/message'] += legacy_message(case['text']) == case['effects']
+print(f"{len(cases) - failed}/{len(cases)} golden cases pass")
+for name, n in agree.items():
+    print(f"  {name:20s} would agree on {n}/{len(cases)}")
+
+texts = [c['text'] for c in cases]
+for name, fn in (('legacy storage', legacy_storage), ('legacy /ai/message', legacy_message),
+                 ('effects_parser', parse_effects)):
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for text in texts:
+            fn(text)
+    per_call = (time.perf_counter() - t0) / (args.rounds * len(texts))
+    print(f"  {name:20s} {per_call * 1e6:7.1f} µs/text")
+sys.exit(1 if failed else 0)
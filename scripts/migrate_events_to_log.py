@@ -0,0 +1,40 @@
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from event_log import EventLog, migrate_json_array
+from embedding_store import EmbeddingStore
+
+# Convierte data/events.json (array JSON) al journal append-only data/events.jsonl.
+# Storage lo hace automáticamente la primera vez; este script permite hacerlo
+# explícitamente (por ejemplo antes de un despliegue) y compactar el journal.
+# En ambos casos los embeddings inline se sustituyen por el del prompt, calculado
+# con el embedder actual, en data/event_embeddings.bin.
+
+parser = argparse.ArgumentParser(description='Migrate events.json to the append-only event journal')
+parser.add_argument('--data-dir', default=os.path.join(os.path.dirname(__file__), '..', 'data'))
+parser.add_argument('--force', action='store_true', help='overwrite an existing journal')
+parser.add_argument('--compact', action='store_true',
+                    help='only compact the existing journal (also externalizes inline embeddings)')
+args = parser.parse_args()
+
+json_path = os.path.join(args.data_dir, 'events.json')
+log_path = os.path.join(args.data_dir, 'events.jsonl')
+embeddings = EmbeddingStore(os.path.join(args.data_dir, 'event_embeddings.bin'))
+
+if args.compact:
+    log = EventLog(log_path)
+    log.compact(transform=embeddings.externalize)
+    print(f"Journal compactado: {len(log)} eventos en {log_path}")
+elif os.path.exists(log_path) and not args.force:
+    print(f"{log_path} ya existe; usa --force para regenerarlo desde {json_path}")
+else:
+    # el journal se regenera entero: el sidecar también
+    for p in (embeddings.path, embeddings.meta_path):
+        if os.path.exists(p):
+            os.remove(p)
+    embeddings = EmbeddingStore(embeddings.path)
+    n = migrate_json_array(json_path, log_path, transform=embeddings.externalize)
+    print(f"Migrados {n} eventos de {json_path} a {log_path}")
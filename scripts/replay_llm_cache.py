@@ -0,0 +1,51 @@
+import os
+import sys
+import argparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from storage import Storage
+from llm_cache import LLMCache, generation_key, state_bucket
+
+# Reproduce la línea temporal de eventos contra la caché de generaciones y
+# cuenta cuántas llamadas al LLM se habrían evitado: clave exacta (prompt tal
+# cual), prompt normalizado con las reglas del universo, y la clave completa
+# que además incluye el estado del personaje por tramos. El estado se
+# reconstruye aplicando los efectos de cada evento en orden.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data-dir', default=os.path.join(ROOT, 'data'))
+parser.add_argument('--model', default=os.environ.get('OLLAMA_MODEL', 'gpt-oss:120b'))
+parser.add_argument('--ttl', type=float, default=3600)
+args = parser.parse_args()
+
+storage = Storage(args.data_dir)
+events = storage.load_events()
+rules = {u.get('id'): u.get('rules') for u in storage.load_universes()}
+characters = {}
+
+exact, prompt_only, normalized = (LLMCache(ttl=args.ttl, path='') for _ in range(3))
+for e in events:
+    prompt = e.get('prompt') or ''
+    char = characters.setdefault(e.get('character_id'), {'currentUniverse': e.get('universe_id'),
+                                                         'lifePercent': 1.0, 'points': 0, 'money': 0})
+    keys = (
+        (exact, generation_key(args.model, prompt, normalize=False)),
+        (prompt_only, generation_key(args.model, prompt, rules.get(e.get('universe_id')))),
+        (normalized, generation_key(args.model, prompt, rules.get(e.get('universe_id')), state_bucket(char))),
+    )
+    for cache, key in keys:
+        if cache.get(key) is None:
+            cache.put(key, {'event': e.get('id')})
+    effects = (e.get('result') or {}).get('effects') if isinstance(e.get('result'), dict) else None
+    for k in ('points', 'money'):
+        if isinstance((effects or {}).get(k), (int, float)):
+            char[k] = char.get(k, 0) + effects[k]
+    if isinstance((effects or {}).get('lifePercent'), (int, float)):
+        char['lifePercent'] = max(0.0, min(1.0, char['lifePercent'] + effects['lifePercent'] / 100.0))
+
+print(f"{len(events)} events replayed")
+for name, cache in (('exact prompt', exact), ('normalized+rules', prompt_only), ('normalized+bucket', normalized)):
+    s = cache.stats()
+    print(f"{name:18s} hits {s['hits']:4d}  misses {s['misses']:4d}  avoided {s['hit_rate'] * 100:5.1f}% of LLM calls")
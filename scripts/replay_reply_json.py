@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import random
+import argparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from reply_parser import extract_json
+
+# Cuenta cuántas respuestas del LLM habrían pedido una segunda generación en
+# AI.generate_narrative: antes, cualquier respuesta en la que find('{') /
+# rfind('}') no diera un JSON válido; ahora, sólo las que no contienen ningún
+# objeto recuperable. Corpus: las respuestas guardadas en los eventos (las
+# crudas, cuando el JSON no se pudo leer, y las bien formadas, reconstruidas)
+# y, con --cuts, cada respuesta bien formada cortada en puntos al azar, como
+# cuando se agota num_predict.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--events', default=os.path.join(ROOT, 'data', 'events.json'))
+parser.add_argument('--cuts', type=int, default=5)
+args = parser.parse_args()
+
+
+def legacy_reply_json(text):
+    try:
+        start = text.find('{')
+        end = text.rfind('}')
+        if start != -1 and end != -1 and end > start:
+            json_text = text[start:end + 1]
+            json.loads(json_text)
+            return json_text
+    except Exception:
+        pass
+    return None
+
+
+def reply_json(text):
+    data, _ = extract_json(text)
+    if not data or ('narrative' not in data and 'effects' not in data):
+        return None
+    return data
+
+
+with open(args.events, encoding='utf-8') as f:
+    events = json.load(f)
+
+raw, formed = [], []
+for e in events:
+    result = e.get('result')
+    narrative = result.get('narrative') if isinstance(result, dict) else result
+    if not narrative:
+        continue
+    if '{' in narrative or not isinstance(result, dict):
+        raw.append(narrative)
+    else:
+        formed.append(json.dumps({k: result[k] for k in ('effects', 'narrative', 'choices') if k in result},
+                                 ensure_ascii=False))
+
+rng = random.Random(0)
+cut = [r[:rng.randrange(len(r) // 3, len(r))] for r in formed for _ in range(args.cuts)]
+
+
+def report(name, replies):
+    old = sum(legacy_reply_json(r) is None for r in replies)
+    new = sum(reply_json(r) is None for r in replies)
+    print(f"{name:34s} {len(replies):4d} replies   second call before {old:4d}   now {new:4d}   saved {old - new:4d}")
+    return old, new
+
+
+totals = [report('stored raw replies', raw), report('stored well-formed replies', formed),
+          report(f'well-formed cut short (x{args.cuts})', cut)]
+old, new = (sum(t[i] for t in totals) for i in (0, 1))
+print(f"{'total':34s} {len(raw) + len(formed) + len(cut):4d} replies   second call before {old:4d}   "
+      f"now {new:4d}   saved {old - new:4d}")
@@ -0,0 +1,50 @@
+import os
+import sys
+import argparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from embedder import EMBED_MODEL
+from local_knowledge import LocalKnowledgeBase
+from semantic_cache import SemanticCache
+from storage import Storage
+
+# Reproduce los mensajes de los eventos guardados, en orden, y cuenta cuántas
+# llamadas al LLM se habrían evitado: con la comprobación anterior (Jaccard de
+# palabras >= 0.80 contra las narrativas aprendidas) y con la caché semántica
+# por universo a varios umbrales. Cada fallo añade (mensaje, respuesta) a la
+# caché, como haría /ai/message. --show imprime ejemplos de aciertos
+# con otra redacción.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data-dir', default=os.path.join(ROOT, 'data'))
+parser.add_argument('--thresholds', default='0.75,0.80,0.85,0.90,0.95')
+parser.add_argument('--show', type=int, default=0)
+args = parser.parse_args()
+
+events = [e for e in Storage(args.data_dir).load_events()
+          if e.get('prompt') and isinstance(e.get('result'), dict)]
+print(f"{len(events)} messages with a reply; embeddings: {EMBED_MODEL or 'hashing vectorizer'}")
+
+kb = LocalKnowledgeBase()
+hits = 0
+for e in events:
+    if kb.most_similar(e['prompt'], threshold=0.80)[0] is not None:
+        hits += 1
+    if e['result'].get('narrative'):
+        kb.add_entry(e['result']['narrative'])
+print(f"{'word Jaccard >= 0.80':24s} avoided {hits:4d} ({hits / max(1, len(events)) * 100:5.1f}%)")
+
+for threshold in [float(t) for t in args.thresholds.split(',')]:
+    cache = SemanticCache(threshold=threshold)
+    shown = 0
+    for e in events:
+        reply, sim = cache.lookup(e['prompt'], e.get('universe_id'))
+        if reply is None:
+            cache.add(e['prompt'], {'prompt': e['prompt'], 'reply': e['result'].get('narrative')}, e.get('universe_id'))
+        elif shown < args.show and reply['prompt'] != e['prompt']:
+            shown += 1
+            print(f"    {sim:.2f}  {e['prompt'][:50]!r} -> reused reply to {reply['prompt'][:50]!r}")
+    s = cache.stats()
+    print(f"{f'semantic >= {threshold:.2f}':24s} avoided {s['hits']:4d} ({s['hit_rate'] * 100:5.1f}%)")
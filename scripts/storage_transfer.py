@@ -0,0 +1,31 @@
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from embedding_store import EmbeddingStore
+from storage import JsonBackend, copy_backend
+from storage_sqlite import SqliteBackend
+
+# Importa data/ (ficheros JSON + journal de eventos) a SQLite, o exporta SQLite
+# de vuelta a ficheros JSON. El destino se reemplaza por completo. Los embeddings
+# (data/event_embeddings.bin) los comparten ambos backends y no se copian.
+
+parser = argparse.ArgumentParser(description='Import/export the game data between the JSON and SQLite backends')
+parser.add_argument('direction', choices=['import', 'export'], help='import: JSON -> SQLite, export: SQLite -> JSON')
+parser.add_argument('--data-dir', default=os.path.join(os.path.dirname(__file__), '..', 'data'))
+parser.add_argument('--db', default=None, help='SQLite file (default: <data-dir>/game.db)')
+args = parser.parse_args()
+
+db = args.db or os.path.join(args.data_dir, 'game.db')
+embeddings = EmbeddingStore(os.path.join(args.data_dir, 'event_embeddings.bin'))
+json_backend = JsonBackend(args.data_dir, embeddings)
+sqlite_backend = SqliteBackend(db, args.data_dir, embeddings)
+
+if args.direction == 'import':
+    n = copy_backend(json_backend, sqlite_backend)
+    print(f"Importado {args.data_dir} -> {db} ({n} eventos)")
+else:
+    n = copy_backend(sqlite_backend, json_backend)
+    print(f"Exportado {db} -> {args.data_dir} ({n} eventos)")
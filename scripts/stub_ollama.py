@@ -0,0 +1,172 @@
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Servidor Ollama de pruebas: responde /api/chat y /api/tags sin modelo real
+# (y /v1/chat/completions y /v1/models, como un servidor compatible con OpenAI),
+# con latencia y tasa de errores configurables. --prose-rate es la fracción de
+# respuestas sin JSON cuando la petición no trae 'format' (un modelo real a
+# veces ignora el prompt); con un esquema en 'format' la respuesta siempre lo
+# cumple, salvo con --no-format, que lo rechaza con 400 como un servidor
+# antiguo. Uso:
+#   python scripts/stub_ollama.py --port 11434 --latency-ms 200
+#   OLLAMA_BASE_URL=http://127.0.0.1:11434 python app.py
+
+PROSE = 'Claro. Avanzas con cautela por el pasillo y encuentras unas monedas entre los escombros.'
+REPLY = {
+    'effects': {'points': 10, 'money': 5, 'lifePercent': -2},
+    'narrative': 'Avanzas con cautela por el pasillo y encuentras unas monedas entre los escombros.',
+    'choices': ['Seguir explorando', 'Volver al campamento'],
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real server
+    disable_nagle_algorithm = True  # Go's net/http sets TCP_NODELAY too
+    latency = 0.0
+    token_delay = 0.0
+    fail_rate = 0.0
+    prose_rate = 0.0
+    format_support = True
+    calls = 0
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send_json(200, {'models': [{'name': 'stub:latest'}]})
+        elif self.path == '/v1/models':
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'stub', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        type(self).calls += 1
+        if self.path not in ('/api/chat', '/v1/chat/completions'):
+            self._send_json(404, {'error': 'not found'})
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            self._send_json(503, {'error': 'overloaded'})
+            return
+        openai = self.path == '/v1/chat/completions'
+        schema = (payload.get('response_format') or {}).get('json_schema') if openai else payload.get('format')
+        if isinstance(schema, dict) and not self.format_support:
+            self._send_json(400, {'error': 'invalid format: expected "json" or a JSON schema'})
+            return
+        content = json.dumps(REPLY, ensure_ascii=False)
+        if not schema and random.random() < self.prose_rate:
+            content = PROSE
+        if payload.get('stream'):
+            if openai:
+                self._stream_openai(payload, content)
+            else:
+                self._stream(payload, content)
+            return
+        if self.token_delay:
+            # a non-streamed reply arrives once the whole generation is done
+            time.sleep(self.token_delay * (len(content) // 4))
+        prompt_tokens = sum(len(m.get('content', '').split()) for m in payload.get('messages', []))
+        if openai:
+            self._send_json(200, {
+                'model': payload.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(content.split())},
+            })
+            return
+        self._send_json(200, {
+            'model': payload.get('model'),
+            'message': {'role': 'assistant', 'content': content},
+            'done': True,
+            'prompt_eval_count': prompt_tokens,
+            'eval_count': len(content.split()),
+        })
+
+    def _write_chunk(self, obj):
+        data = (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def _stream(self, payload, content):
+        # NDJSON over chunked encoding, like Ollama's /api/chat with stream=true
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+        for n, tok in enumerate(tokens):
+            if n and self.token_delay:
+                time.sleep(self.token_delay)
+            self._write_chunk({'model': payload.get('model'),
+                               'message': {'role': 'assistant', 'content': tok}, 'done': False})
+        self._write_chunk({'model': payload.get('model'), 'message': {'role': 'assistant', 'content': ''},
+                           'done': True, 'eval_count': len(tokens)})
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _stream_openai(self, payload, content):
+        # server-sent events over chunked encoding, ending with 'data: [DONE]'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for n, i in enumerate(range(0, len(content), 4)):
+            if n and self.token_delay:
+                time.sleep(self.token_delay)
+            delta = {'model': payload.get('model'), 'choices': [{'index': 0, 'delta': {'content': content[i:i + 4]}}]}
+            self._write_event(json.dumps(delta, ensure_ascii=False))
+        self._write_event('[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_event(self, data):
+        data = f'data: {data}\n\n'.encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+
+def serve(port=0, latency_ms=0.0, fail_rate=0.0, token_ms=0.0, prose_rate=0.0, format_support=True):
+    """Start the stub in a daemon thread; returns the server (server.server_port is the port).
+
+    latency_ms is the time to the first token; streamed replies then send one
+    token (a few characters) every token_ms.
+    """
+    handler = type('Handler', (StubHandler,), {'latency': latency_ms / 1000.0, 'fail_rate': fail_rate,
+                                               'token_delay': token_ms / 1000.0, 'prose_rate': prose_rate,
+                                               'format_support': format_support})
+    server_cls = type('Server', (ThreadingHTTPServer,), {'request_queue_size': 128})
+    server = server_cls(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--token-ms', type=float, default=0.0)
+    parser.add_argument('--prose-rate', type=float, default=0.0)
+    parser.add_argument('--no-format', action='store_true')
+    args = parser.parse_args()
+    server = serve(args.port, args.latency_ms, args.fail_rate, args.token_ms, args.prose_rate, not args.no_format)
+    print(f"stub ollama on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,92 @@
+import os
+import time
+import threading
+
+from embedder import embed_text
+from vector_index import VectorIndex
+
+# optional: answer paraphrased player messages from past replies
+SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', '0') == '1'
+# cosine similarity above which a past reply is reused
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.85'))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', '20000'))
+SEMANTIC_CACHE_TTL = float(os.environ.get('SEMANTIC_CACHE_TTL', '86400'))
+
+
+class SemanticCache:
+    """Past (message, reply) pairs found again by meaning, not by wording.
+
+    Messages are embedded with embedder.embed_text (the local model when
+    EMBED_MODEL is set, otherwise the hashing vectorizer, which needs no
+    download) and kept in a VectorIndex grouped by universe, so a reply is
+    only ever reused inside the universe it was written for. VectorIndex has
+    no deletes: expired entries are skipped on lookup and the index is
+    rebuilt with the newest entries when it outgrows ``max_entries``.
+    """
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl=SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._index = VectorIndex()
+        self._entries = []  # key -> (message, reply, universe, vector, created)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _scope(universe):
+        # messages without a universe share their own scope instead of matching every universe
+        return universe or ''
+
+    def lookup(self, message, universe=None):
+        """(reply, similarity) of the closest past message in the universe; reply is None below threshold."""
+        vec = embed_text(message)
+        now = time.time()
+        with self._lock:
+            best = None, 0.0
+            for key, score in self._index.search(vec, top_k=3, group=self._scope(universe)):
+                _, reply, _, _, created = self._entries[key]
+                if now - created <= self.ttl:
+                    best = reply, score
+                    break
+            if best[0] is not None and best[1] >= self.threshold:
+                self.hits += 1
+                return best
+            self.misses += 1
+            return None, best[1]
+
+    def add(self, message, reply, universe=None):
+        vec = embed_text(message)
+        with self._lock:
+            key = len(self._entries)
+            self._entries.append((message, reply, self._scope(universe), vec, time.time()))
+            self._index.add(key, vec, self._scope(universe))
+            if len(self._entries) > self.max_entries:
+                self._rebuild()
+
+    def _rebuild(self):
+        now = time.time()
+        keep = [e for e in self._entries[-int(self.max_entries * 0.9):] if now - e[4] <= self.ttl]
+        self._entries = keep
+        self._index = VectorIndex()
+        if keep:
+            self._index.add_many(list(range(len(keep))), [e[3] for e in keep], [e[2] for e in keep])
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / total, 4) if total else 0.0, 'threshold': self.threshold}
+
+
+_semantic_cache = None
+
+
+def get_semantic_cache():
+    """Process-wide semantic cache, or None unless SEMANTIC_CACHE_ENABLED=1."""
+    global _semantic_cache
+    if _semantic_cache is None and SEMANTIC_CACHE_ENABLED:
+        _semantic_cache = SemanticCache()
+    return _semantic_cache
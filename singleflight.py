@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import copy
+import tempfile
+import threading
+from collections import deque
+
+from filelock import FileLock, Timeout
+
+import atomic_io
+
+# lock/result files used to coalesce identical calls across gunicorn workers
+SINGLEFLIGHT_DIR = os.environ.get('LLM_SINGLEFLIGHT_DIR',
+                                  os.path.join(tempfile.gettempdir(), 'universaltime-singleflight'))
+SINGLEFLIGHT_CROSS_PROCESS = os.environ.get('LLM_SINGLEFLIGHT_CROSS_PROCESS', '1') != '0'
+# how long a finished call's result stays readable by workers that waited on it
+RESULT_TTL = 30.0
+# lock files idle this long are removed by the periodic sweep
+STALE_FILE_AGE = 3600.0
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.private = False  # the result may not be handed to other callers
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution.
+
+    Within a process the first caller (leader) runs the function and the
+    others block on it and get a copy of its result. Across processes the
+    leader also holds a per-key lock file while it runs and leaves the result
+    next to it, so a leader in another worker that was waiting on the lock
+    picks that result up instead of repeating the call. Errors are not
+    shared across processes: the next worker simply tries again.
+    """
+
+    def __init__(self, directory=SINGLEFLIGHT_DIR, cross_process=SINGLEFLIGHT_CROSS_PROCESS):
+        self.directory = directory
+        self.cross_process = cross_process
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._recent = deque()  # timestamps of coalesced calls, for the per-minute rate
+        self._last_sweep = 0.0
+        self.leaders = 0
+        self.coalesced_local = 0
+        self.coalesced_remote = 0
+
+    def _coalesced(self, kind):
+        now = time.time()
+        with self._lock:
+            if kind == 'local':
+                self.coalesced_local += 1
+            else:
+                self.coalesced_remote += 1
+            self._recent.append(now)
+
+    def do(self, key, fn, timeout=None, share=None):
+        """Run ``fn()`` once per key in flight; returns ``(result, shared)``.
+
+        ``shared`` is True when the result came from another caller's call.
+        A result for which ``share(result)`` is false stays with its caller:
+        the callers waiting on it run ``fn()`` themselves.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+        if not leader:
+            self._coalesced('local')
+            if not call.done.wait(timeout):
+                raise TimeoutError(f'single-flight call {key[:12]} did not finish in {timeout}s')
+            if call.error is not None:
+                raise call.error
+            if call.private:
+                return fn(), False
+            return copy.deepcopy(call.result), True
+        try:
+            call.result, shared = self._run(key, fn, timeout, share)
+            call.private = share is not None and not share(call.result)
+            return copy.deepcopy(call.result), shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _run(self, key, fn, timeout, share=None):
+        if not self.cross_process:
+            return fn(), False
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, key)
+        started = time.time()
+        try:
+            with FileLock(base + '.lock', timeout=-1 if timeout is None else timeout):
+                shared = self._read_result(base + '.json', started)
+                if shared is not None:
+                    self._coalesced('remote')
+                    return shared, True
+                result = fn()
+                if share is not None and not share(result):
+                    return result, False
+                atomic_io.write_files([(base + '.json', json.dumps(result, ensure_ascii=False).encode('utf-8'))],
+                                      durability='relaxed')
+        except Timeout:
+            # the other worker's call is taking too long: do our own
+            return fn(), False
+        self._sweep()
+        return result, False
+
+    def _read_result(self, path, since):
+        try:
+            st = os.stat(path)
+            # only results produced while we were waiting on the lock count
+            if st.st_mtime < since or time.time() - st.st_mtime > RESULT_TTL:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _sweep(self):
+        now = time.time()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            limit = RESULT_TTL if name.endswith('.json') else STALE_FILE_AGE
+            try:
+                if now - os.stat(path).st_mtime > limit:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            return {
+                'leaders': self.leaders,
+                'coalesced_local': self.coalesced_local,
+                'coalesced_remote': self.coalesced_remote,
+                'coalesced_last_minute': len(self._recent),
+                'in_flight': len(self._calls),
+            }
+
+
+_singleflight = None
+
+
+def get_singleflight():
+    global _singleflight
+    if _singleflight is None:
+        _singleflight = SingleFlight()
+    return _singleflight
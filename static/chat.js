@@ -176,19 +176,43 @@ async function sendAction(event) {
     // Show loading
     loadingSpinner.style.display = 'block';
     
+    let liveMessage = null;
     try {
-        // Nuevo endpoint híbrido con Groq
-        const response = await fetch('/ai/message', {
+        // Versión streaming: la narrativa se va mostrando mientras el modelo la genera
+        const response = await fetch('/ai/message/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 playerId: gameState.characterId || gameState.studentName || 'player',
+                universe_id: gameState.universeId,
                 message: prompt
             }),
         });
-        const data = await response.json();
+        let data;
+        const contentType = response.headers.get('Content-Type') || '';
+        if (response.ok && contentType.startsWith('text/event-stream')) {
+            await readEventStream(response, (eventName, payload) => {
+                if (eventName === 'narrative') {
+                    if (!liveMessage) {
+                        loadingSpinner.style.display = 'none';
+                        liveMessage = addMessage('📖 ', 'ai');
+                    }
+                    liveMessage.querySelector('.content').textContent += payload.text;
+                    messagesBox.scrollTop = messagesBox.scrollHeight;
+                } else if (eventName === 'done') {
+                    data = payload;
+                }
+            });
+            // la respuesta completa sustituye al texto parcial
+            if (liveMessage) liveMessage.remove();
+            liveMessage = null;
+            if (!data) throw new Error('stream interrumpido');
+        } else {
+            // respuesta local, rate limit o error: JSON normal
+            data = await response.json();
+        }
         if (response.ok) {
-            // El nuevo endpoint retorna: { reply, effects, choices, source, tokensUsed, eventId }
+            // El endpoint retorna: { reply, effects, choices, source, tokensUsed, eventId }
             const narrative = data.reply || 'Sin respuesta';
             const effects = data.effects || {};
             const imageUrl = null;
@@ -200,6 +224,7 @@ async function sendAction(event) {
             addMessage(`❌ Error: ${data.error || 'Error desconocido'}`, 'system');
         }
     } catch (error) {
+        if (liveMessage) liveMessage.remove();
         console.error('Error sending action:', error);
         addMessage(`❌ Error de conexión: ${error.message}`, 'system');
     } finally {
@@ -207,6 +232,54 @@ async function sendAction(event) {
     }
 }
 
+// Read a server-sent events body from fetch() and call onEvent(name, data) per event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+            let eventName = 'message';
+            let dataText = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataText += line.slice(5).trim();
+            });
+            if (dataText) onEvent(eventName, JSON.parse(dataText));
+        }
+    }
+}
+
+// POST to an LLM endpoint as a background job and poll /api/jobs/<id> until it finishes.
+// Resolves to a fetch-like { ok, status, json() } with the endpoint's final answer.
+async function postJob(url, body) {
+    const resp = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Prefer': 'respond-async' },
+        body: JSON.stringify(body),
+    });
+    if (resp.status !== 202) return resp;
+    const { job_id } = await resp.json();
+    let delay = 300;
+    while (true) {
+        await new Promise(r => setTimeout(r, delay));
+        delay = Math.min(delay * 1.5, 1500);
+        const job = await (await fetch(`/api/jobs/${job_id}`)).json();
+        if (job.status === 'done' || job.status === 'error') {
+            const status = job.http_status || 500;
+            const data = job.status === 'done' ? job.result : { error: job.error || 'job failed' };
+            return { ok: status >= 200 && status < 300, status, json: async () => data };
+        }
+        if (job.error === 'not found') throw new Error('job perdido');
+    }
+}
+
 // Show AI response with narrative, effects, choices and image
 function showAIResponse(narrative, effects, imageUrl=null, imageNote=null, choices=[], eventId=null) {
     const content = document.createElement('div');
@@ -280,11 +353,7 @@ function showAIResponse(narrative, effects, imageUrl=null, imageNote=null, choic
         translateBtn.textContent = '⏳ Traduciendo...';
         
         try {
-            const resp = await fetch('/api/translate', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ text: narrative, target_lang: 'Spanish' }),
-            });
+            const resp = await postJob('/api/translate', { text: narrative, target_lang: 'Spanish' });
             const data = await resp.json();
             
             translatedSpan.innerHTML = `📝 <strong>En Español:</strong> ${data.translated}`;
@@ -445,6 +514,7 @@ function addMessage(text, type) {
     
     // Auto-scroll to bottom
     messagesBox.scrollTop = messagesBox.scrollHeight;
+    return msgEl;
 }
 
 // Add message element (for complex HTML content)
@@ -590,10 +660,7 @@ async function applyChoice(payload) {
         // Mostrar la opción elegida como mensaje del usuario
         addMessage(payload.choice_text, 'user');
         // Llamar al backend para procesar la opción como mensaje nuevo
-        const resp = await fetch('/api/choice', {
-            method: 'POST', headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify(payload)
-        });
+        const resp = await postJob('/api/choice', payload);
         let data = null;
         try {
             data = await resp.json();
@@ -761,16 +828,12 @@ async function startMissionLLM(mission) {
     const resultDiv = document.getElementById('missionStartResult');
     resultDiv.innerHTML = 'Generando narrativa...';
     try {
-        const resp = await fetch('/api/mission/start', {
-            method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({
-                mission_id: mission.id,
-                character_id: gameState.characterId,
-                universe_id: gameState.universeId,
-                student: gameState.studentName,
-                class_number: gameState.classNumber
-            })
+        const resp = await postJob('/api/mission/start', {
+            mission_id: mission.id,
+            character_id: gameState.characterId,
+            universe_id: gameState.universeId,
+            student: gameState.studentName,
+            class_number: gameState.classNumber
         });
         const data = await resp.json();
         if (resp.ok && data.narrative) {
@@ -1,85 +1,473 @@
 import os
 import json
+import time
 import uuid
+import threading
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
 from filelock import FileLock
 
+import atomic_io
+from effects_parser import parse_effects
+from event_log import EventLog, migrate_json_array
+from embedding_store import EmbeddingStore
+from history_store import HistoryStore
+
 # Per-event caps and totals (tighter limits to avoid runaway gains)
 MAX_POINTS_DELTA = 100
 MAX_MONEY_DELTA = 500
 MAX_TOTAL_POINTS = 5000
 MAX_TOTAL_MONEY = 5000
 
+# the app's data directory, used by get_storage()
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# json (default) | sqlite
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+SQLITE_PATH = os.environ.get('STORAGE_SQLITE_PATH', '')
+
+# documents every backend stores, with their initial content
+DOCUMENT_DEFAULTS = {
+    'multiverse': {'name': 'Semestre Demo', 'universes': []},
+    'universes': [],
+    'characters': [],
+    'evaluations': [],
+    'market': [],
+    'missions': [],
+}
+
+# secondary indexes per document (field -> set of ids)
+INDEX_FIELDS = {'characters': ('currentUniverse',)}
+
+# A file modified this recently may be rewritten again within the same mtime
+# tick by another worker, so its cached copy is not trusted until it settles.
+CACHE_RACY_WINDOW_NS = 50_000_000
+
+
+def _json_copy(obj):
+    """Copy a parsed JSON document; cheaper than copy.deepcopy for plain dicts/lists."""
+    if isinstance(obj, dict):
+        return {k: _json_copy(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_json_copy(v) for v in obj]
+    return obj
+
+
+def _normalize_life(c):
+    """Normalize a character's lifePercent to a fraction (0-1) in place."""
+    if 'lifePercent' in c:
+        lp = c.get('lifePercent')
+        if lp is None:
+            return
+        # If value looks like percent (>1), convert to fraction
+        try:
+            val = float(lp)
+            if val > 1:
+                c['lifePercent'] = max(0.0, min(1.0, val / 100.0))
+            else:
+                c['lifePercent'] = max(0.0, min(1.0, val))
+        except Exception:
+            c['lifePercent'] = 1.0
+
 
-class Storage:
-    def __init__(self, data_dir):
+class _Doc:
+    """A parsed JSON document as cached by Storage, plus lazily built id indexes."""
+
+    __slots__ = ('key', 'data', '_index')
+
+    def __init__(self, key, data):
+        self.key = key
+        self.data = data
+        self._index = None
+
+    def index(self, fields=()):
+        """{'id': {id: position}, field: {value: set(ids)}} for list documents."""
+        if self._index is None:
+            idx = {'id': {}}
+            idx.update({f: {} for f in fields})
+            if isinstance(self.data, list):
+                for pos, item in enumerate(self.data):
+                    if not isinstance(item, dict) or item.get('id') is None:
+                        continue
+                    eid = item['id']
+                    if eid in idx['id']:
+                        continue  # first occurrence wins, as with a linear scan
+                    idx['id'][eid] = pos
+                    for f in fields:
+                        idx[f].setdefault(item.get(f), set()).add(eid)
+            self._index = idx
+        return self._index
+
+    def with_entities(self, entities, fields=()):
+        """New _Doc with entities inserted or replaced by id.
+
+        This document (possibly shared through the cache) is left untouched;
+        its indexes are copied and patched rather than rebuilt.
+        """
+        old_idx = self.index(fields)
+        idx = {'id': dict(old_idx['id'])}
+        idx.update({f: {v: set(ids) for v, ids in old_idx[f].items()} for f in fields})
+        data = list(self.data)
+        for entity in entities:
+            ent = _json_copy(entity)
+            eid = ent.get('id')
+            pos = idx['id'].get(eid)
+            old = None
+            if pos is None:
+                idx['id'][eid] = len(data)
+                data.append(ent)
+            else:
+                old = data[pos]
+                data[pos] = ent
+            for f in fields:
+                if old is not None:
+                    idx[f].get(old.get(f), set()).discard(eid)
+                idx[f].setdefault(ent.get(f), set()).add(eid)
+        doc = _Doc(self.key, data)
+        doc._index = idx
+        return doc
+
+
+class _JsonTransaction:
+    """Pending changes of a JsonBackend transaction; reads see earlier puts."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.puts = {name: {} for name in docs}
+        self.event_updates = []
+
+    def get(self, name, eid):
+        if eid in self.puts[name]:
+            return _json_copy(self.puts[name][eid])
+        doc = self.docs[name]
+        pos = doc.index(INDEX_FIELDS.get(name, ()))['id'].get(eid)
+        return None if pos is None else _json_copy(doc.data[pos])
+
+    def put(self, name, entity):
+        self.puts[name][entity.get('id')] = _json_copy(entity)
+
+    def update_event(self, eid, event):
+        self.event_updates.append((eid, event))
+
+
+class JsonBackend:
+    """One JSON file per document guarded by filelock, plus the event journal.
+
+    Parsed documents are cached in memory and validated against the file's
+    (mtime, size, inode) on every read, so other gunicorn workers' writes are
+    picked up; hits are served without taking the file lock. Cached documents
+    are never mutated, and the cache itself is shared by request and job
+    threads under ``_cache_lock``.
+    """
+
+    name = 'json'
+
+    def __init__(self, data_dir, embeddings):
         self.data_dir = data_dir
-        os.makedirs(self.data_dir, exist_ok=True)
-        self.multiverse_path = os.path.join(self.data_dir, 'multiverse.json')
-        self.events_path = os.path.join(self.data_dir, 'events.json')
-        self.universes_path = os.path.join(self.data_dir, 'universes.json')
-        self.characters_path = os.path.join(self.data_dir, 'characters.json')
-        self._ensure_files()
-
-    def _ensure_files(self):
-        for p, default in [
-            (self.multiverse_path, {'name': 'Semestre Demo', 'universes': []}),
-            (self.events_path, []),
-            (self.universes_path, []),
-            (self.characters_path, []),
-            (os.path.join(self.data_dir, 'evaluations.json'), []),
-            (os.path.join(self.data_dir, 'market.json'), []),
-            (os.path.join(self.data_dir, 'missions.json'), []),
-        ]:
+        self.paths = {name: os.path.join(data_dir, f'{name}.json') for name in DOCUMENT_DEFAULTS}
+        # legacy JSON array; only read once to seed the journal
+        self.events_path = os.path.join(data_dir, 'events.json')
+        self.events_log_path = os.path.join(data_dir, 'events.jsonl')
+        # path -> _Doc; validated against the file's stat on every read
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._ensure_files(embeddings)
+        self.event_log = EventLog(self.events_log_path)
+
+    def _ensure_files(self, embeddings):
+        # every gunicorn worker gets here at import: check again under the file
+        # lock so only one of them migrates or creates a file
+        if not os.path.exists(self.events_log_path) and os.path.exists(self.events_path):
+            with self._lock(self.events_log_path):
+                if not os.path.exists(self.events_log_path):
+                    # inline embedding lists move to the binary sidecar on the way in
+                    n = migrate_json_array(self.events_path, self.events_log_path,
+                                           transform=embeddings.externalize)
+                    print(f"[STORAGE] Migrated {n} events from {self.events_path} to {self.events_log_path}")
+        for name, default in DOCUMENT_DEFAULTS.items():
+            p = self.paths[name]
             if not os.path.exists(p):
-                with open(p, 'w', encoding='utf-8') as f:
-                    json.dump(default, f, ensure_ascii=False, indent=2)
+                with self._lock(p):
+                    if not os.path.exists(p):
+                        self._replace_json(p, default)
 
     def _lock(self, path):
         return FileLock(path + '.lock')
 
-    def load_json(self, path):
+    def _stat_key(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _remember(self, path, doc):
+        with self._cache_lock:
+            if doc.key is None or time.time_ns() - doc.key[0] < CACHE_RACY_WINDOW_NS:
+                self._cache.pop(path, None)
+                return
+            cached = self._cache.get(path)
+            # a slower thread must not put back a copy older than the one just stored
+            if cached is not None and cached.key is not None and cached.key[0] > doc.key[0]:
+                return
+            self._cache[path] = doc
+
+    def _read_doc(self, path):
+        """Cached _Doc for path. Its data is shared: callers must not mutate it."""
+        # Served from memory while mtime/size/inode are unchanged, so other
+        # gunicorn workers' writes invalidate it; no file lock on a hit.
+        doc = self._cache.get(path)
+        if doc is not None and doc.key == self._stat_key(path):
+            with self._cache_lock:
+                self._cache_hits += 1
+            return doc
+        with self._cache_lock:
+            self._cache_misses += 1
         lock = self._lock(path)
         with lock:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            doc = self._read_doc_locked(path)
+        self._remember(path, doc)
+        return doc
+
+    def _read_doc_locked(self, path):
+        key = self._stat_key(path)
+        doc = self._cache.get(path)
+        if doc is not None and doc.key == key:
+            return doc
+        with open(path, 'r', encoding='utf-8') as f:
+            return _Doc(key, json.load(f))
+
+    def _dumps(self, data):
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def load_json(self, path):
+        return _json_copy(self._read_doc(path).data)
 
     def save_json(self, path, data):
         lock = self._lock(path)
         with lock:
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            self._replace_json(path, data)
+            # write-through: the next read in this process skips the parse
+            self._remember(path, _Doc(self._stat_key(path), _json_copy(data)))
+
+    def _get_entity(self, path, eid, fields=()):
+        doc = self._read_doc(path)
+        pos = doc.index(fields)['id'].get(eid)
+        return None if pos is None else _json_copy(doc.data[pos])
+
+    def _put_entity(self, path, entity, fields=()):
+        """Insert or replace one id-keyed entity, updating the indexes incrementally."""
+        lock = self._lock(path)
+        with lock:
+            self._commit_doc(path, self._read_doc_locked(path).with_entities([entity], fields))
+
+    def _commit_doc(self, path, doc):
+        self._commit_docs([(path, doc)])
+
+    def _commit_docs(self, docs):
+        # caller holds the file locks; all documents go out as one durable group
+        atomic_io.write_files([(path, self._dumps(doc.data)) for path, doc in docs])
+        for path, doc in docs:
+            doc.key = self._stat_key(path)
+            self._remember(path, doc)
+
+    def _replace_json(self, path, data):
+        """Write to a temp file and rename over path, so readers never see a torn file."""
+        atomic_io.write_files([(path, self._dumps(data))])
+
+    @contextmanager
+    def transaction(self, names):
+        """Unit of work over several documents plus event updates.
+
+        File locks are taken once in a fixed order (documents sorted by name,
+        then the event journal) so concurrent transactions cannot deadlock or
+        interleave; each document is read once and rewritten once on commit.
+        """
+        names = sorted(set(names))
+        with ExitStack() as stack:
+            for name in names:
+                stack.enter_context(self._lock(self.paths[name]))
+            stack.enter_context(self.event_log.lock)
+            tx = _JsonTransaction({n: self._read_doc_locked(self.paths[n]) for n in names})
+            yield tx
+            self._commit_docs([
+                (self.paths[name], tx.docs[name].with_entities(tx.puts[name].values(), INDEX_FIELDS.get(name, ())))
+                for name in names if tx.puts[name]
+            ])
+            for eid, event in tx.event_updates:
+                self.event_log.update(eid, event)
+
+    def stats(self):
+        total = self._cache_hits + self._cache_misses
+        return {
+            'backend': self.name,
+            'hits': self._cache_hits,
+            'misses': self._cache_misses,
+            'hit_rate': round(self._cache_hits / total, 4) if total else 0.0,
+            'entries': len(self._cache),
+            **atomic_io.stats(),
+        }
+
+    def load(self, name):
+        return self.load_json(self.paths[name])
+
+    def save(self, name, data):
+        self.save_json(self.paths[name], data)
+
+    def get(self, name, eid):
+        return self._get_entity(self.paths[name], eid, INDEX_FIELDS.get(name, ()))
+
+    def put(self, name, entity):
+        self._put_entity(self.paths[name], entity, INDEX_FIELDS.get(name, ()))
+
+    def _find_positions(self, name, field, value):
+        doc = self._read_doc(self.paths[name])
+        fields = INDEX_FIELDS.get(name, ())
+        if field in fields:
+            idx = doc.index(fields)
+            return doc, sorted(idx['id'][eid] for eid in idx[field].get(value, ()))
+        return doc, [i for i, e in enumerate(doc.data) if isinstance(e, dict) and e.get(field) == value]
+
+    def find(self, name, field, value):
+        doc, positions = self._find_positions(name, field, value)
+        return [_json_copy(doc.data[p]) for p in positions]
+
+    def count(self, name, field, value):
+        doc = self._read_doc(self.paths[name])
+        fields = INDEX_FIELDS.get(name, ())
+        if field in fields:
+            return len(doc.index(fields)[field].get(value, ()))
+        return len(self._find_positions(name, field, value)[1])
+
+    def load_events(self):
+        return self.event_log.load()
+
+    def get_event(self, eid):
+        return self.event_log.get(eid)
+
+    def append_event(self, event):
+        self.event_log.append(event)
+
+    def update_event(self, eid, event):
+        return self.event_log.update(eid, event)
+
+    def replace_events(self, events):
+        """Replace the whole timeline (import tool)."""
+        self.event_log.replace(events)
+
+
+def make_backend(name, data_dir, embeddings):
+    if name == 'sqlite':
+        from storage_sqlite import SqliteBackend
+        return SqliteBackend(SQLITE_PATH or os.path.join(data_dir, 'game.db'), data_dir, embeddings)
+    return JsonBackend(data_dir, embeddings)
+
+
+def copy_backend(src, dst):
+    """Copy every document and the event timeline from one backend to another."""
+    for name in DOCUMENT_DEFAULTS:
+        dst.save(name, src.load(name))
+    events = src.load_events()
+    dst.replace_events(events)
+    return len(events)
+
+
+class Storage:
+    def __init__(self, data_dir, backend=None):
+        self.data_dir = data_dir
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.embeddings_path = os.path.join(self.data_dir, 'event_embeddings.bin')
+        self.embeddings = EmbeddingStore(self.embeddings_path)
+        self.backend = make_backend(backend or STORAGE_BACKEND, self.data_dir, self.embeddings)
+        # older character history / universe timeline entries live in segments here
+        self.history = HistoryStore(os.path.join(self.data_dir, 'history'))
+        if not self.embeddings.current():
+            n = self.embeddings.reembed(self._embedding_texts)
+            print(f"[STORAGE] Re-embedded {n} event vectors written by another embedder")
+
+    def _embedding_texts(self, rows):
+        # the prompt of the event owning each sidecar row
+        texts = [None] * rows
+        for e in self.load_events():
+            row = e.get('embedding_row') if isinstance(e, dict) else None
+            if isinstance(row, int) and 0 <= row < rows:
+                texts[row] = e.get('prompt') or ''
+        return texts
+
+    def cache_stats(self):
+        return self.backend.stats()
 
     def load_multiverse(self):
-        return self.load_json(self.multiverse_path)
+        return self.backend.load('multiverse')
 
     def load_events(self):
-        return self.load_json(self.events_path)
+        return self.backend.load_events()
+
+    def get_event(self, eid):
+        return self.backend.get_event(eid)
+
+    def add_embedding(self, vector):
+        """Store an event embedding in the sidecar matrix and return its row."""
+        return self.embeddings.append(vector)
+
+    def load_embeddings(self):
+        """Memory-mapped (rows, dim) matrix indexed by event ``embedding_row``."""
+        return self.embeddings.matrix()
 
     def load_evaluations(self):
-        return self.load_json(os.path.join(self.data_dir, 'evaluations.json'))
+        return self.backend.load('evaluations')
 
     def save_evaluations(self, data):
-        return self.save_json(os.path.join(self.data_dir, 'evaluations.json'), data)
+        return self.backend.save('evaluations', data)
 
     def load_market(self):
-        return self.load_json(os.path.join(self.data_dir, 'market.json'))
+        return self.backend.load('market')
 
     def save_market(self, data):
-        return self.save_json(os.path.join(self.data_dir, 'market.json'), data)
+        return self.backend.save('market', data)
 
     def load_missions(self):
-        return self.load_json(os.path.join(self.data_dir, 'missions.json'))
+        return self.backend.load('missions')
 
     def load_universes(self):
-        return self.load_json(self.universes_path)
+        return self.backend.load('universes')
+
+    def get_universe(self, uid):
+        return self.backend.get('universes', uid)
 
     def load_universe(self, uid):
-        us = self.load_universes()
-        for u in us:
-            if u.get('id') == uid:
-                return u
-        return {}
+        return self.get_universe(uid) or {}
+
+    def save_universe(self, universe):
+        self.backend.put('universes', universe)
+
+    def get_character(self, cid):
+        """Single character by id via the id index (no roster scan)."""
+        c = self.backend.get('characters', cid)
+        if c is not None:
+            _normalize_life(c)
+        return c
+
+    def load_character_history(self, character):
+        """Full history of a character (rolled segments plus the inline tail)."""
+        return self.history.load(character, 'history')
+
+    def load_universe_timeline(self, universe):
+        return self.history.load(universe, 'timeline')
+
+    def save_character(self, character):
+        """Insert or replace one character; id and universe indexes are updated in place."""
+        self.backend.put('characters', character)
+
+    def characters_in_universe(self, uid):
+        chars = self.backend.find('characters', 'currentUniverse', uid)
+        for c in chars:
+            _normalize_life(c)
+        return chars
+
+    def count_characters_in_universe(self, uid):
+        return self.backend.count('characters', 'currentUniverse', uid)
 
     def fork_universe(self, universe_id, reason='paradox'):
         """Create a forked copy of a universe (paradox handling).
@@ -96,47 +484,43 @@ class Storage:
 
         # Create new universe id
         new_id = f"{target.get('id')}_fork_{int(datetime.utcnow().timestamp())}"
-        new_univ = dict(target)
+        new_univ = _json_copy(target)
         new_univ['id'] = new_id
         new_univ['name'] = target.get('name', '') + ' (Fork)'
         new_univ['previousState'] = target.get('currentState')
+        # the fork starts an empty timeline: no parent count, aggregates or segments
         new_univ['timeline'] = []
+        new_univ.pop('timeline_stats', None)
         new_univ['fork_reason'] = reason
 
         universes.append(new_univ)
-        self.save_json(self.universes_path, universes)
+        self.backend.save('universes', universes)
 
         # Duplicate characters belonging to original universe
         chars = self.load_characters()
         new_chars = []
         for c in chars:
             if c.get('currentUniverse') == universe_id:
-                newc = dict(c)
+                newc = _json_copy(c)
                 newc['id'] = f"{c.get('id')}_fork_{int(datetime.utcnow().timestamp())}"
                 newc['originCharacter'] = c.get('id')
                 newc['currentUniverse'] = new_id
                 # keep history but mark fork
-                newc.setdefault('history', []).append({'event_id': None, 'effects': {'note': 'forked copy'}})
+                self.history.append('characters', newc, 'history', {'event_id': None, 'effects': {'note': 'forked copy'}})
                 new_chars.append(newc)
 
         if new_chars:
             chars.extend(new_chars)
-            self.save_json(self.characters_path, chars)
+            self.backend.save('characters', chars)
 
         return new_univ
 
     def validate_action(self, payload):
         # Basic validation following rule 9 and universe change costs.
         # If the character belongs to a different universe, require a change_type (A-E) or assume 'C'.
-        chars = self.load_characters()
-        universes = self.load_universes()
-        char = next((c for c in chars if c.get('id') == payload['character_id']), None)
+        char = self.get_character(payload['character_id'])
         # load universe rules if present
-        universe = None
-        for u in universes:
-            if u.get('id') == payload.get('universe_id'):
-                universe = u
-                break
+        universe = self.get_universe(payload.get('universe_id'))
         if not char:
             return {'valid': True}
 
@@ -162,9 +546,8 @@ class Storage:
 
         # Additional global checks: ensure universe has at least 2 students (rule 2)
         try:
-            # Count characters assigned to this universe
-            chars = self.load_characters()
-            count = sum(1 for c in chars if c.get('currentUniverse') == payload.get('universe_id'))
+            # Count characters assigned to this universe (O(1) from the universe index)
+            count = self.count_characters_in_universe(payload.get('universe_id'))
             if count < 2:
                 return {'valid': False, 'reason': 'universe must have at least 2 students/characters'}
         except Exception:
@@ -173,23 +556,11 @@ class Storage:
         return {'valid': True}
 
     def load_characters(self):
-        chars = self.load_json(self.characters_path)
+        chars = self.backend.load('characters')
         # normalize lifePercent to fraction (0-1)
         try:
             for c in chars:
-                if 'lifePercent' in c:
-                    lp = c.get('lifePercent')
-                    if lp is None:
-                        continue
-                    # If value looks like percent (>1), convert to fraction
-                    try:
-                        val = float(lp)
-                        if val > 1:
-                            c['lifePercent'] = max(0.0, min(1.0, val / 100.0))
-                        else:
-                            c['lifePercent'] = max(0.0, min(1.0, val))
-                    except Exception:
-                        c['lifePercent'] = 1.0
+                _normalize_life(c)
         except Exception:
             pass
         return chars
@@ -205,22 +576,15 @@ class Storage:
             'prompt': payload['prompt'],
             'class_number': payload['class_number'],
             'result': None,
-            'embedding': None,
+            'embedding_row': None,
         }
         return event
 
     def append_event(self, event):
-        events = self.load_events()
-        events.append(event)
-        self.save_json(self.events_path, events)
+        self.backend.append_event(event)
 
     def update_event(self, eid, new_event):
-        events = self.load_events()
-        for i, e in enumerate(events):
-            if e.get('id') == eid:
-                events[i] = new_event
-                self.save_json(self.events_path, events)
-                return
+        self.backend.update_event(eid, new_event)
 
     def apply_event_result(self, event, response_text):
         # Expecting LLM to return a JSON string with 'effects' and 'narrative'
@@ -229,7 +593,7 @@ class Storage:
         except Exception:
             # If not JSON, attempt to extract effects heuristically from the narrative
             cleaned = self._clean_narrative_text(response_text)
-            effects = self._parse_effects_from_text(cleaned)
+            effects = parse_effects(cleaned)
             if effects:
                 # apply parsed effects
                 data = {'effects': effects, 'narrative': cleaned}
@@ -277,58 +641,62 @@ class Storage:
             event['choices'] = choices
         # Normalize effect keys (handle different capitalizations and synonyms)
         effects = self._normalize_effects(effects)
-        # Apply universe difficulty modifiers if present
-        try:
-            uni = self.load_universe(event.get('universe_id'))
-            rules = uni.get('rules', {}) if isinstance(uni, dict) else {}
-            difficulty = rules.get('difficulty', 'normal')
-            if difficulty == 'hard':
-                # Make life losses harsher, reduce positive rewards
-                if 'lifePercent' in effects:
-                    try:
-                        v = float(effects.get('lifePercent'))
-                        if v < 0:
-                            effects['lifePercent'] = v * 1.5
-                    except Exception:
-                        pass
-                if 'points' in effects and effects.get('points', 0) > 0:
-                    try:
-                        effects['points'] = int(effects.get('points') * 0.7)
-                    except Exception:
-                        pass
-                if 'money' in effects and effects.get('money', 0) > 0:
-                    try:
-                        effects['money'] = int(effects.get('money') * 0.7)
-                    except Exception:
-                        pass
-        except Exception:
-            pass
-
-        # Clamp per-event numeric deltas to prevent runaway gains
-        if 'points' in effects:
-            try:
-                pv = float(effects['points'])
-                pv = max(-MAX_POINTS_DELTA, min(MAX_POINTS_DELTA, pv))
-                effects['points'] = int(pv) if pv.is_integer() else pv
-            except Exception:
-                pass
-        if 'money' in effects:
+        # One unit of work: characters, universes and the event are read once
+        # under their locks and committed together (no lost updates).
+        with self.backend.transaction(('characters', 'universes')) as tx:
+            # Apply universe difficulty modifiers if present
             try:
-                mv = float(effects['money'])
-                mv = max(-MAX_MONEY_DELTA, min(MAX_MONEY_DELTA, mv))
-                effects['money'] = int(mv) if mv.is_integer() else mv
+                uni = tx.get('universes', event.get('universe_id')) or {}
+                rules = uni.get('rules', {}) if isinstance(uni, dict) else {}
+                difficulty = rules.get('difficulty', 'normal')
+                if difficulty == 'hard':
+                    # Make life losses harsher, reduce positive rewards
+                    if 'lifePercent' in effects:
+                        try:
+                            v = float(effects.get('lifePercent'))
+                            if v < 0:
+                                effects['lifePercent'] = v * 1.5
+                        except Exception:
+                            pass
+                    if 'points' in effects and effects.get('points', 0) > 0:
+                        try:
+                            effects['points'] = int(effects.get('points') * 0.7)
+                        except Exception:
+                            pass
+                    if 'money' in effects and effects.get('money', 0) > 0:
+                        try:
+                            effects['money'] = int(effects.get('money') * 0.7)
+                        except Exception:
+                            pass
             except Exception:
                 pass
-        # If narrative missing or empty, create a short synthesized narrative
-        if not data.get('narrative'):
-            data['narrative'] = _synthesize_narrative(effects, event)
-        # Log normalized effects for debugging
-        print(f"[DEBUG] Normalized effects: {effects}")
-        updated_character = None
-        # Update character
-        chars = self.load_characters()
-        for i, c in enumerate(chars):
-            if c.get('id') == event['character_id']:
+
+            # Clamp per-event numeric deltas to prevent runaway gains
+            if 'points' in effects:
+                try:
+                    pv = float(effects['points'])
+                    pv = max(-MAX_POINTS_DELTA, min(MAX_POINTS_DELTA, pv))
+                    effects['points'] = int(pv) if pv.is_integer() else pv
+                except Exception:
+                    pass
+            if 'money' in effects:
+                try:
+                    mv = float(effects['money'])
+                    mv = max(-MAX_MONEY_DELTA, min(MAX_MONEY_DELTA, mv))
+                    effects['money'] = int(mv) if mv.is_integer() else mv
+                except Exception:
+                    pass
+            # If narrative missing or empty, create a short synthesized narrative
+            if not data.get('narrative'):
+                data['narrative'] = _synthesize_narrative(effects, event)
+            # Log normalized effects for debugging
+            print(f"[DEBUG] Normalized effects: {effects}")
+            updated_character = None
+            history_entry = {'event_id': event['id'], 'class_number': event.get('class_number'), 'effects': effects}
+            # Update character
+            c = tx.get('characters', event['character_id'])
+            if c is not None:
+                _normalize_life(c)
                 # apply numeric effects if present
                 for key in ('points', 'money'):
                     if key in effects:
@@ -363,36 +731,33 @@ class Storage:
 
                     print(f"[DEBUG] Life update: current={curf:.2f}, effect={efff}, new={new_frac:.2f}")
                     c['lifePercent'] = new_frac
-                # append history
-                c.setdefault('history', []).append({'event_id': event['id'], 'effects': effects})
+                # append history (bounded inline tail, older entries rolled into segments)
+                self.history.append('characters', c, 'history', history_entry)
                 # handle universe change
                 if effects.get('change_universe_to'):
                     c['currentUniverse'] = effects.get('change_universe_to')
-                chars[i] = c
                 updated_character = c
-                break
-        else:
-            # character not found: create minimal with required initial conditions
-            newc = {
-                'id': event['character_id'],
-                'name': event.get('character_id'),
-                'student': event.get('student'),
-                'history': [{'event_id': event['id'], 'effects': effects}],
-                'currentUniverse': event.get('universe_id'),
-                'lifePercent': 1.0,
-                'points': 0,
-                'money': 0,
-                'status': 'active'
-            }
-            chars.append(newc)
-            updated_character = newc
-
-        self.save_json(self.characters_path, chars)
-
-        # Update universe totals
-        universes = self.load_universes()
-        for i, u in enumerate(universes):
-            if u.get('id') == event['universe_id']:
+            else:
+                # character not found: create minimal with required initial conditions
+                newc = {
+                    'id': event['character_id'],
+                    'name': event.get('character_id'),
+                    'student': event.get('student'),
+                    'history': [],
+                    'currentUniverse': event.get('universe_id'),
+                    'lifePercent': 1.0,
+                    'points': 0,
+                    'money': 0,
+                    'status': 'active'
+                }
+                self.history.append('characters', newc, 'history', history_entry)
+                updated_character = newc
+
+            tx.put('characters', updated_character)
+
+            # Update universe totals
+            u = tx.get('universes', event['universe_id'])
+            if u is not None:
                 # update totals and clamp to configured maximums
                 u['totalPoints'] = u.get('totalPoints', 0) + effects.get('points', 0)
                 try:
@@ -410,14 +775,12 @@ class Storage:
                         u['totalMoney'] = -MAX_TOTAL_MONEY
                 except Exception:
                     pass
-                u.setdefault('timeline', []).append({'event_id': event['id'], 'effects': effects})
-                universes[i] = u
-                break
+                self.history.append('universes', u, 'timeline', history_entry)
+                tx.put('universes', u)
 
-        self.save_json(self.universes_path, universes)
+            event['result'] = data
+            tx.update_event(event['id'], event)
 
-        event['result'] = data
-        self.update_event(event['id'], event)
         return {'updated': True, 'character': updated_character}
 
     def _normalize_effects(self, effects: dict) -> dict:
@@ -522,57 +885,17 @@ class Storage:
             res = res[:800] + '...'
         return res
 
-    def _parse_effects_from_text(self, text: str) -> dict:
-        # Heuristic extraction for numeric effects: points, money, lifePercent
-        import re
 
-        if not text:
-            return {}
+_storage = None
+
+
+def get_storage():
+    """Process-wide Storage over DATA_DIR, shared by every request.
 
-        effects = {}
-
-        # points: 'gana 10 puntos', 'pierde 5 puntos', 'wins 10 points'
-        m = re.search(r"gana\s+(\d+)(?:\s+puntos|\s+points)?", text, re.IGNORECASE)
-        if m:
-            effects['points'] = int(m.group(1))
-        m = re.search(r"pierde\s+(\d+)(?:\s+puntos|\s+points)?", text, re.IGNORECASE)
-        if m:
-            effects['points'] = effects.get('points', 0) - int(m.group(1))
-        m = re.search(r"(\d+)\s+(?:puntos|points)", text, re.IGNORECASE)
-        if m and 'points' not in effects:
-            effects['points'] = int(m.group(1))
-
-        # money: 'gana 20 dinero', 'gana 20 coins', 'receives 50 money'
-        m = re.search(r"gana\s+(\d+)\s+(?:dinero|money|coins)", text, re.IGNORECASE)
-        if m:
-            effects['money'] = int(m.group(1))
-        m = re.search(r"pierde\s+(\d+)\s+(?:dinero|money|coins)", text, re.IGNORECASE)
-        if m:
-            effects['money'] = effects.get('money', 0) - int(m.group(1))
-        m = re.search(r"(\d+)\s+(?:dinero|money|coins)", text, re.IGNORECASE)
-        if m and 'money' not in effects:
-            effects['money'] = int(m.group(1))
-
-        # life percent: 'pierde 10% de vida', 'life -10%', 'life: 90%'
-        m = re.search(r"pierde\s+(\d+)%?\s+de\s+vida", text, re.IGNORECASE)
-        if m:
-            effects['lifePercent'] = -int(m.group(1))
-        m = re.search(r"life[:\s-]+(\d+)%", text, re.IGNORECASE)
-        if m:
-            # absolute life value
-            effects['lifePercent'] = int(m.group(1))
-        m = re.search(r"(\d+)%\s+vida", text, re.IGNORECASE)
-        if m and 'lifePercent' not in effects:
-            effects['lifePercent'] = int(m.group(1))
-
-        # change universe mention: 'moves to universe X', 'change_universe_to: X'
-        m = re.search(r"change_universe_to[:\s]+([A-Za-z0-9_\-]+)", text, re.IGNORECASE)
-        if m:
-            effects['change_universe_to'] = m.group(1)
-        m = re.search(r"mueve?s?\s+a\s+universo\s+([A-Za-z0-9_\-]+)", text, re.IGNORECASE)
-        if m:
-            effects['change_universe_to'] = m.group(1)
-
-        # Clean numeric types
-        # convert empty dict to {}
-        return effects
+    One instance keeps the event log's offset index and the parsed-document
+    cache warm; building a Storage per request would re-read the journal.
+    """
+    global _storage
+    if _storage is None:
+        _storage = Storage(DATA_DIR)
+    return _storage
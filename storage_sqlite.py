@@ -0,0 +1,262 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import atomic_io
+from storage import DOCUMENT_DEFAULTS, JsonBackend, copy_backend
+
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('STORAGE_SQLITE_BUSY_TIMEOUT', '10'))
+# STORAGE_DURABILITY mapped onto SQLite: in WAL mode NORMAL only syncs at checkpoints
+SYNCHRONOUS = {'strict': 'FULL', 'grouped': 'NORMAL', 'relaxed': 'OFF'}
+
+# table -> (indexed columns {column: entity field}, nested fields kept in their own JSON column)
+TABLES = {
+    'characters': ({'current_universe': 'currentUniverse'}, ('history',)),
+    'universes': ({}, ('timeline',)),
+    'evaluations': ({'character_id': 'character_id', 'kind': 'kind'}, ()),
+    'market': ({}, ('effects',)),
+    'missions': ({}, ()),
+}
+EVENT_COLUMNS = {'universe_id': 'universe_id', 'character_id': 'character_id', 'timestamp': 'timestamp'}
+EVENT_JSON = ('result', 'choices')
+# documents row committed together with the initial import
+SEED_MARKER = '__seeded__'
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _scalar(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return _dumps(value)
+
+
+def _encode(entity, index_cols, json_cols):
+    body = dict(entity)
+    row = {col: _scalar(entity.get(field)) for col, field in index_cols.items()}
+    for c in json_cols:
+        row[c] = _dumps(body.pop(c)) if c in body else None
+    row['id'] = _scalar(entity.get('id'))
+    row['body'] = _dumps(body)
+    return row
+
+
+def _decode(row, json_cols):
+    entity = json.loads(row['body'])
+    for c in json_cols:
+        if row[c] is not None:
+            entity[c] = json.loads(row[c])
+    return entity
+
+
+class _SqliteTransaction:
+    def __init__(self, backend, conn):
+        self.backend = backend
+        self.conn = conn
+
+    def get(self, name, eid):
+        # same thread-local connection, so this reads inside the open transaction
+        return self.backend.get(name, eid)
+
+    def put(self, name, entity):
+        self.backend._put(self.conn, name, entity)
+
+    def update_event(self, eid, event):
+        self.backend._update_event(self.conn, eid, event)
+
+
+class SqliteBackend:
+    """SQLite (WAL) storage: one table per collection, nested lists as JSON columns.
+
+    Each entity row keeps its list position (``pos``) so whole-document loads
+    return the same order as the JSON files; lookups by id and by indexed
+    columns are plain indexed queries. Writers only lock the database for the
+    duration of their own short transaction.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, data_dir, embeddings):
+        self.path = path
+        self._local = threading.local()
+        self._create_schema()
+        self._seed(data_dir, embeddings)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f"PRAGMA synchronous={SYNCHRONOUS.get(atomic_io.DURABILITY, 'NORMAL')}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._conn()
+        if conn.in_transaction:
+            # nested in an open write: the outer one commits or rolls back everything
+            yield conn
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _create_schema(self):
+        with self._write() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS documents (name TEXT PRIMARY KEY, body TEXT NOT NULL)')
+            for table, (index_cols, json_cols) in TABLES.items():
+                cols = ['pos INTEGER PRIMARY KEY', 'id TEXT']
+                cols += [f'{c} TEXT' for c in index_cols]
+                cols += ['body TEXT NOT NULL'] + [f'{c} TEXT' for c in json_cols]
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({", ".join(cols)})')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_id ON {table}(id)')
+                for c in index_cols:
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_{c} ON {table}({c})')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE, '
+                'universe_id TEXT, character_id TEXT, timestamp TEXT, body TEXT NOT NULL, result TEXT, choices TEXT)')
+            conn.execute('CREATE INDEX IF NOT EXISTS events_universe_id ON events(universe_id)')
+
+    def _seed(self, data_dir, embeddings):
+        """Import data_dir (or the defaults) once, in the same transaction as SEED_MARKER.
+
+        Workers starting together wait on BEGIN IMMEDIATE and then see the
+        marker; a crash mid-import rolls back and the next start seeds again.
+        """
+        with self._write() as conn:
+            if conn.execute('SELECT 1 FROM documents WHERE name = ?', (SEED_MARKER,)).fetchone():
+                return
+            # a database seeded before the marker existed keeps its data
+            if conn.execute('SELECT 1 FROM documents LIMIT 1').fetchone() is None:
+                if os.path.exists(os.path.join(data_dir, 'characters.json')):
+                    n = copy_backend(JsonBackend(data_dir, embeddings), self)
+                    print(f"[STORAGE] Imported {data_dir} into {self.path} ({n} events)")
+                else:
+                    for name, default in DOCUMENT_DEFAULTS.items():
+                        self.save(name, default)
+            conn.execute('INSERT INTO documents (name, body) VALUES (?, ?)', (SEED_MARKER, 'true'))
+
+    # documents -------------------------------------------------------------
+
+    def load(self, name):
+        conn = self._conn()
+        if name not in TABLES:
+            row = conn.execute('SELECT body FROM documents WHERE name = ?', (name,)).fetchone()
+            return json.loads(row['body']) if row else DOCUMENT_DEFAULTS.get(name)
+        json_cols = TABLES[name][1]
+        return [_decode(r, json_cols) for r in conn.execute(f'SELECT * FROM {name} ORDER BY pos')]
+
+    def save(self, name, data):
+        with self._write() as conn:
+            if name not in TABLES:
+                conn.execute('INSERT OR REPLACE INTO documents (name, body) VALUES (?, ?)', (name, _dumps(data)))
+                return
+            conn.execute(f'DELETE FROM {name}')
+            for pos, entity in enumerate(data or []):
+                self._insert(conn, name, pos, entity)
+
+    def _insert(self, conn, name, pos, entity):
+        index_cols, json_cols = TABLES[name]
+        row = _encode(entity, index_cols, json_cols)
+        row['pos'] = pos
+        cols = list(row)
+        conn.execute(f'INSERT INTO {name} ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})',
+                     [row[c] for c in cols])
+
+    def get(self, name, eid):
+        row = self._conn().execute(f'SELECT * FROM {name} WHERE id = ? ORDER BY pos LIMIT 1', (eid,)).fetchone()
+        return _decode(row, TABLES[name][1]) if row else None
+
+    def put(self, name, entity):
+        with self._write() as conn:
+            self._put(conn, name, entity)
+
+    def _put(self, conn, name, entity):
+        row = conn.execute(f'SELECT pos FROM {name} WHERE id = ? ORDER BY pos LIMIT 1',
+                           (entity.get('id'),)).fetchone()
+        if row is not None:
+            conn.execute(f'DELETE FROM {name} WHERE pos = ?', (row['pos'],))
+            pos = row['pos']
+        else:
+            pos = conn.execute(f'SELECT COALESCE(MAX(pos), -1) + 1 FROM {name}').fetchone()[0]
+        self._insert(conn, name, pos, entity)
+
+    def _column(self, name, field):
+        for col, f in TABLES[name][0].items():
+            if f == field:
+                return col
+        return None
+
+    def find(self, name, field, value):
+        col = self._column(name, field)
+        if col is None:
+            return [e for e in self.load(name) if isinstance(e, dict) and e.get(field) == value]
+        rows = self._conn().execute(f'SELECT * FROM {name} WHERE {col} = ? ORDER BY pos', (value,))
+        return [_decode(r, TABLES[name][1]) for r in rows]
+
+    def count(self, name, field, value):
+        col = self._column(name, field)
+        if col is None:
+            return len(self.find(name, field, value))
+        return self._conn().execute(f'SELECT COUNT(*) FROM {name} WHERE {col} = ?', (value,)).fetchone()[0]
+
+    # events ----------------------------------------------------------------
+
+    def _event_row(self, event):
+        return _encode(event, EVENT_COLUMNS, EVENT_JSON)
+
+    def load_events(self):
+        rows = self._conn().execute('SELECT * FROM events ORDER BY seq')
+        return [_decode(r, EVENT_JSON) for r in rows]
+
+    def get_event(self, eid):
+        row = self._conn().execute('SELECT * FROM events WHERE id = ?', (eid,)).fetchone()
+        return _decode(row, EVENT_JSON) if row else None
+
+    def append_event(self, event):
+        row = self._event_row(event)
+        cols = list(row)
+        with self._write() as conn:
+            conn.execute(f'INSERT INTO events ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})',
+                         [row[c] for c in cols])
+
+    def update_event(self, eid, event):
+        with self._write() as conn:
+            return self._update_event(conn, eid, event)
+
+    def _update_event(self, conn, eid, event):
+        row = self._event_row(event)
+        row.pop('id')
+        cur = conn.execute(f'UPDATE events SET {", ".join(c + " = ?" for c in row)} WHERE id = ?',
+                           [*row.values(), eid])
+        return cur.rowcount > 0
+
+    @contextmanager
+    def transaction(self, names):
+        """Unit of work: one BEGIN IMMEDIATE ... COMMIT around every read and write."""
+        with self._write() as conn:
+            yield _SqliteTransaction(self, conn)
+
+    def replace_events(self, events):
+        with self._write() as conn:
+            conn.execute('DELETE FROM events')
+            for e in events:
+                row = self._event_row(e)
+                cols = list(row)
+                conn.execute(f'INSERT OR REPLACE INTO events ({", ".join(cols)}) '
+                             f'VALUES ({", ".join("?" * len(cols))})', [row[c] for c in cols])
+
+    def stats(self):
+        return {'backend': self.name, 'path': self.path, 'durability': atomic_io.DURABILITY}
@@ -0,0 +1,69 @@
+import json
+import time
+
+from flask import Response, stream_with_context
+
+from llm_client import offline_reply
+from reply_parser import StreamingReplyParser
+
+
+def sse(event, data):
+    """One server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events):
+    # X-Accel-Buffering: a reverse proxy (nginx) must not hold the events back
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def relay_reply(chunks, label, started=None):
+    """Forward a streamed /api/chat reply as SSE 'narrative' and 'field' events.
+
+    Generator over SSE strings; ``yield from`` it to get ``(reply_text, tokens,
+    generated)`` back once the model is done; ``generated`` is False for an
+    empty reply or an offline stand-in (see llm_client.offline_reply). Time to first token and to first narrative
+    text (from ``started``, default now) are logged per call.
+    """
+    started = started or time.perf_counter()
+    parser = StreamingReplyParser()
+    thinking = []
+    tokens = 0
+    cached = False
+    offline = False
+    first_token = first_narrative = None
+    try:
+        for chunk in chunks:
+            msg = chunk.get('message') or {}
+            offline = offline or offline_reply(chunk)
+            if msg.get('thinking'):
+                thinking.append(msg['thinking'])
+            text = msg.get('content') or ''
+            if chunk.get('done'):
+                cached = bool(chunk.get('cached'))
+                tokens = chunk.get('eval_count', tokens)
+            if not text:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            for ev in parser.feed(text):
+                if ev[0] == 'narrative':
+                    if first_narrative is None:
+                        first_narrative = time.perf_counter() - started
+                    yield sse('narrative', {'text': ev[1]})
+                else:
+                    yield sse('field', {'key': ev[1], 'value': ev[2]})
+    except Exception as e:
+        print(f"[STREAM] {label}: stream interrupted: {e}")
+    total = time.perf_counter() - started
+
+    def ms(v):
+        return f"{v * 1000:.0f} ms" if v is not None else '-'
+
+    print(f"[STREAM] {label}: TTFT {ms(first_token)}, first narrative {ms(first_narrative)}, "
+          f"total {ms(total)}, {tokens} tokens")
+    # like the non-streaming path, fall back to the model's thinking when there is no content
+    reply = parser.raw or ''.join(thinking)
+    # a replayed cache entry costs no tokens
+    return reply, 0 if cached else (tokens or len(reply.split())), bool(reply) and not offline
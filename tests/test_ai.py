@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from ai import AI
+
+
+def test_concurrent_searches_index_each_event_once():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((3000, 64)).astype(np.float32)
+    events = [{'id': f'e{i}', 'universe_id': 'u1', 'embedding_row': i} for i in range(len(vectors))]
+    ai = AI()
+    errors = []
+    start = threading.Barrier(8)
+
+    def search():
+        start.wait()
+        try:
+            # every thread sees the timeline growing, as request and job threads do
+            for n in range(50, len(events) + 1, 50):
+                hits = ai.search_similar(vectors[n - 1], events[:n], top_k=3, vectors=vectors)
+                assert hits and hits[0]['id'] == f'e{n - 1}'
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=search) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(ai._index) == len(events)
+
+
+def test_narrative_key_follows_character_and_story_not_exact_stats():
+    ai = AI()
+    ana = {'id': 'c1', 'name': 'Ana', 'currentUniverse': 'u1', 'points': 40, 'money': 10, 'lifePercent': 1.0}
+
+    def key(character, story, system_prompt='Points: 40'):
+        return ai._narrative_key(system_prompt, 'Ataco al villano', {}, character, story)
+
+    base = key(ana, ['e1', 'e2'])
+    # a few points more is the same state bucket and the same story
+    assert key({**ana, 'points': 45}, ['e1', 'e2'], 'Points: 45') == base
+    assert key(ana, ['e1', 'e2', 'e3']) != base
+    assert key({**ana, 'id': 'c2', 'name': 'Bo'}, ['e1', 'e2']) != base
+    assert key({**ana, 'points': 400}, ['e1', 'e2']) != base
+
+
+def test_system_prompt_reports_answered_story_events():
+    ai = AI()
+    events = [{'id': 'e1', 'prompt': 'abro la puerta', 'timestamp': '1', 'result': {'narrative': 'Se abre.'}},
+              {'id': 'e2', 'prompt': 'ataco al villano', 'timestamp': '2', 'result': None}]
+    prompt, story = ai.build_system_prompt({'name': 'U'}, None, events, with_story=True)
+    assert 'Se abre.' in prompt and 'ataco al villano' in prompt
+    assert story == ['e1']
@@ -0,0 +1,19 @@
+import os
+import sys
+import json
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from effects_parser import parse_effects
+
+with open(os.path.join(ROOT, 'scripts', 'effects_golden.json'), encoding='utf-8') as f:
+    GOLDEN = json.load(f)
+
+
+@pytest.mark.parametrize('case', GOLDEN, ids=range(len(GOLDEN)))
+def test_golden_corpus(case):
+    # scripts/check_effects_parser.py --update regenerates the expectations
+    assert parse_effects(case['text']) == case['effects']
@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from event_log import EventLog
+
+
+def test_concurrent_readers_keep_the_index_exact(tmp_path):
+    log = EventLog(str(tmp_path / 'events.jsonl'))
+    done = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            while not done.is_set():
+                n = len(log)
+                if n:
+                    assert log.get(f'e{n - 1}') is not None
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for t in readers:
+        t.start()
+    for i in range(3000):
+        log.append({'id': f'e{i}', 'prompt': 'abro la puerta'})
+    done.set()
+    for t in readers:
+        t.join()
+    assert not errors
+    # one record per line: no spurious dead records to trigger a compaction
+    assert log._records == len(log) == 3000
+    with open(log.path, 'rb') as f:
+        assert sum(1 for _ in f) == 3000
+
+
+def test_get_follows_a_compaction_by_another_process(tmp_path):
+    path = str(tmp_path / 'events.jsonl')
+    mine, other = EventLog(path), EventLog(path)
+    for i in range(50):
+        mine.append({'id': f'e{i}', 'n': 0})
+    for i in range(50):
+        mine.update(f'e{i}', {'id': f'e{i}', 'n': 1})
+    assert mine.get('e49') == {'id': 'e49', 'n': 1}
+    other.compact()
+    assert mine.get('e49') == {'id': 'e49', 'n': 1}
+    assert [e['n'] for e in mine.load()] == [1] * 50
+
+
+def test_append_update_and_reopen(tmp_path):
+    path = str(tmp_path / 'events.jsonl')
+    log = EventLog(path)
+    log.append({'id': 'e1', 'result': None})
+    log.append({'id': 'e2', 'result': None})
+    assert log.update('e1', {'id': 'e1', 'result': {'narrative': 'ok'}})
+    assert not log.update('missing', {'id': 'missing'})
+    assert log.get('e1') == {'id': 'e1', 'result': {'narrative': 'ok'}}
+    assert log.get('missing') is None
+    # an update keeps the event's place in the timeline
+    assert [e['id'] for e in log.load()] == ['e1', 'e2']
+    reopened = EventLog(path)
+    assert len(reopened) == 2 and 'e2' in reopened
+    assert reopened.load() == log.load()
+
+
+def test_compaction_keeps_the_latest_records(tmp_path):
+    log = EventLog(str(tmp_path / 'events.jsonl'), compact_min=10, compact_ratio=1.0)
+    for i in range(5):
+        log.append({'id': f'e{i}', 'n': 0})
+    for n in range(1, 4):
+        for i in range(5):
+            log.update(f'e{i}', {'id': f'e{i}', 'n': n})
+    # superseded records outnumbered live ones: the journal was rewritten on the way
+    with open(log.path, 'rb') as f:
+        assert sum(1 for _ in f) < 20
+    assert [(e['id'], e['n']) for e in log.load()] == [(f'e{i}', 3) for i in range(5)]
+
+    log.compact(transform=lambda e: {**e, 'compacted': True})
+    with open(log.path, 'rb') as f:
+        assert sum(1 for _ in f) == 5
+    assert all(e['compacted'] and e['n'] == 3 for e in log.load())
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    log = EventLog(str(tmp_path / 'events.jsonl'))
+    log.append({'id': 'e1'})
+    with open(log.path, 'ab') as f:
+        f.write(b'{"id": "e2", "cut')
+    assert [e['id'] for e in EventLog(log.path).load()] == ['e1']
+    other = EventLog(log.path)
+    other.append({'id': 'e3'})
+    assert [e['id'] for e in other.load()] == ['e1', 'e3']
@@ -0,0 +1,37 @@
+import os
+import sys
+import threading
+
+from flask import Flask
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import jobs
+from jobs import JobQueue, job_response
+
+
+def test_refused_job_calls_on_refused(monkeypatch):
+    queue = JobQueue(workers=1, max_pending=1)
+    monkeypatch.setattr(jobs, 'get_jobs', lambda: queue)
+    release = threading.Event()
+    running = threading.Event()
+
+    def slow():
+        running.set()
+        release.wait(5)
+        return {}, 200
+
+    try:
+        queue.submit('action', slow)
+        running.wait(5)
+        queue.submit('action', slow)  # waits in the queue, which is now full
+        assert queue.full()
+        refused = []
+        with Flask(__name__).test_request_context('/api/action?async=1', method='POST'):
+            _, status, headers = job_response('action', slow, on_refused=lambda: refused.append(True))
+        assert status == 503 and headers['Retry-After']
+        assert refused == [True]
+        assert queue.stats()['rejected'] == 1
+    finally:
+        release.set()
@@ -0,0 +1,101 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+import llm_client
+from llm_cache import LLMCache
+from llm_client import message_text, offline_reply
+from llm_providers import OfflineProvider, OllamaProvider, ProviderRouter
+from reply_parser import REPLY_SCHEMA, extract_json, validate_reply
+from singleflight import SingleFlight
+from stub_ollama import serve
+
+MESSAGES = [{'role': 'user', 'content': 'Student action: abro la puerta'}]
+
+
+@pytest.fixture
+def stub():
+    server = serve(0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = LLMCache(path='')
+    monkeypatch.setattr(llm_client, 'get_cache', lambda: cache)
+    monkeypatch.setattr(llm_client, 'get_singleflight', lambda: SingleFlight(cross_process=False))
+    return cache
+
+
+def router_for(server):
+    return ProviderRouter([OllamaProvider('ollama_local', f'http://127.0.0.1:{server.server_port}', '', retries=0),
+                           OfflineProvider()], health_interval=0)
+
+
+def test_failover_to_offline_is_not_cached(stub, cache):
+    router = router_for(stub)
+    stub.RequestHandlerClass.fail_rate = 1.0
+    first = router.chat('stub', MESSAGES, cache_key='k', endpoint='message')
+    assert offline_reply(first)
+    assert not cache._entries
+
+    # once the real provider is back, the same call reaches it instead of a cached stand-in
+    stub.RequestHandlerClass.fail_rate = 0.0
+    router.check()
+    second = router.chat('stub', MESSAGES, cache_key='k', endpoint='message')
+    assert not offline_reply(second)
+    assert not second.get('cached')
+    assert router.chat('stub', MESSAGES, cache_key='k', endpoint='message').get('cached')
+
+
+def test_streamed_offline_reply_is_not_cached(stub, cache):
+    router = router_for(stub)
+    stub.RequestHandlerClass.fail_rate = 1.0
+    chunks = list(router.chat_stream('stub', MESSAGES, cache_key='k', endpoint='message'))
+    assert chunks[-1]['done'] and offline_reply(chunks[-1])
+    assert not cache._entries
+
+
+def test_rejected_format_turns_structured_output_off(cache):
+    server = serve(0, format_support=False)
+    try:
+        router = router_for(server)
+        router.structured = True
+        data, structured = router.chat_json('stub', MESSAGES, REPLY_SCHEMA, endpoint='message')
+        # answered by the real model without the schema, not by the offline stub with it
+        assert not structured and not offline_reply(data)
+        assert router.format_supported is False
+        server.RequestHandlerClass.calls = 0
+        data, structured = router.chat_json('stub', MESSAGES, REPLY_SCHEMA, endpoint='message')
+        assert not structured and not offline_reply(data)
+        assert server.RequestHandlerClass.calls == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_concurrent_calls_share_one_request_without_cache(stub, monkeypatch):
+    monkeypatch.setattr(llm_client, 'get_cache', lambda: None)
+    flight = SingleFlight(cross_process=False)
+    monkeypatch.setattr(llm_client, 'get_singleflight', lambda: flight)
+    stub.RequestHandlerClass.latency = 0.2
+    client = llm_client.LLMClient(f'http://127.0.0.1:{stub.server_port}', '', retries=0)
+    with ThreadPoolExecutor(4) as pool:
+        replies = list(pool.map(lambda _: client.chat('stub', MESSAGES, cache_key='k'), range(4)))
+    assert stub.RequestHandlerClass.calls == 1
+    assert sum(bool(r.get('cached')) for r in replies) == 3
+
+
+def test_offline_reply_has_no_effects():
+    data = OfflineProvider().post('/api/chat', {'messages': MESSAGES}, endpoint='narrative')
+    reply, _ = extract_json(message_text(data))
+    assert not validate_reply(reply)
+    assert reply['effects'] == {} and reply['choices']
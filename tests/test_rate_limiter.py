@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from rate_limiter import MemoryRateLimiter, SqliteRateLimiter
+
+
+def limiter(kind, tmp_path, **limits):
+    limits = {'rpm': 0, 'tpm': 0, 'player_rpm': 0, 'player_tpm': 0, 'max_wait': 0, **limits}
+    if kind == 'sqlite':
+        return SqliteRateLimiter(str(tmp_path / 'rate_limits.db'), **limits)
+    return MemoryRateLimiter(**limits)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def kind(request):
+    return request.param
+
+
+def test_player_bucket_holds_one_minute(kind, tmp_path):
+    rl = limiter(kind, tmp_path, player_rpm=3)
+    assert [rl.acquire('ana') for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = rl.acquire('ana')
+    # refills continuously: one request every 60 / 3 seconds
+    assert 0 < wait <= 20
+    assert rl.acquire('bo') == 0.0
+    assert rl.stats()['rejected'] == 1
+
+
+def test_global_bucket_applies_to_every_player(kind, tmp_path):
+    rl = limiter(kind, tmp_path, rpm=2)
+    assert rl.acquire('ana') == 0.0 and rl.acquire('bo') == 0.0
+    assert rl.acquire('carla') > 0
+
+
+def test_charged_tokens_put_the_bucket_in_debt(kind, tmp_path):
+    rl = limiter(kind, tmp_path, player_tpm=600)
+    assert rl.acquire('ana', requests=0, tokens=100) == 0.0
+    rl.charge('ana', 900)
+    # 600 tokens/min refill 10 per second
+    assert rl.acquire('ana', requests=0, tokens=100) > 10
+
+
+def test_disabled_limits_never_wait(kind, tmp_path):
+    rl = limiter(kind, tmp_path)
+    assert all(rl.acquire('ana', tokens=10_000) == 0.0 for _ in range(50))
+
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    first = limiter('sqlite', tmp_path, player_rpm=2)
+    second = limiter('sqlite', tmp_path, player_rpm=2)
+    assert first.acquire('ana') == 0.0 and second.acquire('ana') == 0.0
+    assert first.acquire('ana') > 0
@@ -0,0 +1,57 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from reply_parser import StreamingReplyParser, extract_json, validate_reply
+
+REPLY = ('```json\n{"narrative": "Abres la puerta {y} ves \\u00e9l", '
+         '"effects": {"points": 10}, "choices": ["Entrar", "Huir"]}\n```')
+
+
+def feed_in_chunks(text, size):
+    parser = StreamingReplyParser()
+    events = []
+    for i in range(0, len(text), size):
+        events += parser.feed(text[i:i + size])
+    return parser, events
+
+
+def test_extract_json_skips_prose_and_fences():
+    obj, repaired = extract_json('Claro, aquí va:\n' + REPLY + '\nSuerte.')
+    assert obj == {'narrative': 'Abres la puerta {y} ves él', 'effects': {'points': 10}, 'choices': ['Entrar', 'Huir']}
+    assert not repaired and not validate_reply(obj)
+
+
+def test_extract_json_merges_a_second_object():
+    obj, repaired = extract_json('{"narrative": "a"} y luego {"effects": {"money": 3}}')
+    assert obj == {'narrative': 'a', 'effects': {'money': 3}} and not repaired
+
+
+def test_extract_json_closes_a_truncated_reply():
+    obj, repaired = extract_json('{"effects": {"points": 5}, "narrative": "Corres hacia la sal')
+    assert repaired
+    assert obj == {'effects': {'points': 5}, 'narrative': 'Corres hacia la sal'}
+
+
+def test_extract_json_without_an_object():
+    assert extract_json('sin llaves {NUMBERS} nada') == (None, False)
+    assert extract_json('') == (None, False)
+
+
+def test_streaming_parser_matches_the_full_parse_for_any_chunking():
+    expected, _ = extract_json(REPLY)
+    for size in (1, 3, 7, len(REPLY)):
+        parser, events = feed_in_chunks(REPLY, size)
+        narrative = ''.join(e[1] for e in events if e[0] == 'narrative')
+        fields = {e[1]: e[2] for e in events if e[0] == 'field'}
+        assert narrative == parser.narrative == expected['narrative']
+        assert fields == {'effects': expected['effects'], 'choices': expected['choices']}
+        assert parser.done
+
+
+def test_streaming_parser_passes_plain_text_through():
+    parser, events = feed_in_chunks('El dragón despierta. Huyes.', 4)
+    assert ''.join(e[1] for e in events) == 'El dragón despierta. Huyes.'
+    assert all(e[0] == 'narrative' for e in events)
@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import multiprocessing as mp
+
+import numpy as np
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from embedder import embed_text, embedder_name
+from embedding_store import EmbeddingStore
+from history_store import HistoryStore
+from storage import Storage
+
+
+def entry(points):
+    return {'event_id': None, 'class_number': 1, 'effects': {'points': points}}
+
+
+def test_fork_starts_its_own_timeline(tmp_path):
+    storage = Storage(str(tmp_path))
+    storage.history = HistoryStore(os.path.join(str(tmp_path), 'history'), hot_tail=2, segment_size=3)
+    universe = {'id': 'u1', 'name': 'Origen', 'timeline': []}
+    for _ in range(6):
+        storage.history.append('universes', universe, 'timeline', entry(10))
+    storage.save_universe(universe)
+    parent = storage.history.stats(universe, 'timeline')
+    assert parent['count'] == 6 and parent['segments']
+
+    fork = storage.fork_universe('u1')
+    assert storage.history.count(fork, 'timeline') == 0
+    storage.history.append('universes', fork, 'timeline', entry(5))
+    storage.save_universe(fork)
+
+    stats = storage.history.stats(storage.get_universe(fork['id']), 'timeline')
+    assert stats['count'] == 1 and stats['segments'] == []
+    assert stats['by_class']['1']['points'] == 5
+    assert storage.load_universe_timeline(fork) == [entry(5)]
+    # the parent's aggregates are untouched by the fork's appends
+    stored = storage.history.stats(storage.get_universe('u1'), 'timeline')
+    assert stored['count'] == 6 and stored['by_class']['1']['points'] == 60
+
+
+def _open_storage(data_dir, barrier):
+    barrier.wait()
+    Storage(data_dir)
+
+
+def test_workers_migrate_legacy_events_once(tmp_path):
+    events = [{'id': f'e{i}', 'prompt': f'accion {i}', 'embedding': [float(i + 1)] * 8} for i in range(200)]
+    with open(tmp_path / 'events.json', 'w', encoding='utf-8') as f:
+        json.dump(events, f)
+    ctx = mp.get_context('fork')
+    barrier = ctx.Barrier(4)
+    workers = [ctx.Process(target=_open_storage, args=(str(tmp_path), barrier)) for _ in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    assert all(p.exitcode == 0 for p in workers)
+
+    storage = Storage(str(tmp_path))
+    assert [e['id'] for e in storage.load_events()] == [e['id'] for e in events]
+    rows = sorted(e['embedding_row'] for e in storage.load_events())
+    assert rows == list(range(len(events))) and len(storage.embeddings) == len(events)
+
+
+def test_legacy_vectors_are_reembedded_from_the_prompt(tmp_path):
+    events = [{'id': f'e{i}', 'prompt': f'ataco al villano {i}', 'embedding': [0.5] * 384} for i in range(5)]
+    with open(tmp_path / 'events.json', 'w', encoding='utf-8') as f:
+        json.dump(events, f)
+    storage = Storage(str(tmp_path))
+    assert storage.embeddings.embedder == embedder_name()
+    for e in storage.load_events():
+        assert np.allclose(storage.embeddings.get(e['embedding_row']), embed_text(e['prompt']))
+
+
+def test_sidecar_from_another_embedder_is_reembedded(tmp_path):
+    storage = Storage(str(tmp_path))
+    event = storage.create_event({'student': 's', 'universe_id': 'u1', 'character_id': 'c1',
+                                  'prompt': 'abro la puerta', 'class_number': 1})
+    event['embedding_row'] = storage.add_embedding(embed_text(event['prompt']))
+    storage.append_event(event)
+    with open(storage.embeddings.meta_path, 'w', encoding='utf-8') as f:
+        json.dump({'dim': 384, 'dtype': 'float32', 'embedder': 'other-model'}, f)
+
+    stale = EmbeddingStore(storage.embeddings_path)
+    with pytest.raises(ValueError):
+        stale.append(embed_text('otra accion'))
+
+    storage = Storage(str(tmp_path))
+    assert storage.embeddings.embedder == embedder_name()
+    assert np.allclose(storage.embeddings.get(event['embedding_row']), embed_text('abro la puerta'))
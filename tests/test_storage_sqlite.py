@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import multiprocessing as mp
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import storage_sqlite
+from embedding_store import EmbeddingStore
+from storage_sqlite import SqliteBackend
+
+
+def seed_dir(tmp_path, events=300):
+    data = tmp_path / 'data'
+    data.mkdir()
+    with open(data / 'characters.json', 'w', encoding='utf-8') as f:
+        json.dump([{'id': 'c1', 'name': 'Ana', 'currentUniverse': 'u1', 'history': []}], f)
+    with open(data / 'events.json', 'w', encoding='utf-8') as f:
+        json.dump([{'id': f'e{i}', 'universe_id': 'u1', 'prompt': f'accion {i}'} for i in range(events)], f)
+    return str(data)
+
+
+def backend(data_dir):
+    return SqliteBackend(os.path.join(data_dir, 'game.db'), data_dir,
+                         EmbeddingStore(os.path.join(data_dir, 'event_embeddings.bin')))
+
+
+def _open_backend(data_dir, barrier):
+    barrier.wait()
+    assert len(backend(data_dir).load_events()) == 300
+
+
+def test_workers_starting_together_seed_once(tmp_path):
+    data_dir = seed_dir(tmp_path)
+    ctx = mp.get_context('fork')
+    barrier = ctx.Barrier(4)
+    workers = [ctx.Process(target=_open_backend, args=(data_dir, barrier)) for _ in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    assert all(p.exitcode == 0 for p in workers)
+    assert [c['id'] for c in backend(data_dir).load('characters')] == ['c1']
+
+
+def test_interrupted_seed_is_redone(tmp_path, monkeypatch):
+    data_dir = seed_dir(tmp_path)
+    copy = storage_sqlite.copy_backend
+
+    def crash(src, dst):
+        dst.save('characters', src.load('characters'))
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(storage_sqlite, 'copy_backend', crash)
+    with pytest.raises(KeyboardInterrupt):
+        backend(data_dir)
+    monkeypatch.setattr(storage_sqlite, 'copy_backend', copy)
+    db = backend(data_dir)
+    assert len(db.load_events()) == 300
+    assert [c['id'] for c in db.load('characters')] == ['c1']
@@ -0,0 +1,59 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# distinct texts whose token count is remembered
+TOKEN_COUNT_CACHE_SIZE = int(os.environ.get('TOKEN_COUNT_CACHE_SIZE', '4096'))
+# after a failed load (offline, no BPE files cached) try tiktoken again after this long (s)
+ENCODER_RETRY_S = 300.0
+
+_enc = None
+_enc_retry_at = 0.0
+_enc_lock = threading.Lock()
+_counts = OrderedDict()  # text digest -> tokens, least recently used first
+_counts_lock = threading.Lock()
+
+
+def encoder():
+    """The tiktoken encoder, loaded on first use; None while it cannot be loaded."""
+    global _enc, _enc_retry_at
+    if _enc is None and time.monotonic() >= _enc_retry_at:
+        with _enc_lock:
+            if _enc is None and time.monotonic() >= _enc_retry_at:
+                try:
+                    import tiktoken
+                    try:
+                        _enc = tiktoken.encoding_for_model("gpt-3.5-turbo")
+                    except Exception:
+                        _enc = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    # tiktoken downloads its BPE files on first use: offline this fails
+                    print(f"[TOKENS] tiktoken no disponible ({type(e).__name__}); usando estimación por caracteres")
+                    _enc_retry_at = time.monotonic() + ENCODER_RETRY_S
+    return _enc
+
+
+def approx_tokens(text):
+    """Cheap estimate without an encoder: about 4 characters per token."""
+    return (len(text) + 3) // 4
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+    with _counts_lock:
+        n = _counts.get(key)
+        if n is not None:
+            _counts.move_to_end(key)
+            return n
+    enc = encoder()
+    n = len(enc.encode(text)) if enc is not None else approx_tokens(text)
+    with _counts_lock:
+        _counts[key] = n
+        while len(_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _counts.popitem(last=False)
+    return n
+
@@ -0,0 +1,201 @@
+import os
+
+import numpy as np
+
+# numpy (exact, default) | faiss (IndexFlatIP) | hnsw (hnswlib, approximate)
+VECTOR_INDEX_BACKEND = os.environ.get('VECTOR_INDEX_BACKEND', 'numpy')
+_INITIAL_CAPACITY = 1024
+
+
+def _normalize(mat):
+    mat = np.asarray(mat, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat.reshape(1, -1)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+class NumpyBackend:
+    """Exact inner-product search over a growable matrix of unit vectors."""
+
+    name = 'numpy'
+
+    def __init__(self, dim):
+        self.dim = dim
+        self._mat = np.empty((_INITIAL_CAPACITY, dim), dtype=np.float32)
+        self.n = 0
+
+    def add(self, vectors):
+        need = self.n + len(vectors)
+        if need > len(self._mat):
+            cap = max(need, len(self._mat) * 2)
+            grown = np.empty((cap, self.dim), dtype=np.float32)
+            grown[:self.n] = self._mat[:self.n]
+            self._mat = grown
+        self._mat[self.n:need] = vectors
+        self.n = need
+
+    def search(self, query, k, mask=None):
+        scores = self._mat[:self.n] @ query
+        if mask is not None:
+            scores = np.where(mask[:self.n], scores, -np.inf)
+        k = min(k, self.n)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        keep = np.isfinite(scores[top])
+        return top[keep], scores[top][keep]
+
+
+class FaissBackend:
+    """faiss IndexFlatIP; group filtering over-fetches and filters afterwards."""
+
+    name = 'faiss'
+
+    def __init__(self, dim):
+        import faiss
+        self.dim = dim
+        self._index = faiss.IndexFlatIP(dim)
+        self.n = 0
+
+    def add(self, vectors):
+        self._index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+        self.n += len(vectors)
+
+    def search(self, query, k, mask=None):
+        return _filtered_knn(self._knn, self.n, query, k, mask)
+
+    def _knn(self, query, k):
+        scores, ids = self._index.search(query.reshape(1, -1), k)
+        return ids[0], scores[0]
+
+
+class HnswBackend:
+    """hnswlib graph (approximate); grows its capacity as vectors are added."""
+
+    name = 'hnsw'
+
+    def __init__(self, dim, ef=64, m=16):
+        import hnswlib
+        self.dim = dim
+        self._index = hnswlib.Index(space='ip', dim=dim)
+        self._index.init_index(max_elements=_INITIAL_CAPACITY, ef_construction=200, M=m)
+        self._index.set_ef(ef)
+        self.n = 0
+
+    def add(self, vectors):
+        need = self.n + len(vectors)
+        cap = self._index.get_max_elements()
+        if need > cap:
+            self._index.resize_index(max(need, cap * 2))
+        self._index.add_items(vectors, np.arange(self.n, need))
+        self.n = need
+
+    def search(self, query, k, mask=None):
+        return _filtered_knn(self._knn, self.n, query, k, mask)
+
+    def _knn(self, query, k):
+        ids, dists = self._index.knn_query(query.reshape(1, -1), k=k)
+        # hnswlib's 'ip' space returns 1 - dot
+        return ids[0].astype(np.int64), 1.0 - dists[0]
+
+
+def _filtered_knn(knn, n, query, k, mask):
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if mask is None:
+        ids, scores = knn(query, min(k, n))
+        keep = ids >= 0
+        return ids[keep], scores[keep]
+    members = int(mask[:n].sum())
+    if members == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    fetch = min(n, max(k * 8, 32))
+    while True:
+        ids, scores = knn(query, fetch)
+        keep = (ids >= 0)
+        keep[keep] = mask[ids[keep]]
+        if keep.sum() >= min(k, members) or fetch >= n:
+            return ids[keep][:k], scores[keep][:k]
+        fetch = min(n, fetch * 4)
+
+
+_BACKENDS = {'numpy': NumpyBackend, 'faiss': FaissBackend, 'hnsw': HnswBackend}
+
+
+def make_backend(name, dim):
+    cls = _BACKENDS.get(name, NumpyBackend)
+    try:
+        return cls(dim)
+    except ImportError as e:
+        print(f"[VECTOR_INDEX] Backend '{name}' unavailable ({e}); using numpy")
+        return NumpyBackend(dim)
+
+
+class VectorIndex:
+    """Cosine top-k index over normalized embeddings.
+
+    Vectors are added incrementally (no rebuild) under an arbitrary key and an
+    optional group (the universe id). Each group keeps a precomputed boolean
+    row mask so filtered searches never scan Python objects.
+    """
+
+    def __init__(self, dim=None, backend=None):
+        self.dim = dim
+        self.backend_name = backend or VECTOR_INDEX_BACKEND
+        self._backend = None
+        self.keys = []
+        self._group_masks = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _ensure_backend(self, dim):
+        if self._backend is None:
+            self.dim = self.dim or dim
+            self._backend = make_backend(self.backend_name, self.dim)
+
+    def add(self, key, vector, group=None):
+        self.add_many([key], [vector], [group])
+
+    def add_many(self, keys, vectors, groups=None):
+        vectors = _normalize(vectors)
+        if not len(keys):
+            return
+        self._ensure_backend(vectors.shape[1])
+        start = len(self.keys)
+        self._backend.add(vectors)
+        self.keys.extend(keys)
+        groups = groups if groups is not None else [None] * len(keys)
+        end = len(self.keys)
+        for name in set(groups) | set(self._group_masks):
+            mask = self._group_masks.get(name)
+            if mask is None:
+                mask = np.zeros(max(end, _INITIAL_CAPACITY), dtype=bool)
+            elif len(mask) < end:
+                grown = np.zeros(max(end, len(mask) * 2), dtype=bool)
+                grown[:len(mask)] = mask
+                mask = grown
+            self._group_masks[name] = mask
+        for i, g in enumerate(groups):
+            self._group_masks[g][start + i] = True
+
+    def search(self, query, top_k=5, group=None):
+        """Return [(key, score)] for the top_k most similar vectors.
+
+        With ``group`` set, only vectors added under that group are considered.
+        """
+        if self._backend is None or not self.keys:
+            return []
+        mask = None
+        if group is not None:
+            mask = self._group_masks.get(group)
+            if mask is None:
+                return []
+        q = _normalize(query)[0]
+        if q.shape[0] != self.dim:
+            return []
+        rows, scores = self._backend.search(q, top_k, mask)
+        return [(self.keys[int(r)], float(s)) for r, s in zip(rows, scores)]